@@ -0,0 +1,554 @@
+"""
+Offline airport reference store: codes, names, city, country, coordinates and timezone.
+
+Records are seeded from Amadeus direct-destination responses and FlightRadar24 airport payloads
+as they are fetched, and kept in one memory-mapped file:
+
+    magic | record count | key count | record offsets | key offsets | records | keys
+
+Records are tab-separated UTF-8 fields. Keys (codes, names, cities and their words, normalized)
+are sorted, each pointing at a record, so prefix lookups are a binary search over the mapped file
+and opening the store does not parse anything.
+
+New and changed airports are appended to a log next to the file (<path>.log, one JSON record per
+line) and kept in memory; they are merged into the mapped file once COMPACT_AFTER of them are
+pending, or by compact(). The log is replayed when the store is opened.
+
+Usage:
+    python airports.py seed            # seed from the tests/ fixtures and the on-disk response cache
+    python airports.py search seattle  # autocomplete from the command line
+"""
+import os
+import re
+import sys
+import json
+import mmap
+import bisect
+import struct
+import difflib
+import threading
+import unicodedata
+
+AIRPORTS_PATH = os.environ.get('FLIGHT_SEARCHER_AIRPORTS', 'airports.dat')
+COMPACT_AFTER = int(os.environ.get('FLIGHT_SEARCHER_AIRPORTS_COMPACT', 256))
+# Keys resolve() scans for a second airport; one airport has a handful of keys (codes, name, city, words)
+RESOLVE_SCAN = 32
+MAGIC = b'FSAIRPT1'
+HEADER = struct.Struct('<8sII')
+OFFSET = struct.Struct('<I')
+FIELDS = ('iata', 'icao', 'name', 'city', 'country', 'country_code', 'latitude', 'longitude', 'timezone')
+NON_ALNUM = re.compile(r'[^A-Z0-9]+')
+
+
+def normalize(text: str) -> str:
+    """
+    Uppercase text, strip accents and collapse punctuation and whitespace to single spaces.
+    """
+    text = text or ''
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(char for char in text if not unicodedata.combining(char))
+    return NON_ALNUM.sub(' ', text.upper()).strip()
+
+
+def record_keys(record: dict) -> set:
+    """
+    Return the search keys of a record: its codes, full name and city, and every word of them.
+    """
+    keys = {record[code] for code in ('iata', 'icao') if record.get(code)}
+    for field in ('name', 'city'):
+        value = normalize(record.get(field))
+        if value:
+            keys.add(value)
+            keys.update(word for word in value.split(' ') if len(word) > 1)
+    return keys
+
+
+class _MappedKeys:
+    """
+    Sequence view of the sorted key section of a mapped store, for bisect.
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return self.store._key_count
+
+    def __getitem__(self, index):
+        return self.store._key(index)[0]
+
+
+def encode_record(record: dict) -> str:
+    return '\t'.join('' if record.get(field) is None else str(record[field]).replace('\t', ' ') for field in FIELDS)
+
+
+def decode_record(line: str) -> dict:
+    record = dict(zip(FIELDS, line.split('\t')))
+    for field in ('latitude', 'longitude'):
+        record[field] = float(record[field]) if record[field] else None
+    return record
+
+
+class AirportStore:
+    """
+    Memory-mapped airport reference store with prefix and fuzzy search.
+    path: File holding the store; created on the first compaction
+    compact_after: Number of pending records in the log that triggers a compaction
+    """
+    def __init__(self, path: str = AIRPORTS_PATH, compact_after: int = COMPACT_AFTER):
+        self.path = path
+        self.log_path = f"{path}.log"
+        self.compact_after = compact_after
+        self._lock = threading.RLock()
+        self._mm = None
+        self._file = None
+        self._record_count = 0
+        self._key_count = 0
+        # Records added since the last compaction, by IATA (or ICAO) code, and their sorted (key, code) pairs
+        self._delta = {}
+        self._delta_keys = []
+        self._open()
+        self._replay_log()
+
+    def _open(self):
+        self._close()
+        try:
+            self._file = open(self.path, 'rb')
+        except OSError:
+            return
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self._record_count, self._key_count = HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{self.path} is not an airport store")
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Could not open airport store {self.path}: {e}")
+            self._close()
+
+    def _close(self):
+        if self._mm is not None:
+            self._mm.close()
+        if self._file is not None:
+            self._file.close()
+        self._mm, self._file = None, None
+        self._record_count = self._key_count = 0
+
+    def _offset(self, table: int, index: int) -> int:
+        return OFFSET.unpack_from(self._mm, table + index * OFFSET.size)[0]
+
+    def _record_table(self):
+        return HEADER.size
+
+    def _key_table(self):
+        return HEADER.size + (self._record_count + 1) * OFFSET.size
+
+    def _record(self, index: int) -> dict:
+        start, end = self._offset(self._record_table(), index), self._offset(self._record_table(), index + 1)
+        record = decode_record(self._mm[start:end].decode('utf-8'))
+        # A pending update of the same airport replaces the mapped record
+        return self._delta.get(record['iata'] or record['icao'], record)
+
+    def _key(self, index: int):
+        start, end = self._offset(self._key_table(), index), self._offset(self._key_table(), index + 1)
+        key, _, record = self._mm[start:end].decode('utf-8').rpartition('\t')
+        return key, int(record)
+
+    def __len__(self):
+        with self._lock:
+            return self._record_count + sum(1 for ident in self._delta if self._mapped(ident) is None)
+
+    def records(self) -> list:
+        """
+        Return every record in the store.
+        """
+        with self._lock:
+            records = {}
+            for index in range(self._record_count):
+                record = self._record(index)
+                records[record['iata'] or record['icao']] = record
+            records.update(self._delta)
+            return list(records.values())
+
+    def get(self, code: str):
+        """
+        Return the record of an IATA or ICAO code, or None.
+        """
+        code = normalize(code)
+        if not code:
+            return None
+        with self._lock:
+            if code in self._delta:
+                return self._delta[code]
+            for _, ident in self._delta_matches(code)[0]:
+                record = self._delta[ident]
+                if code == record['icao']:
+                    return record
+            return self._mapped(code)
+
+    def _mapped(self, code: str):
+        for index in self._exact(code):
+            record = self._record(index)
+            if code in (record['iata'], record['icao']):
+                return record
+        return None
+
+    def _exact(self, key: str) -> list:
+        keys = _MappedKeys(self)
+        start = bisect.bisect_left(keys, key)
+        indices = []
+        while start < self._key_count:
+            found, record = self._key(start)
+            if found != key:
+                break
+            indices.append(record)
+            start += 1
+        return indices
+
+    def _delta_matches(self, query: str):
+        # (key, code) pairs of pending records whose key equals, or starts with, the query
+        exact, prefixed = [], []
+        index = bisect.bisect_left(self._delta_keys, (query,))
+        while index < len(self._delta_keys) and self._delta_keys[index][0].startswith(query):
+            pair = self._delta_keys[index]
+            (exact if pair[0] == query else prefixed).append(pair)
+            index += 1
+        return exact, prefixed
+
+    def search(self, text: str, limit: int = 10, fuzzy: bool = True) -> list:
+        """
+        Autocomplete an airport code, name or city. Returns up to limit records: code matches first,
+        then exact keys, then keys starting with the text; if fuzzy and nothing matched, keys close to it.
+        """
+        query = normalize(text)
+        if not query:
+            return []
+        with self._lock:
+            if not self._key_count and not self._delta:
+                return []
+            exact, prefixed = self._matches(query, limit * 4)
+            ordered = exact + prefixed
+            if not ordered and fuzzy:
+                ordered = self._fuzzy(query, limit)
+            results, seen = [], set()
+            code = self.get(query)
+            if code is not None:
+                results.append(code)
+                seen.add(code['iata'] or code['icao'])
+            for record in self._records(ordered):
+                if len(results) >= limit:
+                    break
+                ident = record['iata'] or record['icao']
+                if ident not in seen:
+                    seen.add(ident)
+                    results.append(record)
+            return results
+
+    def _matches(self, query: str, scan: int):
+        # Records whose key equals, or starts with, the query, scanning up to scan mapped keys.
+        # Mapped records are referenced by index, pending ones by code.
+        keys = _MappedKeys(self)
+        exact, prefixed = [], []
+        index = bisect.bisect_left(keys, query)
+        while index < self._key_count and len(exact) + len(prefixed) < scan:
+            key, record = self._key(index)
+            if not key.startswith(query):
+                break
+            (exact if key == query else prefixed).append(record)
+            index += 1
+        delta_exact, delta_prefixed = self._delta_matches(query)
+        return exact + [ident for _, ident in delta_exact], prefixed + [ident for _, ident in delta_prefixed]
+
+    def _records(self, matches):
+        for match in matches:
+            yield self._delta[match] if isinstance(match, str) else self._record(match)
+
+    def _fuzzy(self, query: str, limit: int) -> list:
+        # Only compare against keys sharing the first character, to keep this to a small slice of the index
+        keys = _MappedKeys(self)
+        start = bisect.bisect_left(keys, query[0])
+        end = bisect.bisect_left(keys, chr(ord(query[0]) + 1))
+        candidates = {}
+        for index in range(start, end):
+            key, record = self._key(index)
+            if abs(len(key) - len(query)) <= 2:
+                candidates.setdefault(key, []).append(record)
+        for key, ident in self._delta_matches(query[0])[1]:
+            if abs(len(key) - len(query)) <= 2:
+                candidates.setdefault(key, []).append(ident)
+        matches = difflib.get_close_matches(query, list(candidates), n=limit, cutoff=0.75)
+        return [record for key in matches for record in candidates[key]]
+
+    def resolve(self, text: str):
+        """
+        Resolve an airport code, name or city to an IATA code, or None when it is not a single airport.
+        A code resolves to its airport. Otherwise the exact keys decide, or the keys starting with the text
+        if there are none, and they must all belong to one airport: "London" matches the city of both LHR
+        and LCY, so it is left to suggest(). Fuzzy matches never resolve either: a close but different
+        code (EGLL for EGLC) is a different airport.
+        """
+        query = normalize(text)
+        if not query:
+            return None
+        with self._lock:
+            code = self.get(query)
+            if code is not None:
+                return code['iata'] or None
+            for matches in self._matches(query, RESOLVE_SCAN):
+                records = {record['iata'] or record['icao']: record for record in self._records(matches)}
+                if records:
+                    return (next(iter(records.values()))['iata'] or None) if len(records) == 1 else None
+            return None
+
+    def add(self, records, overwrite: bool = True) -> int:
+        """
+        Merge records into the store, appending the changed ones to the log.
+        overwrite: Let non-empty fields of a new record replace the stored ones; otherwise they only fill empty fields
+        Returns the number of changed records.
+        """
+        with self._lock:
+            updates = {}
+            for record in records:
+                ident = record.get('iata') or record.get('icao')
+                if not ident:
+                    continue
+                current = updates.get(ident) or self.get(ident) or dict.fromkeys(FIELDS)
+                update = dict(current, **{
+                    field: value for field, value in record.items()
+                    if field in FIELDS and value not in (None, '') and (overwrite or current.get(field) in (None, ''))
+                })
+                if _comparable(update) != _comparable(current):
+                    updates[ident] = update
+            # Most seeding calls only repeat known airports; the log is only written when one changed
+            if updates:
+                # Stored in the form the mapped file returns them
+                updates = [decode_record(encode_record(record)) for record in updates.values()]
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in updates))
+                for record in updates:
+                    self._stage(record)
+                if len(self._delta) >= self.compact_after:
+                    self.compact()
+            return len(updates)
+
+    def _stage(self, record: dict):
+        ident = record['iata'] or record['icao']
+        previous = self._delta.get(ident)
+        if previous is not None:
+            stale = set((key, ident) for key in record_keys(previous))
+            self._delta_keys = [pair for pair in self._delta_keys if pair not in stale]
+        self._delta[ident] = record
+        for key in record_keys(record):
+            bisect.insort(self._delta_keys, (key, ident))
+
+    def _replay_log(self):
+        try:
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                self._stage(decode_record(encode_record(json.loads(line))))
+            except (ValueError, TypeError, AttributeError):
+                # A line cut short by a crash while appending
+                continue
+
+    def compact(self) -> int:
+        """
+        Merge the pending records into the mapped file and truncate the log.
+        Returns the number of records merged.
+        """
+        with self._lock:
+            pending = len(self._delta)
+            if pending:
+                self._write(self.records())
+                self._delta, self._delta_keys = {}, []
+            # Replaying the log again after a crash here would only repeat records already merged
+            try:
+                os.remove(self.log_path)
+            except FileNotFoundError:
+                pass
+            return pending
+
+    def _write(self, records):
+        records.sort(key=lambda record: record['iata'] or record['icao'])
+        blobs, keys = [], []
+        for index, record in enumerate(records):
+            blobs.append(encode_record(record).encode('utf-8'))
+            keys.extend((key, index) for key in record_keys(record))
+        keys.sort()
+        key_blobs = [f"{key}\t{index}".encode('utf-8') for key, index in keys]
+
+        position = HEADER.size + (len(blobs) + 1 + len(key_blobs) + 1) * OFFSET.size
+        offsets = []
+        for blob in blobs + key_blobs:
+            offsets.append(position)
+            position += len(blob)
+        record_offsets = offsets[:len(blobs)] + [offsets[len(blobs)] if key_blobs else position]
+        key_offsets = offsets[len(blobs):] + [position]
+
+        tmp = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(blobs), len(key_blobs)))
+            f.write(b''.join(OFFSET.pack(offset) for offset in record_offsets + key_offsets))
+            f.write(b''.join(blobs + key_blobs))
+        # The mapping must be released before the file can be replaced on Windows
+        self._close()
+        os.replace(tmp, self.path)
+        self._open()
+
+    def info(self) -> dict:
+        return {'path': self.path, 'airports': len(self), 'keys': self._key_count, 'pending': len(self._delta)}
+
+
+def resolve_code(text: str) -> str:
+    """
+    Turn user input into an airport code: IATA codes and known ICAO codes pass through, names and cities
+    are resolved through the store, and anything unresolved is returned uppercased as before.
+    """
+    code = (text or '').strip().upper()
+    if re.fullmatch(r'[A-Z0-9]{3}', code):
+        return code
+    if re.fullmatch(r'[A-Z0-9]{4}', code) and airports.get(code) is not None:
+        return code
+    return airports.resolve(code) or code
+
+
+def suggest(text: str, limit: int = 5) -> list:
+    """
+    Return "IATA - Name, City, Country" labels of the airports matching text, for autocomplete hints.
+    """
+    labels = []
+    for record in airports.search(text, limit=limit):
+        place = ', '.join(part for part in (record['name'], record['city'], record['country']) if part)
+        labels.append(f"{record['iata'] or record['icao']} - {place}")
+    return labels
+
+
+def _comparable(record: dict) -> dict:
+    # Stored fields come back as text (coordinates as floats), so compare in that form
+    return {field: '' if record.get(field) is None else str(float(record[field]) if field in ('latitude', 'longitude') else record[field]) for field in FIELDS}
+
+
+def records_from_destinations(destinations) -> list:
+    """
+    Convert Amadeus direct-destination entries into store records.
+    """
+    records = []
+    for place in destinations or []:
+        if not place.get('iataCode'):
+            continue
+        address, geo = place.get('address') or {}, place.get('geoCode') or {}
+        records.append({
+            'iata': place['iataCode'].upper(),
+            'city': (place.get('name') or '').title(),
+            'country': (address.get('countryName') or '').title(),
+            'country_code': address.get('countryCode'),
+            'latitude': geo.get('latitude'),
+            'longitude': geo.get('longitude'),
+        })
+    return records
+
+
+def record_from_fr24(airport) -> dict:
+    """
+    Convert a FlightRadar24 airport object (airport details, or the origin/destination of flight details)
+    into a store record, or None when it carries no code.
+    """
+    if not airport:
+        return None
+    code = airport.get('code') or {}
+    if not code.get('iata') and not code.get('icao'):
+        return None
+    position = airport.get('position') or {}
+    country = position.get('country') or {}
+    region = position.get('region') or {}
+    return {
+        'iata': (code.get('iata') or '').upper(),
+        'icao': (code.get('icao') or '').upper(),
+        'name': airport.get('name'),
+        'city': region.get('city'),
+        'country': country.get('name'),
+        'country_code': country.get('code'),
+        'latitude': position.get('latitude'),
+        'longitude': position.get('longitude'),
+        'timezone': (airport.get('timezone') or {}).get('name'),
+    }
+
+
+def add_destinations(destinations) -> int:
+    """
+    Seed the store from an Amadeus direct-destinations response.
+    These entries describe cities, so they only fill fields that FlightRadar24 airport data has not set.
+    """
+    return _add_quietly(records_from_destinations(destinations), overwrite=False)
+
+
+def add_fr24_airport(airport_details) -> int:
+    """
+    Seed the store from a FlightRadar24 airport details payload.
+    """
+    try:
+        details = airport_details['airport']['pluginData']['details']
+    except (KeyError, TypeError):
+        return 0
+    return _add_quietly([record_from_fr24(details)])
+
+
+def add_fr24_flight(flight_details) -> int:
+    """
+    Seed the store from the origin and destination airports of FlightRadar24 flight details.
+    """
+    airports = (flight_details or {}).get('airport') or {}
+    return _add_quietly([record_from_fr24(airports.get('origin')), record_from_fr24(airports.get('destination'))])
+
+
+def _add_quietly(records, overwrite: bool = True) -> int:
+    # Seeding is best effort and must never break the lookup that triggered it
+    try:
+        return airports.add([record for record in records if record], overwrite=overwrite)
+    except (OSError, ValueError) as e:
+        print(f"Could not update airport store: {e}")
+        return 0
+
+
+airports = AirportStore()
+
+
+def seed(cache_dir: str = None):
+    """
+    Seed the store from the tests/ fixtures and, if given, the on-disk direct-destinations cache.
+    """
+    with open('tests/SEA.txt', 'r', encoding='utf-8') as f:
+        changed = add_destinations(json.load(f))
+    changed += airports.add([{'iata': 'SEA', 'icao': 'KSEA', 'name': 'Seattle-Tacoma International Airport', 'city': 'Seattle',
+                              'country': 'United States', 'country_code': 'US', 'latitude': 47.44898, 'longitude': -122.30931,
+                              'timezone': 'America/Los_Angeles'}])
+    cache_dir = os.path.join(cache_dir, 'direct_destinations') if cache_dir else None
+    if cache_dir and os.path.isdir(cache_dir):
+        for filename in os.listdir(cache_dir):
+            try:
+                with open(os.path.join(cache_dir, filename), 'r', encoding='utf-8') as f:
+                    changed += add_destinations(json.load(f)['value'])
+            except (OSError, ValueError, KeyError):
+                continue
+    return changed
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['seed']:
+        changed = seed(os.environ.get('FLIGHT_SEARCHER_CACHE_DIR'))
+        airports.compact()
+        print(f"{changed} airports added or updated; {len(airports)} in {airports.path}")
+        return 0
+    if argv[:1] == ['search'] and len(argv) > 1:
+        for record in airports.search(' '.join(argv[1:])):
+            print(f"{record['iata'] or '---'} {record['icao'] or '----'}  {record['name'] or record['city']}, {record['country']}  {record['timezone'] or ''}")
+        return 0
+    print(__doc__)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
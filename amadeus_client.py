@@ -0,0 +1,318 @@
+import json
+import time
+import asyncio
+import threading
+import http.client
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+import httpx
+from amadeus import Client, ResponseError
+from async_http import get_http
+
+TOKEN_PATH = '/v1/security/oauth2/token'
+# Shave this many seconds off every advertised token lifetime so the SDK
+# refreshes its bearer token well before it actually expires.
+TOKEN_REFRESH_MARGIN = 120
+AMADEUS_HOSTS = {'test': 'test.api.amadeus.com', 'production': 'api.amadeus.com'}
+
+_lock = threading.Lock()
+_client = None
+_config = None
+_pool = None
+_async_client = None
+
+
+class _PooledResponse:
+    """
+    Fully-read HTTP response with the subset of the urllib response API the Amadeus SDK uses.
+    """
+    def __init__(self, url, status, reason, headers, body):
+        self.url = url
+        self.status = self.code = status
+        self.reason = self.msg = reason
+        self.headers = headers
+        self._body = body
+
+    def getcode(self):
+        return self.status
+
+    def geturl(self):
+        return self.url
+
+    def info(self):
+        return self.headers
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def getheaders(self):
+        return list(self.headers.items())
+
+    def read(self, *args):
+        return self._body
+
+    def close(self):
+        pass
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connection pool, usable as the `http` callable of an Amadeus Client.
+    maxsize: Maximum number of idle connections kept per host
+    timeout: Socket timeout in seconds
+    """
+    def __init__(self, maxsize: int = 8, timeout: float = 30):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'connections_opened': 0,
+            'connections_reused': 0,
+            'token_requests': 0,
+        }
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _acquire(self, scheme, netloc):
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                self.stats['connections_reused'] += 1
+                return idle.pop(), True
+            self.stats['connections_opened'] += 1
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout), False
+        return http.client.HTTPConnection(netloc, timeout=self.timeout), False
+
+    def _release(self, scheme, netloc, conn):
+        with self._lock:
+            idle = self._idle.setdefault((scheme, netloc), [])
+            if len(idle) < self.maxsize:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def __call__(self, request):
+        """
+        Send a urllib Request over a pooled connection, mirroring urllib.request.urlopen.
+        """
+        url = urlsplit(request.full_url)
+        path = url.path + ('?' + url.query if url.query else '')
+        headers = dict(request.header_items())
+        headers.setdefault('Connection', 'keep-alive')
+        self._count('requests')
+
+        while True:
+            conn, reused = self._acquire(url.scheme, url.netloc)
+            try:
+                conn.request(request.get_method(), path, body=request.data, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                conn.close()
+                # An idle connection may have been closed by the server; retry on a fresh one.
+                if not reused:
+                    raise URLError(e)
+            except OSError as e:
+                conn.close()
+                # Like urlopen, so the SDK reports DNS failures, refused connections and timeouts as NetworkError
+                raise URLError(e)
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(url.scheme, url.netloc, conn)
+
+        if url.path == TOKEN_PATH:
+            self._count('token_requests')
+            body = _shorten_token_lifetime(body)
+
+        if response.status >= 400:
+            raise HTTPError(request.full_url, response.status, response.reason, response.headers, _BodyReader(body))
+        return _PooledResponse(request.full_url, response.status, response.reason, response.headers, body)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class _BodyReader:
+    def __init__(self, body):
+        self._body = body
+
+    def read(self, *args):
+        return self._body
+
+    def close(self):
+        pass
+
+
+def _shorten_token_lifetime(body: bytes) -> bytes:
+    try:
+        token = json.loads(body)
+        token['expires_in'] = max(int(token['expires_in']) - TOKEN_REFRESH_MARGIN, 0)
+        return json.dumps(token).encode('utf-8')
+    except (ValueError, KeyError, TypeError):
+        return body
+
+
+class AsyncResponseError(ResponseError):
+    """
+    Error response of the async client. It is a ResponseError, so callers handle errors of both clients alike.
+    """
+    def __init__(self, status: int, url: str, body: str, retry_after: str = None):
+        Exception.__init__(self, f"[{status}] {url}: {body[:300]}" if status else f"{url}: {body[:300]}")
+        self.response = None
+        self.status = status
+        self.retry_after = retry_after
+        if status is None:
+            self.code = 'NetworkError'
+        else:
+            self.code = 'ServerError' if status >= 500 else 'ClientError'
+
+
+class AsyncAmadeus:
+    """
+    Minimal async Amadeus client over the shared pooled httpx client, for the GET endpoints used here.
+    The access token is fetched once and shared by all concurrent requests until shortly before it expires.
+    config: Parsed config.json (client_id, client_secret and the optional hostname, host, port, ssl keys)
+    """
+    def __init__(self, config: dict):
+        self.client_id = config['client_id']
+        self.client_secret = config['client_secret']
+        ssl = config.get('ssl', True)
+        host = config.get('host') or AMADEUS_HOSTS[config.get('hostname', 'test')]
+        port = config.get('port', 443 if ssl else 80)
+        default_port = (ssl and port == 443) or (not ssl and port == 80)
+        self.base_url = f"{'https' if ssl else 'http'}://{host}" + ('' if default_port else f":{port}")
+        self._token = None
+        self._expires_at = 0.0
+        self._token_task = None
+        self.stats = {'requests': 0, 'token_requests': 0, 'errors': 0}
+
+    async def _fetch_token(self):
+        self.stats['token_requests'] += 1
+        response = await get_http().post(self.base_url + TOKEN_PATH, data={
+            'grant_type': 'client_credentials',
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+        })
+        if response.status_code >= 400:
+            raise AsyncResponseError(response.status_code, TOKEN_PATH, response.text)
+        token = response.json()
+        self._token = token['access_token']
+        self._expires_at = time.monotonic() + max(int(token['expires_in']) - TOKEN_REFRESH_MARGIN, 0)
+        return self._token
+
+    async def token(self) -> str:
+        """
+        Return a valid access token; concurrent callers share one token request.
+        """
+        if self._token is not None and time.monotonic() < self._expires_at:
+            return self._token
+        if self._token_task is None or self._token_task.done():
+            self._token_task = asyncio.ensure_future(self._fetch_token())
+        return await asyncio.shield(self._token_task)
+
+    async def get(self, path: str, **params):
+        """
+        GET an API path and return the "data" member of the response.
+        Raises AsyncResponseError for error responses; an expired token is renewed once.
+        """
+        for attempt in range(2):
+            token = await self.token()
+            self.stats['requests'] += 1
+            try:
+                response = await get_http().get(self.base_url + path, params=params, headers={'Authorization': f"Bearer {token}"})
+            except httpx.TransportError as e:
+                self.stats['errors'] += 1
+                raise AsyncResponseError(None, path, f"{type(e).__name__}: {e}") from e
+            if response.status_code == 401 and attempt == 0:
+                self._token = None
+                continue
+            break
+        if response.status_code >= 400:
+            self.stats['errors'] += 1
+            raise AsyncResponseError(response.status_code, path, response.text, response.headers.get('Retry-After'))
+        return response.json().get('data', [])
+
+
+def load_config(path: str = 'config.json'):
+    """
+    Load the Amadeus configuration once per process.
+    path: Path of the JSON config file with client_id and client_secret.
+    Optional keys: hostname ("test" or "production"), host, port, ssl, pool_size.
+    """
+    global _config
+    if _config is None:
+        with open(path, 'r') as f:
+            _config = json.load(f)
+    return _config
+
+
+def get_client():
+    """
+    Return the shared Amadeus client, creating it on first use.
+    The client keeps its access token between calls and sends requests over a keep-alive pool.
+    """
+    global _client, _pool
+    if _client is not None:
+        return _client
+    with _lock:
+        if _client is None:
+            config = load_config()
+            _pool = ConnectionPool(maxsize=config.get('pool_size', 8))
+            options = {key: config[key] for key in ('hostname', 'host', 'port', 'ssl') if key in config}
+            _client = Client(
+                client_id=config['client_id'],
+                client_secret=config['client_secret'],
+                http=_pool,
+                **options
+            )
+    return _client
+
+
+def get_async_client() -> AsyncAmadeus:
+    """
+    Return the shared async Amadeus client, creating it on first use.
+    """
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                _async_client = AsyncAmadeus(load_config())
+    return _async_client
+
+
+def client_stats():
+    """
+    Report how often access tokens and connections were reused by the shared client.
+    """
+    stats = {f"async_{key}": value for key, value in _async_client.stats.items()} if _async_client is not None else {}
+    if _pool is None:
+        return stats
+    stats.update(_pool.stats)
+    api_requests = stats['requests'] - stats['token_requests']
+    stats['api_requests'] = api_requests
+    stats['token_reuse_ratio'] = 1 - stats['token_requests'] / api_requests if api_requests else 0.0
+    stats['connection_reuse_ratio'] = stats['connections_reused'] / stats['requests'] if stats['requests'] else 0.0
+    return stats
+
+
+def reset_client():
+    """
+    Drop the shared client and its pooled connections, e.g. after config.json changes.
+    """
+    global _client, _config, _pool, _async_client
+    with _lock:
+        if _pool is not None:
+            _pool.close()
+        _client, _config, _pool, _async_client = None, None, None, None
@@ -1,231 +1,587 @@
-import gradio as gr
-from gradio_folium import Folium
-
-import search
-from utils import render_title, select, create_airport_map
-import fr24
-
-def main():
-    # Page 1: Home
-    with gr.Blocks(theme=gr.themes.Ocean(), title="Flight Searcher") as demo:
-        render_title("Flight Searcher")
-        with gr.Column():
-            origin_airport = gr.Textbox(label="Origin Airport (IATA Code)", placeholder="e.g. SEA")
-            destination_airport = gr.Textbox(label="Destination Airport (IATA Code)", placeholder="e.g. JFK")
-            departure_date = gr.Textbox(label="Departure Date (YYYY-MM-DD)", placeholder="e.g. 2030-01-01")
-            adults = gr.Number(label="Number of Adults", value=1, precision=0, minimum=1)
-            testing_checkbox = gr.Checkbox(label="Testing Mode (no API call)", value=False)
-            search_button = gr.Button("Search Flights")
-            output = gr.Dataframe(
-                headers=["Offer #", "Flight #", "Route", "Aircraft", "DEP & ARR Terminals", "DEP Time", "ARR Time", "Duration", "Total Price"],
-                label="Flight Segments",
-                elem_id="output_box"
-            )
-            export_button_1 = gr.Button("Export to JSON")
-            file_download_1 = gr.File(label="Download JSON", visible=False)
-            message_1 = gr.Markdown(visible=False)
-
-            def export_json_1():
-                from search import cached_results
-                import tempfile
-                
-                if cached_results[0] != '':
-                    tmp = tempfile.NamedTemporaryFile(delete=False, suffix='.json', mode='w', encoding='utf-8')
-                    tmp.write(cached_results[0])
-                    tmp.close()
-                    return gr.update(value=tmp.name, visible=True), gr.update(value="", visible=False)
-                else:
-                    return gr.update(value=None, visible=False), gr.update(value="No results have been cached. This functionality does not support testing mode.", visible=True)
-
-            export_button_1.click(export_json_1, inputs=None, outputs=[file_download_1, message_1])
-
-            search_button.click(
-                fn=search.search_cheapest_flights,
-                inputs=[origin_airport, destination_airport, departure_date, adults, testing_checkbox],
-                outputs=output,
-                api_name="search_flights"
-            )
-        with gr.Accordion("About", open=False):
-            gr.Markdown("""
-                This application allows you to search for the cheapest flights between two airports using the Amadeus API and FlightRadar24 API.
-                Enter the IATA codes for the origin and destination airports, and the departure date to find available flights.
-                The results will display flight segments with details such as flight number, route, aircraft type, terminals, departure and arrival times, duration, and total price.
-            """)
-
-    # Page 2: Airport Routes Search
-    with demo.route("Airport Routes Search"):
-        with gr.Column():
-            gr.Markdown("### Airport Routes Search")
-
-            airport_search_box = gr.Textbox(label="Search for Routes from", placeholder="Enter airport name or IATA code to search", elem_id="airport_search_box")
-            search_button = gr.Button("Search")
-            testing_checkbox = gr.Checkbox(label="Testing Mode (no API call)", value=False)
-            route_outputs = gr.Dataframe(headers=["IATA Code", "Name", "State", "Country", "Region", "Latitude", "Longitude"], label="Airport Routes")
-            export_button_2 = gr.Button("Export to JSON")
-            file_download_2 = gr.File(label="Download JSON", visible=False)
-            message_2 = gr.Markdown(visible=False)
-
-            def export_json_2():
-                from search import cached_results
-                import tempfile
-
-                if cached_results[1] != '':
-                    tmp = tempfile.NamedTemporaryFile(delete=False, suffix='.json', mode='w', encoding='utf-8')
-                    tmp.write(cached_results[1])
-                    tmp.close()
-                    return gr.update(value=tmp.name, visible=True), gr.update(value="", visible=False)
-                else:
-                    return gr.update(value=None, visible=False), gr.update(value="No results have been cached. This functionality does not support testing mode.", visible=True)
-
-            export_button_2.click(export_json_2, inputs=None, outputs=[file_download_2, message_2])
-
-            search_button.click(
-                fn=search.search_airport_routes,
-                inputs=[airport_search_box, testing_checkbox],
-                outputs=route_outputs,
-            )
-
-            # Create and Update Airport Map using Gradio Folium component
-            folium_map = Folium(elem_id="airport_map")
-
-            route_outputs.select(
-                fn=select,
-                inputs=[route_outputs],
-                outputs=[folium_map]
-            )
-
-            route_outputs.change(
-                fn=create_airport_map,
-                inputs=[route_outputs],
-                outputs=[folium_map]
-            )
-
-            gr.Markdown("""
-                This feature allows you to search for airport routes by airport name or IATA code.
-                Enter the name or code to find available routes and their details.
-            """)
-
-    # Page 3: Arrival / Departure Boards
-    with demo.route("Arrival / Departure Boards"):
-        with gr.Column():
-            gr.Markdown("### Airport Arrival / Departure Boards")
-            airport_code_input = gr.Textbox(label="Airport Code (IATA/ICAO)", placeholder="e.g. SEA", elem_id="airport_code_input")
-            search_button = gr.Button("Get Arrival / Departure Boards")
-
-            with gr.Row():
-                with gr.Column():
-                    local_time_output = gr.Textbox(label="Local Time", interactive=False, lines=5)
-                with gr.Column():
-                    delay_index_output = gr.Textbox(label="Arrival/Departure Delay Index", interactive=False, lines=5)
-                with gr.Column():
-                    weather_output = gr.Textbox(label="Weather", interactive=False, lines=5)
-
-            arrivals_output = gr.Dataframe(
-                headers=["Origin", "Name", "Airline", "Flight", "Scheduled", "Status", "T", "Gate"],
-                label="Arrivals",
-                elem_id="arrivals_output"
-            )
-
-            departures_output = gr.Dataframe(
-                headers=["Destination", "Name", "Airline", "Flight", "Scheduled", "Status", "T", "Gate"],
-                label="Departures",
-                elem_id="departures_output"
-            )
-
-            def get_airport_details(airport_code):
-                airport_details = fr24.get_airport_details(airport_code)
-                departures = fr24.airport_dep_board(airport_details)
-                arrivals = fr24.airport_arr_board(airport_details)
-                local_time = fr24.get_local_time(airport_details)
-                
-                # Get delay index
-                arrival_delay, departure_delay = fr24.delay_index(airport_details)
-
-                # Handle null values for delays
-                if not arrival_delay:
-                    arrival_delay = 0.0
-                if not departure_delay:
-                    departure_delay = 0.0
-                
-                delay_text = f"Arrivals: {arrival_delay:.2f}\nDepartures: {departure_delay:.2f}"
-
-                # Get weather
-                weather_data = fr24.weather(airport_details)
-                if weather_data:
-                    temp_c, temp_f, condition, humidity, wind_speed_kmh, wind_speed_mph, wind_speed_text, wind_direction_degree, wind_direction_text, visibility_km, visibility_miles = weather_data
-                    weather_text = f"{temp_f} °F ({temp_c} °C) {condition}\nHumidity: {humidity}%\nWind: {wind_speed_mph} mph ({wind_speed_kmh} km/h) {wind_speed_text}\nDirection: {wind_direction_degree}° {wind_direction_text}\nVisibility: {visibility_miles} miles ({visibility_km} km)"
-                else:
-                    weather_text = "Not available"
-
-                return departures, arrivals, local_time, delay_text, weather_text
-
-            export_button_3 = gr.Button("Export to JSON")
-            file_download_3 = gr.File(label="Download JSON", visible=False)
-            message_3 = gr.Markdown(visible=False)
-            def export_json_3():
-                import tempfile
-
-                if fr24.cached_fr24_results[0] != '':
-                    tmp = tempfile.NamedTemporaryFile(delete=False, suffix='.json', mode='w', encoding='utf-8')
-                    tmp.write(fr24.cached_fr24_results[0])
-                    tmp.close()
-                    return gr.update(value=tmp.name, visible=True), gr.update(value="", visible=False)
-                else:
-                    return gr.update(value=None, visible=False), gr.update(value="No results have been cached.", visible=True)
-                
-            export_button_3.click(export_json_3, inputs=None, outputs=[file_download_3, message_3])
-
-            search_button.click(
-                fn=get_airport_details,
-                inputs=airport_code_input,
-                outputs=[departures_output, arrivals_output, local_time_output, delay_index_output, weather_output]
-            )
-            gr.Markdown("""
-                This feature allows you to view the arrival and departure boards for a specific airport.
-                Enter the IATA or ICAO code of the airport to get the latest flight information.
-            """)
-    
-    # Page 4: Flight Status
-    with demo.route("Flight Status"):
-        with gr.Column():
-            gr.Markdown("### Flight Status")
-            flight_number_input = gr.Textbox(label="Flight / Registration (Fuzzy Matching)", placeholder="e.g. AS26 or N977AK", elem_id="flight_number_input")
-            search_button = gr.Button("Get Flight Status")
-
-            flight_status_output = gr.Textbox(label="Flight Status", interactive=False, lines=6)
-            flight_map_output = Folium(label="Flight Tracker", elem_id="flight_map_output")
-            export_button_4 = gr.Button("Export to JSON")
-            file_download_4 = gr.File(label="Download JSON", visible=False)
-            message_4 = gr.Markdown(visible=False)
-            def export_json_4():
-                import tempfile
-
-                if fr24.cached_fr24_results[1] != '':
-                    tmp = tempfile.NamedTemporaryFile(delete=False, suffix='.json', mode='w', encoding='utf-8')
-                    tmp.write(fr24.cached_fr24_results[1])
-                    tmp.close()
-                    return gr.update(value=tmp.name, visible=True), gr.update(value="", visible=False)
-                else:
-                    return gr.update(value=None, visible=False), gr.update(value="No results have been cached.", visible=True)
-            export_button_4.click(export_json_4, inputs=None, outputs=[file_download_4, message_4])
-
-            def get_status_and_map(flight_id):
-                status = fr24.get_flight_status(flight_id)
-                flight_map = fr24.get_flight_map()
-                return status, flight_map
-
-            search_button.click(
-                fn=get_status_and_map,
-                inputs=flight_number_input,
-                outputs=[flight_status_output, flight_map_output]
-            )
-            gr.Markdown("""
-                This feature allows you to check the status of a specific flight.
-                Enter the flight number to get the latest status information and a live map.
-            """)
-    
-    # Launch the app
-    demo.launch()
-
-if __name__ == '__main__':
+import gradio as gr
+import pandas as pd
+import uvicorn
+from fastapi import FastAPI, Response
+from gradio_folium import Folium
+
+import os
+import html
+import time
+import asyncio
+import threading
+import search
+from utils import create_airport_map, PAN_TO_SELECTION_JS
+import fr24
+import airports
+import offers
+import export
+import metrics
+import scheduler
+import price_history
+from session import get_session
+from amadeus_client import client_stats, get_client
+
+# Results live in per-session state, so handlers can safely run concurrently
+CONCURRENCY_LIMIT = int(os.environ.get('FLIGHT_SEARCHER_CONCURRENCY', 8))
+# Async handlers wait on upstream calls on the event loop instead of holding a worker thread,
+# so many more of them can run at once
+ASYNC_CONCURRENCY_LIMIT = int(os.environ.get('FLIGHT_SEARCHER_ASYNC_CONCURRENCY', 100))
+# Clients and libraries are created on first use; with warm-up they are created in the background once the server listens
+WARM_UP = os.environ.get('FLIGHT_SEARCHER_WARM_UP', '1') != '0'
+
+# Cache, connection pool and index counters are exported next to the latency histograms
+metrics.register_collector('cache', search.cache_stats, label='cache')
+metrics.register_collector('airport_cache', fr24.airport_cache_stats)
+metrics.register_collector('flight_index', fr24.flight_index_stats)
+metrics.register_collector('amadeus_client', client_stats)
+metrics.register_collector('scheduler', scheduler.stats, label='provider')
+metrics.register_collector('price_history', price_history.price_history.info)
+
+def session_for(request: gr.Request):
+    """
+    Return the state dict of the Gradio session that made the request.
+    """
+    return get_session(request.session_hash if request else None)
+
+def render_title(title: str = "Flight Searcher"):
+        return gr.HTML(f"""
+        <link href="https://fonts.googleapis.com/css2?family=Ubuntu&display=swap" rel="stylesheet">
+        <h1 style = "text-align:center;
+            font-family: 'Ubuntu',
+            sans-serif;
+            font-weight: 500;
+            font-style: italic;
+            font-size: 3em;">
+            {title}
+        </h1>
+        """)
+
+def select(df, data: gr.SelectData):
+    """
+    Return the clicked route row as a point for PAN_TO_SELECTION_JS, which pans the existing map to it.
+    """
+    row = df.iloc[data.index[0], :]
+    return {
+        'lat': float(row['Latitude']),
+        'lon': float(row['Longitude']),
+        'name': html.escape(str(row.get('Name', str(row['Latitude']) + ',' + str(row['Longitude'])))),
+    }
+
+def warm_up(server=None):
+    """
+    Once the server is listening, create what the first requests would otherwise wait for: the
+    FlightRadar24 and Amadeus clients, the first live-flight snapshot and the price history database.
+    server: uvicorn server to wait for, or None to start right away
+    """
+    while server is not None and not server.started:
+        if server.should_exit:
+            return
+        time.sleep(0.05)
+    start = time.perf_counter()
+    steps = [
+        ('FlightRadar24 client', fr24.get_fr_api),
+        # Take the first live-flight snapshot so flight lookups can use the index early
+        ('live-flight index', fr24.flight_index.ensure_fresh),
+        ('Amadeus client', get_client),
+        # Opens the database and creates its schema
+        ('price history', lambda: price_history.price_history.price_drops(1)),
+    ]
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            print(f"Warm-up of the {name} failed: {e}")
+    print(f"Warm-up finished in {time.perf_counter() - start:.2f} s")
+
+def metrics_response():
+    """
+    Serve the hot-path metrics in the Prometheus text format.
+    """
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+def airport_hints(text):
+    """
+    List the airports of the offline store matching the typed text, as autocomplete hints.
+    """
+    labels = airports.suggest(text) if text and len(text.strip()) >= 2 else []
+    return "\n".join(f"- {label}" for label in labels)
+
+def export_controls(name, data_key, records=None, empty_message="No results have been cached."):
+    """
+    Add export format and compression controls with a download for a result kept in the session.
+    name: Export file name prefix; a session's previous export of the same name is deleted
+    data_key: Session key of the parsed result
+    records: Function turning the result into table records for the NDJSON, CSV and Parquet formats
+    """
+    with gr.Row():
+        export_format = gr.Dropdown(list(export.FORMAT_LABELS), value="JSON", label="Export Format")
+        export_compress = gr.Checkbox(label="Compress", value=False)
+    export_button = gr.Button("Export")
+    file_download = gr.File(label="Download", visible=False)
+    message = gr.Markdown(visible=False)
+
+    @metrics.request('export')
+    def export_result(format_label, compress, request: gr.Request):
+        session = session_for(request)
+        data = session.get(data_key)
+        if not data:
+            return gr.update(value=None, visible=False), gr.update(value=empty_message, visible=True)
+        try:
+            # Serialize only now that an export was requested, streaming from the parsed result
+            path = export.export(data, export.FORMAT_LABELS[format_label], compress,
+                                 records=(lambda: records(data)) if records else None, name=name, session=session)
+        except (RuntimeError, ImportError) as e:
+            # Parquet without a working pyarrow
+            return gr.update(value=None, visible=False), gr.update(value=str(e), visible=True)
+        except OSError as e:
+            print(f"Export failed: {e}")
+            return gr.update(value=None, visible=False), gr.update(value=f"Export failed: {e.strerror or e}", visible=True)
+        return gr.update(value=path, visible=True), gr.update(value="", visible=False)
+
+    export_button.click(export_result, inputs=[export_format, export_compress], outputs=[file_download, message])
+
+def main():
+    # Page 1: Home
+    with gr.Blocks(theme=gr.themes.Ocean(), title="Flight Searcher") as demo:
+        render_title("Flight Searcher")
+        with gr.Column():
+            origin_airport = gr.Textbox(label="Origin Airport (IATA Code)", placeholder="e.g. SEA")
+            destination_airport = gr.Textbox(label="Destination Airport (IATA Code)", placeholder="e.g. JFK")
+            departure_date = gr.Textbox(label="Departure Date (YYYY-MM-DD)", placeholder="e.g. 2030-01-01")
+            adults = gr.Number(label="Number of Adults", value=1, precision=0, minimum=1)
+            testing_checkbox = gr.Checkbox(label="Testing Mode (no API call)", value=False)
+            search_button = gr.Button("Search Flights")
+            output = gr.Dataframe(
+                headers=["Offer #", "Flight #", "Route", "Aircraft", "DEP & ARR Terminals", "DEP Time", "ARR Time", "Duration", "Total Price"],
+                label="Flight Segments",
+                elem_id="output_box"
+            )
+            with gr.Accordion("Filter & Sort", open=False):
+                with gr.Row():
+                    filter_max_stops = gr.Number(label="Max Stops", value=None, precision=0, minimum=0)
+                    filter_carrier = gr.Textbox(label="Carrier", placeholder="e.g. AS")
+                    filter_max_price = gr.Number(label="Max Price", value=None, minimum=0)
+                with gr.Row():
+                    filter_depart_from = gr.Textbox(label="Depart After (HH:MM)", placeholder="e.g. 06:00")
+                    filter_depart_to = gr.Textbox(label="Depart Before (HH:MM)", placeholder="e.g. 12:00")
+                    filter_sort_by = gr.Dropdown(["Price", "Stops", "Duration", "Departure", "Arrival"], value="Price", label="Sort By")
+                    filter_descending = gr.Checkbox(label="Descending", value=False)
+                filter_button = gr.Button("Apply")
+                @metrics.request('filter_offers')
+                def filter_offers(max_stops, carrier, depart_from, depart_to, max_price, sort_by, descending, request: gr.Request):
+                    try:
+                        return search.filter_offers(max_stops, carrier, depart_from, depart_to, max_price, sort_by, descending, session=session_for(request))
+                    except ValueError as e:
+                        raise gr.Error(str(e))
+
+                filter_button.click(
+                    fn=filter_offers,
+                    inputs=[filter_max_stops, filter_carrier, filter_depart_from, filter_depart_to, filter_max_price, filter_sort_by, filter_descending],
+                    outputs=output
+                )
+            export_controls('offers', 'offers', records=offers.segment_records, empty_message="No results have been cached. This functionality does not support testing mode.")
+
+            @metrics.request('search_flights')
+            async def search_flights(origin, destination, date, adults, testing, request: gr.Request):
+                try:
+                    return await search.search_cheapest_flights_async(origin, destination, date, adults, testing, session=session_for(request))
+                except scheduler.UpstreamUnavailable as e:
+                    raise gr.Error(str(e))
+
+            search_button.click(
+                fn=search_flights,
+                inputs=[origin_airport, destination_airport, departure_date, adults, testing_checkbox],
+                outputs=output,
+                api_name="search_flights",
+                concurrency_limit=ASYNC_CONCURRENCY_LIMIT
+            )
+        with gr.Accordion("About", open=False):
+            gr.Markdown("""
+                This application allows you to search for the cheapest flights between two airports using the Amadeus API and FlightRadar24 API.
+                Enter the IATA codes for the origin and destination airports, and the departure date to find available flights.
+                The results will display flight segments with details such as flight number, route, aircraft type, terminals, departure and arrival times, duration, and total price.
+            """)
+
+    # Page 1b: Flexible Dates
+    with demo.route("Flexible Dates"):
+        with gr.Column():
+            gr.Markdown("### Flexible Dates")
+            flex_origin = gr.Textbox(label="Origin Airport (IATA Code)", placeholder="e.g. SEA")
+            flex_destination = gr.Textbox(label="Destination Airport (IATA Code)", placeholder="e.g. JFK")
+            with gr.Row():
+                flex_start = gr.Textbox(label="Earliest Departure (YYYY-MM-DD)", placeholder="e.g. 2030-01-01")
+                flex_end = gr.Textbox(label="Latest Departure (YYYY-MM-DD)", placeholder="e.g. 2030-01-14")
+            flex_adults = gr.Number(label="Number of Adults", value=1, precision=0, minimum=1)
+            flex_testing = gr.Checkbox(label="Testing Mode (no API call)", value=False)
+            flex_button = gr.Button("Search Dates")
+            flex_calendar = gr.Dataframe(
+                headers=["Date", "Cheapest Price", "Flight #", "Offers", "Note"],
+                label="Cheapest Price per Day"
+            )
+            flex_offers = gr.Dataframe(
+                headers=["Date", "Offer #", "Flight #", "Route", "Aircraft", "DEP & ARR Terminals", "DEP Time", "ARR Time", "Duration", "Total Price"],
+                label="All Flight Segments"
+            )
+
+            @metrics.request('search_flexible_dates')
+            async def search_dates(origin, destination, start_date, end_date, adults, testing):
+                try:
+                    async for update in search.search_flexible_dates_async(origin, destination, start_date, end_date, adults, testing):
+                        yield update
+                except ValueError as e:
+                    raise gr.Error(str(e))
+
+            flex_button.click(
+                fn=search_dates,
+                inputs=[flex_origin, flex_destination, flex_start, flex_end, flex_adults, flex_testing],
+                outputs=[flex_calendar, flex_offers],
+                api_name="search_flexible_dates",
+                concurrency_limit=ASYNC_CONCURRENCY_LIMIT
+            )
+            gr.Markdown("""
+                This feature searches every departure date in a window (up to 31 days) concurrently.
+                The calendar fills in as each day completes; the cheapest offer per day is shown first.
+            """)
+
+    # Page 1c: Explore Anywhere
+    with demo.route("Explore Anywhere"):
+        with gr.Column():
+            gr.Markdown("### Explore Anywhere")
+            explore_origin = gr.Textbox(label="Origin Airport (IATA Code)", placeholder="e.g. SEA")
+            explore_date = gr.Textbox(label="Departure Date (YYYY-MM-DD)", placeholder="e.g. 2030-01-01")
+            explore_adults = gr.Number(label="Number of Adults", value=1, precision=0, minimum=1)
+            explore_testing = gr.Checkbox(label="Testing Mode (no API call)", value=False)
+            explore_button = gr.Button("Explore")
+            explore_headers = ["IATA Code", "Name", "Country", "Latitude", "Longitude", "Price", "Flight #", "Note"]
+            explore_output = gr.Dataframe(headers=explore_headers, label="Cheapest Fares by Destination")
+            explore_map = Folium(elem_id="explore_map")
+
+            @metrics.request('explore_anywhere')
+            async def explore(origin, departure_date, adults, testing):
+                rows = []
+                count = 0
+                try:
+                    async for rows in search.search_anywhere_async(origin, departure_date, adults, testing):
+                        count += 1
+                        # Re-rendering the map is the expensive part, so only refresh it every few destinations,
+                        # off the event loop
+                        if count % 10 == 0:
+                            yield rows, await asyncio.to_thread(create_airport_map, pd.DataFrame(rows, columns=explore_headers))
+                        else:
+                            yield rows, gr.update()
+                except scheduler.UpstreamUnavailable as e:
+                    raise gr.Error(str(e))
+                yield rows, await asyncio.to_thread(create_airport_map, pd.DataFrame(rows, columns=explore_headers))
+
+            explore_button.click(
+                fn=explore,
+                inputs=[explore_origin, explore_date, explore_adults, explore_testing],
+                outputs=[explore_output, explore_map],
+                api_name="explore_anywhere",
+                concurrency_limit=ASYNC_CONCURRENCY_LIMIT
+            )
+            gr.Markdown("""
+                This feature prices every direct destination from an airport and ranks them by the cheapest fare.
+                Map markers are green for the cheapest third of destinations, orange for the middle and red for the most expensive.
+                Destinations priced by earlier searches are reused from the cache.
+            """)
+
+    # Page 2: Airport Routes Search
+    with demo.route("Airport Routes Search"):
+        with gr.Column():
+            gr.Markdown("### Airport Routes Search")
+
+            airport_search_box = gr.Textbox(label="Search for Routes from", placeholder="Enter airport name or IATA code to search", elem_id="airport_search_box")
+            airport_search_hints = gr.Markdown()
+            airport_search_box.input(airport_hints, inputs=airport_search_box, outputs=airport_search_hints, trigger_mode="always_last", show_progress="hidden")
+            search_button = gr.Button("Search")
+            testing_checkbox = gr.Checkbox(label="Testing Mode (no API call)", value=False)
+            route_outputs = gr.Dataframe(headers=search.ROUTE_HEADERS, label="Airport Routes")
+            export_controls('routes', 'routes', empty_message="No results have been cached. This functionality does not support testing mode.")
+
+            # Create and Update Airport Map using Gradio Folium component
+            folium_map = Folium(elem_id="airport_map")
+            selected_route = gr.JSON(visible=False)
+
+            @metrics.request('search_routes')
+            async def search_routes(airport, testing, request: gr.Request):
+                try:
+                    rows = await search.search_airport_routes_async(airport, testing, session=session_for(request))
+                    # The map is rendered once per origin airport and shared between searches
+                    return rows, await search.airport_route_map_async(airport, testing)
+                except scheduler.UpstreamUnavailable as e:
+                    raise gr.Error(str(e))
+
+            search_button.click(
+                fn=search_routes,
+                inputs=[airport_search_box, testing_checkbox],
+                outputs=[route_outputs, folium_map],
+                concurrency_limit=ASYNC_CONCURRENCY_LIMIT
+            )
+
+            # Selecting a row pans the existing map in the browser instead of rendering a new one
+            route_outputs.select(
+                fn=select,
+                inputs=[route_outputs],
+                outputs=[selected_route]
+            )
+            selected_route.change(fn=None, inputs=[selected_route], js=PAN_TO_SELECTION_JS)
+
+            gr.Markdown("""
+                This feature allows you to search for airport routes by airport name or IATA code.
+                Enter the name or code to find available routes and their details.
+                Destinations are clustered on the map with great-circle lines from the origin; select a row to fly to it.
+            """)
+
+    # Page 2b: Connections
+    with demo.route("Connections"):
+        with gr.Column():
+            gr.Markdown("### Connections")
+            connection_origin = gr.Textbox(label="Origin Airport (IATA Code or Name)", placeholder="e.g. SEA")
+            connection_destination = gr.Textbox(label="Destination Airport (IATA Code or Name)", placeholder="e.g. AMS")
+            with gr.Row():
+                connection_stops = gr.Number(label="Maximum Stops", value=1, precision=0, minimum=0, maximum=3)
+                connection_count = gr.Number(label="Routes", value=5, precision=0, minimum=1, maximum=20)
+            connection_date = gr.Textbox(label="Departure Date to Price (YYYY-MM-DD, optional)", placeholder="e.g. 2030-01-01")
+            connection_adults = gr.Number(label="Number of Adults", value=1, precision=0, minimum=1)
+            connection_testing = gr.Checkbox(label="Testing Mode (no API call)", value=False)
+            connection_button = gr.Button("Find Connections")
+            connection_output = gr.Dataframe(headers=search.CONNECTION_HEADERS, label="Connecting Routes")
+
+            connection_button.click(
+                fn=metrics.request('find_connections')(search.find_connections),
+                inputs=[connection_origin, connection_destination, connection_stops, connection_count, connection_date, connection_adults, connection_testing],
+                outputs=connection_output,
+                api_name="find_connections"
+            )
+            gr.Markdown("""
+                This feature suggests connecting routes from the airport networks fetched by earlier route searches, shortest first.
+                Airports whose network has not been searched yet are assumed to fly back on the routes seen into them.
+                With a departure date, only the legs of the suggested routes are priced and the cheapest fare of each leg is summed (separate tickets).
+            """)
+
+    with demo.route("Price History"):
+        with gr.Column():
+            gr.Markdown("### Price History")
+            history_origin = gr.Textbox(label="Origin Airport (IATA Code)", placeholder="e.g. SEA")
+            history_destination = gr.Textbox(label="Destination Airport (IATA Code)", placeholder="e.g. JFK")
+            history_date = gr.Textbox(label="Departure Date (YYYY-MM-DD)", placeholder="e.g. 2030-01-01")
+            history_adults = gr.Number(label="Number of Adults", value=1, precision=0, minimum=1)
+            history_button = gr.Button("Show Price History")
+            history_summary = gr.Markdown()
+            history_trend = gr.Dataframe(headers=price_history.TREND_HEADERS, label="Cheapest Fare per Search")
+            history_fares = gr.Dataframe(headers=price_history.FARE_HEADERS, label="Lowest Observed Fares")
+
+            @metrics.request('price_history')
+            def show_price_history(origin, destination, date, adults):
+                if not origin or not destination or not date:
+                    raise gr.Error("Enter an origin, a destination and a departure date.")
+                return (
+                    price_history.drop_summary(origin, destination, date, adults),
+                    price_history.trend_rows(origin, destination, date, adults),
+                    price_history.fare_table_rows(origin, destination, date, adults),
+                )
+
+            history_button.click(
+                fn=show_price_history,
+                inputs=[history_origin, history_destination, history_date, history_adults],
+                outputs=[history_summary, history_trend, history_fares],
+                api_name="price_history"
+            )
+            gr.Markdown("""
+                Every flight search made through the app, including flexible-date, explore and connection searches, is recorded locally.
+                This page shows the cheapest fare found by each search of a route and date, and the lowest fares ever seen for its itineraries, without calling the API again.
+            """)
+
+    # Page 3: Arrival / Departure Boards
+    with demo.route("Arrival / Departure Boards"):
+        with gr.Column():
+            gr.Markdown("### Airport Arrival / Departure Boards")
+            airport_code_input = gr.Textbox(label="Airport Code (IATA/ICAO) or Name", placeholder="e.g. SEA", elem_id="airport_code_input")
+            airport_code_hints = gr.Markdown()
+            airport_code_input.input(airport_hints, inputs=airport_code_input, outputs=airport_code_hints, trigger_mode="always_last", show_progress="hidden")
+            search_button = gr.Button("Get Arrival / Departure Boards")
+            with gr.Row():
+                live_checkbox = gr.Checkbox(label="Live Mode (auto-refresh)", value=False)
+                refresh_seconds = gr.Slider(15, 300, value=30, step=15, label="Refresh Every (seconds)")
+            board_timer = gr.Timer(30, active=False)
+            board_state = gr.State({})
+
+            with gr.Row():
+                with gr.Column():
+                    local_time_output = gr.Textbox(label="Local Time", interactive=False, lines=5)
+                with gr.Column():
+                    delay_index_output = gr.Textbox(label="Arrival/Departure Delay Index", interactive=False, lines=5)
+                with gr.Column():
+                    weather_output = gr.Textbox(label="Weather", interactive=False, lines=5)
+
+            arrivals_output = gr.Dataframe(
+                headers=["Origin", "Name", "Airline", "Flight", "Scheduled", "Status", "T", "Gate"],
+                label="Arrivals",
+                elem_id="arrivals_output"
+            )
+
+            departures_output = gr.Dataframe(
+                headers=["Destination", "Name", "Airline", "Flight", "Scheduled", "Status", "T", "Gate"],
+                label="Departures",
+                elem_id="departures_output"
+            )
+
+            board_changes_output = gr.Dataframe(
+                headers=["Change", "Board", "Airport", "Name", "Airline", "Flight", "Scheduled", "Status", "T", "Gate"],
+                label="Changes Since Last Refresh",
+                elem_id="board_changes_output"
+            )
+
+            @metrics.request('airport_details')
+            async def get_airport_details(airport_code, request: gr.Request):
+                airport_details = await fr24.get_airport_details_async(airport_code, session=session_for(request))
+                if airport_details is None:
+                    raise gr.Error(f"Could not load details for airport \"{airport_code}\". Check the code and try again.")
+                departures_board, departures, _ = fr24.live_board(airport_details, 'departures')
+                arrivals_board, arrivals, _ = fr24.live_board(airport_details, 'arrivals')
+                state = {'code': airport_code, 'departures': departures_board, 'arrivals': arrivals_board}
+                local_time = fr24.get_local_time(airport_details)
+                
+                # Get delay index
+                arrival_delay, departure_delay = fr24.delay_index(airport_details)
+
+                # Handle null values for delays
+                if not arrival_delay:
+                    arrival_delay = 0.0
+                if not departure_delay:
+                    departure_delay = 0.0
+                
+                delay_text = f"Arrivals: {arrival_delay:.2f}\nDepartures: {departure_delay:.2f}"
+
+                # Get weather
+                weather_data = fr24.weather(airport_details)
+                if weather_data:
+                    temp_c, temp_f, condition, humidity, wind_speed_kmh, wind_speed_mph, wind_speed_text, wind_direction_degree, wind_direction_text, visibility_km, visibility_miles = weather_data
+                    weather_text = f"{temp_f} °F ({temp_c} °C) {condition}\nHumidity: {humidity}%\nWind: {wind_speed_mph} mph ({wind_speed_kmh} km/h) {wind_speed_text}\nDirection: {wind_direction_degree}° {wind_direction_text}\nVisibility: {visibility_miles} miles ({visibility_km} km)"
+                else:
+                    weather_text = "Not available"
+
+                return departures, arrivals, local_time, delay_text, weather_text, [], state
+
+            @metrics.request('refresh_boards')
+            async def refresh_boards(airport_code, state, request: gr.Request):
+                if not airport_code:
+                    return gr.skip(), gr.skip(), gr.skip(), state
+                # Boards only need a fresh schedule; weather and delay index may be older
+                airport_details = await fr24.get_airport_details_async(airport_code, session=session_for(request), components=('schedule',), priority=scheduler.BACKGROUND)
+                if airport_details is None:
+                    # A failed refresh keeps the boards as they are; diffing against nothing would remove every row
+                    return gr.skip(), gr.skip(), gr.skip(), state
+                if state.get('code') != airport_code:
+                    state = {'code': airport_code}
+                departures_board, departures, departure_changes = fr24.live_board(airport_details, 'departures', state.get('departures'))
+                arrivals_board, arrivals, arrival_changes = fr24.live_board(airport_details, 'arrivals', state.get('arrivals'))
+                changes = [[change[0], "Departure"] + change[1:] for change in departure_changes]
+                changes += [[change[0], "Arrival"] + change[1:] for change in arrival_changes]
+                state = {'code': airport_code, 'departures': departures_board, 'arrivals': arrivals_board}
+                # Only resend a board when at least one of its rows changed
+                return (
+                    departures if departure_changes else gr.skip(),
+                    arrivals if arrival_changes else gr.skip(),
+                    changes,
+                    state,
+                )
+
+            def set_live_mode(live, seconds):
+                return gr.Timer(value=seconds, active=live)
+
+            export_controls('airport', 'airport_details', records=fr24.schedule_records)
+
+            search_button.click(
+                fn=get_airport_details,
+                inputs=airport_code_input,
+                outputs=[departures_output, arrivals_output, local_time_output, delay_index_output, weather_output, board_changes_output, board_state],
+                concurrency_limit=ASYNC_CONCURRENCY_LIMIT
+            )
+            board_timer.tick(
+                fn=refresh_boards,
+                inputs=[airport_code_input, board_state],
+                outputs=[departures_output, arrivals_output, board_changes_output, board_state],
+                concurrency_limit=ASYNC_CONCURRENCY_LIMIT
+            )
+            live_checkbox.change(set_live_mode, inputs=[live_checkbox, refresh_seconds], outputs=board_timer)
+            refresh_seconds.change(set_live_mode, inputs=[live_checkbox, refresh_seconds], outputs=board_timer)
+            gr.Markdown("""
+                This feature allows you to view the arrival and departure boards for a specific airport.
+                Enter the IATA or ICAO code (or the name of an airport seen before) to get the latest flight information.
+                In live mode the boards refresh automatically, and only flights whose status, gate, terminal or time changed are listed under changes.
+            """)
+    
+    # Page 4: Flight Status
+    with demo.route("Flight Status"):
+        with gr.Column():
+            gr.Markdown("### Flight Status")
+            flight_number_input = gr.Textbox(label="Flight / Registration (Fuzzy Matching)", placeholder="e.g. AS26 or N977AK", elem_id="flight_number_input")
+            search_button = gr.Button("Get Flight Status")
+
+            flight_status_output = gr.Textbox(label="Flight Status", interactive=False, lines=6)
+            flight_map_output = Folium(label="Flight Tracker", elem_id="flight_map_output")
+            export_controls('flight', 'flight_details', records=fr24.trail_records)
+
+            @metrics.request('flight_status')
+            async def get_status_and_map(flight_id, request: gr.Request):
+                session = session_for(request)
+                status = await fr24.get_flight_status_async(flight_id, session=session)
+                flight_map = await asyncio.to_thread(fr24.get_flight_map, session=session)
+                return status, flight_map
+
+            search_button.click(
+                fn=get_status_and_map,
+                inputs=flight_number_input,
+                outputs=[flight_status_output, flight_map_output],
+                concurrency_limit=ASYNC_CONCURRENCY_LIMIT
+            )
+            gr.Markdown("""
+                This feature allows you to check the status of a specific flight.
+                Enter a flight number, callsign, registration or ICAO24 address to get the latest status information and a live map.
+                Partial identifiers work when they match a single live flight; otherwise similar live flights are suggested.
+            """)
+    
+    # Page 5: Fleet Tracking
+    with demo.route("Fleet Tracking"):
+        with gr.Column():
+            gr.Markdown("### Fleet Tracking")
+            fleet_input = gr.Textbox(label="Registrations / Flight Numbers", placeholder="e.g. N977AK, AS26, JA876A", lines=3, elem_id="fleet_input")
+            fleet_button = gr.Button("Get Fleet Status")
+
+            fleet_output = gr.Dataframe(headers=fr24.FLEET_HEADERS, label="Fleet Status")
+            fleet_map_output = Folium(label="Fleet Map", elem_id="fleet_map_output")
+            export_controls('fleet', 'fleet_details', records=fr24.fleet_records)
+
+            @metrics.request('fleet_status')
+            async def get_fleet_status_and_map(identifiers, request: gr.Request):
+                session = session_for(request)
+                rows = await fr24.get_fleet_status_async(identifiers, session=session)
+                return rows, await asyncio.to_thread(fr24.get_fleet_map, session=session)
+
+            fleet_button.click(
+                fn=get_fleet_status_and_map,
+                inputs=fleet_input,
+                outputs=[fleet_output, fleet_map_output],
+                api_name="fleet_status",
+                concurrency_limit=ASYNC_CONCURRENCY_LIMIT
+            )
+            gr.Markdown(f"""
+                This feature checks many flights at once. Enter up to {fr24.FLEET_MAX_SIZE} registrations or flight numbers separated by commas, spaces or new lines.
+                Lookups run in parallel and aircraft shared by several entries are fetched once; all aircraft are shown on one map.
+            """)
+    
+    # Launch the app
+    demo.queue(default_concurrency_limit=CONCURRENCY_LIMIT)
+    # Serve the app from a FastAPI server that also exposes /metrics for Prometheus
+    app = FastAPI()
+    app.add_api_route('/metrics', metrics_response, methods=['GET'], include_in_schema=False)
+    app = gr.mount_gradio_app(app, demo, path='/')
+    server = uvicorn.Server(uvicorn.Config(app, host=os.environ.get('GRADIO_SERVER_NAME', '127.0.0.1'), port=int(os.environ.get('GRADIO_SERVER_PORT', 7860))))
+    if WARM_UP:
+        threading.Thread(target=warm_up, args=(server,), name='warm-up', daemon=True).start()
+    server.run()
+
+if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,43 @@
+"""
+Shared pooled async HTTP client for the async upstream calls (Amadeus and FlightRadar24).
+
+One httpx.AsyncClient is kept per running event loop: pooled connections belong to the loop that
+opened them, so scripts that call asyncio.run() more than once get a fresh pool each time while the
+app's server loop reuses one pool for every request.
+"""
+import os
+import asyncio
+import weakref
+
+import httpx
+
+# Upper bound on concurrent upstream connections of one event loop, across all hosts
+MAX_CONNECTIONS = int(os.environ.get('FLIGHT_SEARCHER_ASYNC_CONNECTIONS', 200))
+MAX_KEEPALIVE = int(os.environ.get('FLIGHT_SEARCHER_ASYNC_KEEPALIVE', 50))
+TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_http() -> httpx.AsyncClient:
+    """
+    Return the pooled async HTTP client of the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _clients[loop] = httpx.AsyncClient(
+            timeout=TIMEOUT,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE),
+            follow_redirects=True,
+        )
+    return client
+
+
+async def close_http():
+    """
+    Close the pooled client of the running event loop, e.g. before a script's loop shuts down.
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,325 @@
+"""
+Headless batch runner for bulk query files.
+
+Reads a JSONL file with one query per line and runs the queries concurrently through the same
+search/fr24 code as the app, as background requests of the scheduler. Result rows are written to
+one NDJSON file or Parquet dataset per query type in the output directory, each row tagged with
+its query id; failed queries go to errors.ndjson. Query ids are appended to checkpoint.jsonl once
+their rows are on disk, so running the same command again after an interruption skips the
+queries already done.
+
+Query lines (the id defaults to the line number):
+    {"id": "q1", "type": "offers", "origin": "SEA", "destination": "JFK", "date": "2030-01-01", "adults": 1}
+    {"id": "q2", "type": "routes", "airport": "SEA"}
+    {"id": "q3", "type": "board", "airport": "KSEA"}
+    {"id": "q4", "type": "flight", "flight": "AS26"}
+
+Usage:
+    python batch.py queries.jsonl --output batch_output --concurrency 16
+    python batch.py queries.jsonl --output batch_output --format parquet --compress
+"""
+import os
+import sys
+import json
+import gzip
+import time
+import asyncio
+import argparse
+from collections import Counter
+
+import export
+import offers
+import search
+import fr24
+from airports import resolve_code
+from async_http import close_http
+from scheduler import BACKGROUND
+
+QUERY_TYPES = ('offers', 'routes', 'board', 'flight')
+CHECKPOINT_NAME = 'checkpoint.jsonl'
+ERRORS_NAME = 'errors.ndjson'
+# Rows of one query type held in memory before they are written as a Parquet part file
+PART_ROWS = 20000
+
+
+def read_queries(path: str):
+    """
+    Yield (query_id, query) for every non-empty line of a JSONL file.
+    A line that is not a JSON object is yielded with a ValueError as its query.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                query = json.loads(line)
+            except ValueError as e:
+                yield str(line_number), ValueError(f"Invalid JSON on line {line_number}: {e}")
+                continue
+            if not isinstance(query, dict):
+                yield str(line_number), ValueError(f"Line {line_number} is not a JSON object")
+                continue
+            yield str(query.get('id', line_number)), query
+
+
+def load_checkpoint(output_dir: str) -> dict:
+    """
+    Return the status ("ok" or "error") of every query id recorded in the checkpoint of an output directory.
+    """
+    done = {}
+    try:
+        with open(os.path.join(output_dir, CHECKPOINT_NAME), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    done[entry['id']] = entry['status']
+                except (ValueError, KeyError, TypeError):
+                    # A line cut short by a crash; its query simply runs again
+                    continue
+    except OSError:
+        pass
+    return done
+
+
+def _require(query: dict, *keys):
+    missing = [key for key in keys if not query.get(key)]
+    if missing:
+        raise ValueError(f"{query.get('type')} query is missing {', '.join(missing)}")
+
+
+async def run_query(query: dict, testing: bool = False):
+    """
+    Run one query and return its result rows.
+    testing: Use the local sample data for offers and routes queries instead of calling Amadeus.
+    """
+    if isinstance(query, Exception):
+        raise query
+    kind = query.get('type')
+    if kind == 'offers':
+        _require(query, 'origin', 'destination', 'date')
+        data = await search.fetch_flight_offers_async(query['origin'], query['destination'], query['date'], query.get('adults', 1), testing, BACKGROUND)
+        return list(offers.segment_records(data))
+    if kind == 'routes':
+        _require(query, 'airport')
+        return await search.fetch_direct_destinations_async(resolve_code(query['airport']), testing, BACKGROUND)
+    if kind == 'board':
+        _require(query, 'airport')
+        airport_details = await fr24.get_airport_details_async(query['airport'], session={}, priority=BACKGROUND)
+        if airport_details is None:
+            raise LookupError(f"No airport details for {query['airport']}")
+        return list(fr24.schedule_records(airport_details))
+    if kind == 'flight':
+        _require(query, 'flight')
+        flight_obj = await fr24.find_live_flight_async(query['flight'], BACKGROUND)
+        if flight_obj is None:
+            raise LookupError(f"No live flight found for {query['flight']}")
+        details = await fr24.load_flight_details_async(flight_obj, BACKGROUND)
+        return list(fr24.fleet_records({flight_obj.id: details}))
+    raise ValueError(f"Unknown query type {kind!r}, expected one of {', '.join(QUERY_TYPES)}")
+
+
+class BatchWriter:
+    """
+    Output of a batch run: result rows per query type, the error log and the checkpoint.
+    NDJSON rows are appended and flushed per query. Parquet rows are flattened and buffered per query
+    type, and written as a new part file of the type's dataset directory every part_rows rows; their
+    query ids are only checkpointed once the part file is written. Every part of a type is written with
+    the schema of its first part (or of the parts already there), so the directory reads back as one dataset.
+    output_dir: Directory of the outputs and the checkpoint
+    fmt: "ndjson" or "parquet"
+    compress: gzip NDJSON files, or use zstd instead of snappy for Parquet
+    """
+    def __init__(self, output_dir: str, fmt: str = 'ndjson', compress: bool = False, part_rows: int = PART_ROWS):
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.compress = compress
+        self.part_rows = part_rows
+        os.makedirs(output_dir, exist_ok=True)
+        self._checkpoint = open(os.path.join(output_dir, CHECKPOINT_NAME), 'a', encoding='utf-8')
+        self._errors = open(os.path.join(output_dir, ERRORS_NAME), 'a', encoding='utf-8')
+        self._files = {}
+        self._rows = {}
+        self._pending = {}
+        self._schemas = {}
+        self._parts = 0
+        self._run = time.strftime('%Y%m%d-%H%M%S')
+
+    def _done(self, query_ids, status: str):
+        for query_id in query_ids:
+            self._checkpoint.write(json.dumps({'id': query_id, 'status': status}) + '\n')
+        self._checkpoint.flush()
+
+    def _ndjson(self, kind: str):
+        f = self._files.get(kind)
+        if f is None:
+            path = os.path.join(self.output_dir, f"{kind}.ndjson" + ('.gz' if self.compress else ''))
+            # Appending to a gzip file adds a member; readers decompress all members as one stream
+            f = self._files[kind] = gzip.open(path, 'at', encoding='utf-8') if self.compress else open(path, 'a', encoding='utf-8')
+        return f
+
+    def add(self, query_id: str, kind: str, rows) -> int:
+        """
+        Write the result rows of a query. Returns the number of rows.
+        """
+        rows = [{'query_id': query_id, **row} for row in rows]
+        if self.fmt == 'ndjson':
+            f = self._ndjson(kind)
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, separators=(',', ':')))
+                f.write('\n')
+            f.flush()
+            self._done([query_id], 'ok')
+        else:
+            self._rows.setdefault(kind, []).extend(export.flatten(row) for row in rows)
+            self._pending.setdefault(kind, []).append(query_id)
+            if len(self._rows[kind]) >= self.part_rows:
+                self._write_part(kind)
+        return len(rows)
+
+    def fail(self, query_id: str, query, error: Exception):
+        """
+        Log a failed query; it is checkpointed as failed so a resumed run skips it unless asked to retry failures.
+        """
+        entry = {'query_id': query_id, 'query': None if isinstance(query, Exception) else query, 'error': f"{type(error).__name__}: {error}"}
+        self._errors.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+        self._errors.flush()
+        self._done([query_id], 'error')
+
+    def _write_part(self, kind: str):
+        rows = self._rows.pop(kind, [])
+        if rows:
+            directory = os.path.join(self.output_dir, kind)
+            os.makedirs(directory, exist_ok=True)
+            path = None
+            # A resumed run started within the same second must not overwrite the earlier run's parts
+            while path is None or os.path.exists(path):
+                self._parts += 1
+                path = os.path.join(directory, f"part-{self._run}-{self._parts:05d}.parquet")
+            tmp = path + '.tmp'
+            self._schemas[kind] = export.write_parquet(tmp, lambda: iter(rows), self.compress, self._schema(kind, directory))
+            os.replace(tmp, path)
+        self._done(self._pending.pop(kind, []), 'ok')
+
+    def _schema(self, kind: str, directory: str):
+        # A resumed run keeps writing with the schema of the parts already in the directory
+        if kind not in self._schemas:
+            parts = sorted(name for name in os.listdir(directory) if name.endswith('.parquet'))
+            if parts:
+                self._schemas[kind] = export.parquet_schema(os.path.join(directory, parts[0]))
+        return self._schemas.get(kind)
+
+    def close(self):
+        """
+        Write the buffered Parquet rows and close every file.
+        """
+        for kind in list(self._pending):
+            self._write_part(kind)
+        for f in self._files.values():
+            f.close()
+        self._checkpoint.close()
+        self._errors.close()
+
+
+class BatchSummary:
+    """
+    Throughput, latency and error counts of a batch run.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.latencies = {}
+        self.rows = Counter()
+        self.errors = Counter()
+        self.failed = Counter()
+        self.skipped = 0
+
+    def succeeded(self, kind: str, rows: int, elapsed: float):
+        self.latencies.setdefault(kind, []).append(elapsed)
+        self.rows[kind] += rows
+
+    def failure(self, kind, error: Exception):
+        self.failed[kind or 'invalid'] += 1
+        self.errors[f"{type(error).__name__}: {str(error)[:160]}"] += 1
+
+    def report(self) -> str:
+        elapsed = time.perf_counter() - self.start
+        succeeded = sum(len(latencies) for latencies in self.latencies.values())
+        failed = sum(self.failed.values())
+        total = succeeded + failed
+        lines = [
+            f"{total} queries in {elapsed:.1f}s ({succeeded} ok, {failed} failed, {self.skipped} skipped from the checkpoint)",
+            f"throughput: {total / elapsed if elapsed else 0:.1f} queries/s, {sum(self.rows.values()) / elapsed if elapsed else 0:.0f} rows/s",
+        ]
+        for kind in sorted(set(self.latencies) | set(self.failed)):
+            latencies = sorted(self.latencies.get(kind, []))
+            line = f"  {kind:<8} ok {len(latencies):>6}  failed {self.failed[kind]:>5}  rows {self.rows[kind]:>8}"
+            if latencies:
+                p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+                line += f"  p50 {latencies[len(latencies) // 2] * 1000:.0f} ms  p95 {p95 * 1000:.0f} ms"
+            lines.append(line)
+        for message, count in self.errors.most_common(5):
+            lines.append(f"  {count:>5} x {message}")
+        return '\n'.join(lines)
+
+
+async def run_batch(queries, writer: BatchWriter, summary: BatchSummary, concurrency: int = 8, testing: bool = False):
+    """
+    Run queries with at most concurrency of them in flight, writing each result as it completes.
+    queries: Iterator of (query_id, query); the workers pull from it, so the file is read as the run progresses
+    """
+    async def worker():
+        for query_id, query in queries:
+            kind = query.get('type') if isinstance(query, dict) else None
+            start = time.perf_counter()
+            try:
+                rows = await run_query(query, testing)
+            except Exception as error:
+                summary.failure(kind, error)
+                writer.fail(query_id, query, error)
+                continue
+            summary.succeeded(kind, writer.add(query_id, kind, rows), time.perf_counter() - start)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        await close_http()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of Flight Searcher queries headlessly.")
+    parser.add_argument('queries', help="JSONL file with one query per line")
+    parser.add_argument('--output', default='batch_output', help="Output directory, also holding the checkpoint")
+    parser.add_argument('--format', choices=('ndjson', 'parquet'), default='ndjson')
+    parser.add_argument('--compress', action='store_true', help="gzip NDJSON, or zstd instead of snappy for Parquet")
+    parser.add_argument('--concurrency', type=int, default=8, help="Queries in flight at once")
+    parser.add_argument('--part-rows', type=int, default=PART_ROWS, help="Rows per Parquet part file")
+    parser.add_argument('--retry-failed', action='store_true', help="Run queries that failed in an earlier run again")
+    parser.add_argument('--testing', action='store_true', help="Use the local sample data for offers and routes queries")
+    args = parser.parse_args(argv)
+    if args.format == 'parquet' and not export.parquet_available():
+        parser.error("Parquet output needs pyarrow (pip install pyarrow).")
+
+    done = load_checkpoint(args.output)
+    summary = BatchSummary()
+
+    def pending():
+        for query_id, query in read_queries(args.queries):
+            status = done.get(query_id)
+            if status == 'ok' or (status == 'error' and not args.retry_failed):
+                summary.skipped += 1
+                continue
+            yield query_id, query
+
+    writer = BatchWriter(args.output, args.format, args.compress, args.part_rows)
+    try:
+        asyncio.run(run_batch(pending(), writer, summary, max(args.concurrency, 1), args.testing))
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume.")
+    finally:
+        writer.close()
+    print(summary.report())
+    return 1 if summary.failed and not summary.latencies else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
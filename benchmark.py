@@ -0,0 +1,355 @@
+"""
+Offline benchmark suite for the parsing, formatting and map rendering hot paths.
+
+Runs on the fixtures in tests/ and on synthetic data scaled up from them, then reports
+throughput, latency percentiles, peak memory and (for map cases) rendered HTML size per
+case. With --baseline, each case's median latency is compared against a stored baseline
+and the run fails when it regresses past --threshold.
+
+Usage:
+    python benchmark.py                       # run all cases
+    python benchmark.py --save-baseline       # run and store the results as the new baseline
+    python benchmark.py --baseline benchmark_baseline.json --threshold 0.25
+
+With --startup, cold start is measured instead, each run in a fresh interpreter: the import time of
+the main modules and the time from launching app.py until it answers its first HTTP request.
+    python benchmark.py --startup --repeat 3 --save-baseline startup_baseline.json
+"""
+import os
+import sys
+import copy
+import json
+import time
+import random
+import socket
+import argparse
+import datetime
+import statistics
+import subprocess
+import tracemalloc
+import urllib.request
+from types import SimpleNamespace
+
+import pandas as pd
+
+import search
+import fr24
+import export
+from offers import segment_records
+from price_history import PriceHistory
+from utils import create_airport_map
+
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+STARTUP_MODULES = ('search', 'fr24', 'batch', 'app')
+# Seconds to wait for the app to answer before a startup run is failed
+STARTUP_TIMEOUT = 120
+ROUTE_COLUMNS = ["IATA Code", "Name", "State", "Country", "Region", "Latitude", "Longitude"]
+SEA = (47.44898, -122.30931, 'Seattle-Tacoma Intl SEA')
+
+
+def load_fixture(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def synthetic_offers(base, count, seed=0):
+    """
+    Scale the SEA-JFK offers up to count offers by copying them with shifted prices and times.
+    """
+    rng = random.Random(seed)
+    offers = []
+    for i in range(count):
+        offer = copy.deepcopy(base[i % len(base)])
+        offer['id'] = str(i + 1)
+        offer['price']['total'] = f"{float(offer['price']['total']) * rng.uniform(0.8, 1.5):.2f}"
+        shift = datetime.timedelta(minutes=rng.randrange(0, 24 * 60, 5))
+        for itinerary in offer['itineraries']:
+            for segment in itinerary['segments']:
+                for point in (segment['departure'], segment['arrival']):
+                    point['at'] = (datetime.datetime.fromisoformat(point['at']) + shift).isoformat()
+        offers.append(offer)
+    return offers
+
+
+def synthetic_routes(base, count, seed=0):
+    """
+    Scale the SEA direct destinations up to count destinations with jittered coordinates.
+    """
+    rng = random.Random(seed)
+    routes = []
+    for i in range(count):
+        city = copy.deepcopy(base[i % len(base)])
+        city['iataCode'] = f"{city['iataCode'][:2]}{i % 10}" if i >= len(base) else city['iataCode']
+        city['geoCode']['latitude'] += rng.uniform(-1, 1)
+        city['geoCode']['longitude'] += rng.uniform(-1, 1)
+        routes.append(city)
+    return routes
+
+
+def synthetic_board(rows, seed=0):
+    """
+    Build a FlightRadar24 airport details payload with rows arrivals and rows departures.
+    """
+    rng = random.Random(seed)
+    airlines = ['Alaska Airlines', 'Delta Air Lines', 'United Airlines (Star Alliance)', None]
+    statuses = ['Scheduled', 'Estimated dep 17:05', 'Delayed 09:30', 'Landed 23:41', 'Canceled']
+    start = int(datetime.datetime(2030, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+
+    def flight(i, direction):
+        airline = rng.choice(airlines)
+        other = {'code': {'iata': f"A{i % 100:02d}"}, 'position': {'region': {'city': f"City {i % 300}"}}, 'info': {'terminal': None, 'gate': None}}
+        here = {'code': {'iata': 'SEA'}, 'position': {'region': {'city': 'Seattle'}}, 'info': {'terminal': rng.choice(['A', 'N', 'S', None]), 'gate': rng.choice([f"B{i % 20}", None])}}
+        return {'flight': {
+            'identification': {'id': f"{i:08x}", 'number': {'default': f"AS{i}" if i % 17 else None}},
+            'airline': {'name': airline} if airline else None,
+            'airport': {'origin': other, 'destination': here} if direction == 'arrival' else {'origin': here, 'destination': other},
+            'time': {'scheduled': {'departure': start + i * 60, 'arrival': start + i * 60 + 7200}},
+            'status': {'text': rng.choice(statuses)},
+        }}
+
+    return {'airport': {'pluginData': {
+        'details': {'timezone': {'name': 'America/Los_Angeles'}, 'delayIndex': {'arrivals': 1.2, 'departures': 0.8}},
+        'schedule': {
+            'arrivals': {'data': [flight(i, 'arrival') for i in range(rows)]},
+            'departures': {'data': [flight(i, 'departure') for i in range(rows)]},
+        },
+        'weather': None,
+    }}}
+
+
+def synthetic_flight(points, seed=0):
+    """
+    Build a detailed flight with a trail of points crossing the antimeridian (HND to SEA).
+    """
+    rng = random.Random(seed)
+    origin, destination = (35.55, 139.78), (47.45, -122.31)
+    trail = []
+    for i in range(points):
+        t = 1 - i / max(points - 1, 1)
+        lng = origin[1] + t * (destination[1] + 360 - origin[1])
+        trail.append({
+            'lat': origin[0] + t * (destination[0] - origin[0]) + rng.uniform(-0.01, 0.01),
+            'lng': lng - 360 if lng > 180 else lng,
+            'alt': 35000, 'spd': 480, 'ts': 1_900_000_000 - i * 10, 'hd': 60,
+        })
+    return SimpleNamespace(
+        trail=trail, callsign='ANA178', registration='JA876A', altitude=35000, ground_speed=480, heading=60,
+        status_icon='green',
+        origin_airport_iata='HND', origin_airport_name='Tokyo Haneda Airport',
+        origin_airport_latitude=origin[0], origin_airport_longitude=origin[1],
+        origin_airport_terminal='3', origin_airport_gate='110', origin_airport_timezone_name='Asia/Tokyo',
+        destination_airport_iata='SEA', destination_airport_name='Seattle Tacoma International Airport',
+        destination_airport_latitude=destination[0], destination_airport_longitude=destination[1],
+        destination_airport_terminal='S', destination_airport_gate='N/A', destination_airport_timezone_name='America/Los_Angeles',
+    )
+
+
+def render_flight_map(flight, tolerance_px=fr24.TRAIL_TOLERANCE_PX):
+    return fr24.get_flight_map(session={'flight': flight}, tolerance_px=tolerance_px).get_root().render()
+
+
+def export_file(data, fmt, compress=False, records=None):
+    export.remove_file(export.export(data, fmt, compress, records=records, name='benchmark'))
+
+
+def build_cases(scale):
+    offers = load_fixture('tests/SEA-JFK.txt')
+    routes = load_fixture('tests/SEA.txt')
+    big_offer_list = synthetic_offers(offers, 200 * scale)
+    big_offers = json.dumps(big_offer_list)
+    big_routes = synthetic_routes(routes, 20 * scale)
+    small_board, big_board = synthetic_board(100), synthetic_board(50 * scale)
+    routes_df = pd.DataFrame(search.print_airport_routes(json.dumps(routes)), columns=ROUTE_COLUMNS)
+    big_routes_df = pd.DataFrame(search.print_airport_routes(json.dumps(big_routes)), columns=ROUTE_COLUMNS)
+    short_trail, long_trail = synthetic_flight(200), synthetic_flight(50 * scale)
+    offers_json = json.dumps(offers)
+    routes_json = json.dumps(routes)
+    big_routes_json = json.dumps(big_routes)
+    history = PriceHistory(None)
+    history.ingest('SEA', 'JFK', '2030-01-01', 1, big_offer_list)
+
+    # name -> (function, number of items processed per call)
+    return {
+        'print_cheapest_flights[fixture]': (lambda: search.print_cheapest_flights(offers_json), len(offers)),
+        'print_cheapest_flights[synthetic]': (lambda: search.print_cheapest_flights(big_offers), 200 * scale),
+        'print_airport_routes[fixture]': (lambda: search.print_airport_routes(routes_json), len(routes)),
+        'print_airport_routes[synthetic]': (lambda: search.print_airport_routes(big_routes_json), len(big_routes)),
+        'airport_dep_board[100]': (lambda: fr24.airport_dep_board(small_board), 100),
+        'airport_arr_board[100]': (lambda: fr24.airport_arr_board(small_board), 100),
+        'airport_dep_board[synthetic]': (lambda: fr24.airport_dep_board(big_board), 50 * scale),
+        'airport_arr_board[synthetic]': (lambda: fr24.airport_arr_board(big_board), 50 * scale),
+        'create_airport_map[fixture]': (lambda: create_airport_map(routes_df).get_root().render(), len(routes_df)),
+        'create_airport_map[synthetic]': (lambda: create_airport_map(big_routes_df).get_root().render(), len(big_routes_df)),
+        'create_airport_map[synthetic,lines]': (lambda: create_airport_map(big_routes_df, origin=SEA).get_root().render(), len(big_routes_df)),
+        'get_flight_map[200]': (lambda: render_flight_map(short_trail), 200),
+        'get_flight_map[synthetic]': (lambda: render_flight_map(long_trail), 50 * scale),
+        'get_flight_map[synthetic,full]': (lambda: render_flight_map(long_trail, tolerance_px=0), 50 * scale),
+        'export[json,synthetic]': (lambda: export_file(big_offer_list, 'json'), 200 * scale),
+        'export[ndjson,synthetic]': (lambda: export_file(big_offer_list, 'ndjson', records=lambda: segment_records(big_offer_list)), 200 * scale),
+        'export[csv.gz,synthetic]': (lambda: export_file(big_offer_list, 'csv', True, records=lambda: segment_records(big_offer_list)), 200 * scale),
+        'price_history.ingest[synthetic]': (lambda: history.ingest('SEA', 'JFK', '2030-01-01', 1, big_offer_list), 200 * scale),
+        'price_history.trend': (lambda: history.trend('SEA', 'JFK', '2030-01-01'), 1),
+    }
+
+
+def percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def run_case(fn, items, repeat, warmup=1):
+    output = None
+    for _ in range(warmup):
+        output = fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50 = statistics.median(timings)
+    return {
+        'items': items,
+        'p50_ms': p50 * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'throughput_per_s': items / p50 if p50 else float('inf'),
+        'peak_mem_kb': peak / 1024,
+        # Size of the rendered HTML for the map cases
+        'payload_kb': len(output.encode('utf-8')) / 1024 if isinstance(output, str) else None,
+    }
+
+
+def format_kb(kb):
+    return '-' if kb is None else f"{kb:.0f}"
+
+
+def compare(results, baseline, threshold):
+    """
+    Return the cases whose median latency regressed past threshold relative to baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and baseline[name]['p50_ms'] > 0:
+            ratio = result['p50_ms'] / baseline[name]['p50_ms']
+            if ratio > 1 + threshold:
+                regressions.append((name, baseline[name]['p50_ms'], result['p50_ms'], ratio))
+    return regressions
+
+
+def time_import(module: str) -> float:
+    """
+    Return the seconds a fresh interpreter takes to import a module of the app.
+    """
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def time_first_response() -> float:
+    """
+    Return the seconds from launching app.py until its UI page answers, with the warm-up disabled
+    so that the run does not depend on the network.
+    """
+    port = free_port()
+    env = dict(os.environ, GRADIO_SERVER_NAME='127.0.0.1', GRADIO_SERVER_PORT=str(port), FLIGHT_SEARCHER_WARM_UP='0')
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'app.py'], cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        while time.perf_counter() - start < STARTUP_TIMEOUT:
+            if process.poll() is not None:
+                raise RuntimeError(f"app.py exited with code {process.returncode}: {process.stderr.read().decode(errors='replace')[-2000:]}")
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=5) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError(f"app.py did not answer within {STARTUP_TIMEOUT} s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def build_startup_cases() -> dict:
+    cases = {f'import[{module}]': (lambda module=module: time_import(module)) for module in STARTUP_MODULES}
+    cases['first_response[app]'] = time_first_response
+    return cases
+
+
+def run_startup_case(fn, repeat):
+    """
+    Run a startup case repeat times; each run measures itself in its own process, so there is no warm-up
+    and no memory tracing.
+    """
+    timings = [fn() for _ in range(repeat)]
+    p50 = statistics.median(timings)
+    return {
+        'items': 1,
+        'p50_ms': p50 * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'throughput_per_s': 1 / p50 if p50 else float('inf'),
+        'peak_mem_kb': None,
+        'payload_kb': None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for Flight Searcher hot paths.")
+    parser.add_argument('--scale', type=int, default=50, help="Synthetic scale factor (50 gives 10k offers, 2.5k board rows, 2.5k trail points)")
+    parser.add_argument('--repeat', type=int, default=10, help="Timed runs per case")
+    parser.add_argument('--only', default='', help="Only run cases whose name contains this text")
+    parser.add_argument('--baseline', default=None, help="Baseline JSON file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed median slowdown before failing (0.25 = 25%%)")
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, default=None, help="Write results to this baseline file")
+    parser.add_argument('--startup', action='store_true', help="Measure import time and time to first response in fresh processes instead")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        cases = {name: (fn, 1) for name, fn in build_startup_cases().items()}
+    else:
+        cases = build_cases(args.scale)
+    results = {}
+    print(f"{'case':<36} {'items':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'items/s':>11} {'peak KB':>9} {'HTML KB':>9}")
+    for name, (fn, items) in cases.items():
+        if args.only not in name:
+            continue
+        result = results[name] = run_startup_case(fn, args.repeat) if args.startup else run_case(fn, items, args.repeat)
+        print(f"{name:<36} {items:>7} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['throughput_per_s']:>11.0f} {format_kb(result['peak_mem_kb']):>9} {format_kb(result['payload_kb']):>9}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after, ratio in regressions:
+            print(f"REGRESSION {name}: {before:.2f} ms -> {after:.2f} ms ({ratio:.2f}x)")
+        if regressions:
+            return 1
+        print(f"No regressions past {args.threshold:.0%}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
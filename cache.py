@@ -0,0 +1,262 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe cache with a per-entry time-to-live, a bounded LRU memory tier
+    and an optional on-disk tier that survives restarts. Expired and evicted entries are kept in a
+    bounded memory tier of their own, and expired entries stay on disk until they are replaced, so
+    get_stale() can serve them while the upstream is unavailable.
+    name: Name of the cache, used for the on-disk subdirectory
+    ttl: Time-to-live of an entry in seconds
+    maxsize: Maximum number of entries held in memory
+    disk_dir: Directory for the on-disk tier, or None to keep entries in memory only
+    """
+    def __init__(self, name: str, ttl: float, maxsize: int = 256, disk_dir: str = None):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.disk_dir = os.path.join(disk_dir, name) if disk_dir else None
+        self._data = OrderedDict()
+        self._stale = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'stale_hits': 0}
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """
+        Build a cache key from normalized query parameters.
+        """
+        return json.dumps(parts, separators=(',', ':'), default=str)
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for key, or default if it is missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._data.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return value
+                del self._data[key]
+                self._keep_stale(key, entry)
+                self.stats['expirations'] += 1
+
+        if self.disk_dir:
+            entry = self._read_disk(key)
+            if entry is not None and entry['expires'] > now:
+                with self._lock:
+                    self.stats['disk_hits'] += 1
+                    self._store(key, entry['expires'], entry['value'])
+                return entry['value']
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return default
+
+    def get_stale(self, key, default=None, max_stale: float = None):
+        """
+        Return the value for key even if it has expired or was evicted, or default if it is neither
+        held in memory nor on disk.
+        max_stale: Seconds past expiry after which an entry is no longer served (None for any age)
+        """
+        with self._lock:
+            entry = self._data.get(key) or self._stale.get(key)
+        if entry is None and self.disk_dir:
+            # Entries from before a restart, or evicted from memory, are only on disk
+            record = self._read_disk(key)
+            if record is not None:
+                entry = (record['expires'], record['value'])
+        if entry is None or (max_stale is not None and entry[0] + max_stale < time.time()):
+            return default
+        with self._lock:
+            self.stats['stale_hits'] += 1
+        return entry[1]
+
+    def _keep_stale(self, key, entry):
+        self._stale[key] = entry
+        self._stale.move_to_end(key)
+        while len(self._stale) > self.maxsize:
+            self._stale.popitem(last=False)
+
+    def set(self, key, value, ttl: float = None):
+        """
+        Store value under key for ttl seconds (defaults to the cache TTL).
+        """
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store(key, expires, value)
+        if self.disk_dir:
+            self._write_disk(key, expires, value)
+
+    def _store(self, key, expires, value):
+        self._stale.pop(key, None)
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._keep_stale(*self._data.popitem(last=False))
+            self.stats['evictions'] += 1
+
+    def _read_disk(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            return entry if entry.get('key') == key else None
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, expires, value):
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'expires': expires, 'value': value}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Could not write {self.name} cache entry to disk: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._stale.clear()
+        if self.disk_dir:
+            for filename in os.listdir(self.disk_dir):
+                if filename.endswith('.json'):
+                    os.remove(os.path.join(self.disk_dir, filename))
+
+    def __len__(self):
+        return len(self._data)
+
+    def info(self):
+        """
+        Return the hit/miss/eviction counters together with the current size.
+        """
+        with self._lock:
+            stats = dict(self.stats, size=len(self._data), maxsize=self.maxsize, ttl=self.ttl)
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one execution.
+    While a call for a key is in flight, other callers wait for and share its result.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'coalesced': 0}
+
+    def do(self, key, fn):
+        """
+        Run fn() for key, or wait for the call already in flight for key and return its result.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats['calls'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def do_in_background(self, key, fn):
+        """
+        Start fn() for key on a daemon thread unless a call for key is already in flight.
+        Returns True if a new call was started.
+        """
+        with self._lock:
+            if key in self._calls:
+                return False
+        threading.Thread(target=self._run_quietly, args=(key, fn), daemon=True).start()
+        return True
+
+    def _run_quietly(self, key, fn):
+        try:
+            self.do(key, fn)
+        except Exception as e:
+            print(f"Background refresh of {key} failed: {e}")
+
+
+class AsyncSingleFlight:
+    """
+    Coalesce concurrent coroutine calls for the same key into one task (asyncio counterpart of SingleFlight).
+    """
+    def __init__(self):
+        self._tasks = {}
+        self.stats = {'calls': 0, 'coalesced': 0}
+
+    def _start(self, key, fn):
+        task = self._tasks[key] = asyncio.ensure_future(fn())
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        self.stats['calls'] += 1
+        return task
+
+    async def do(self, key, fn):
+        """
+        Await fn() for key, or the call already in flight for key, and return its result.
+        fn: Coroutine function
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._start(key, fn)
+        else:
+            self.stats['coalesced'] += 1
+        # A caller that is cancelled must not cancel the call other callers are waiting for
+        return await asyncio.shield(task)
+
+    def do_in_background(self, key, fn):
+        """
+        Start fn() for key as a task unless a call for key is already in flight.
+        Returns True if a new call was started.
+        """
+        if key in self._tasks:
+            return False
+        self._start(key, fn).add_done_callback(lambda task: self._report(key, task))
+        return True
+
+    def _report(self, key, task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Background refresh of {key} failed: {task.exception()}")
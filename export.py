@@ -0,0 +1,274 @@
+"""
+Streaming export of search results to JSON, NDJSON, CSV and Parquet files.
+
+Results are serialized only when an export is requested, straight from the parsed data kept in the
+session: JSON and NDJSON are encoded record by record, CSV rows are written one at a time and Parquet
+is written in row groups of CHUNK_ROWS, so memory stays flat for large result sets. JSON, NDJSON and
+CSV can be gzip-compressed. Parquet needs the optional pyarrow package, imported on the first Parquet export.
+
+Export files are written to EXPORT_DIR; a session's previous file for the same page is deleted when it
+exports again, files older than EXPORT_TTL are swept on every export, and the process removes the
+files it wrote on exit.
+"""
+import os
+import csv
+import gzip
+import json
+import time
+import atexit
+import tempfile
+import threading
+import importlib.util
+
+EXPORT_DIR = os.environ.get('FLIGHT_SEARCHER_EXPORT_DIR') or os.path.join(tempfile.gettempdir(), 'flight_searcher_exports')
+# Seconds an export file is kept for download before it is swept
+EXPORT_TTL = 60 * 60
+# Rows per Parquet row group, and per batch of rows held in memory while writing one
+CHUNK_ROWS = 2000
+FORMATS = ('json', 'ndjson', 'csv', 'parquet')
+FORMAT_LABELS = {'JSON': 'json', 'NDJSON': 'ndjson', 'CSV': 'csv', 'Parquet': 'parquet'}
+
+_written = set()
+_lock = threading.Lock()
+
+
+def flatten(record, prefix: str = '') -> dict:
+    """
+    Flatten nested dicts into one level with dotted keys, e.g. {"price": {"total": 1}} -> {"price.total": 1}.
+    Lists are kept as JSON strings so every value fits a table cell.
+    """
+    flat = {}
+    for key, value in record.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (list, tuple)):
+            flat[name] = json.dumps(value, ensure_ascii=False)
+        else:
+            flat[name] = value
+    return flat
+
+
+def table_schema(records):
+    """
+    Scan flattened records once for their columns (in first-seen order) and a value type per column:
+    bool, int, float or str (mixed or non-scalar columns are str).
+    records: Callable returning a fresh iterator of flattened records
+    """
+    types = {}
+    for record in records():
+        for key, value in record.items():
+            if value is None:
+                types.setdefault(key, None)
+                continue
+            kind = type(value) if isinstance(value, (bool, int, float)) else str
+            seen = types.get(key)
+            if seen is None or seen is kind:
+                types[key] = kind
+            elif {seen, kind} == {int, float}:
+                types[key] = float
+            else:
+                types[key] = str
+    return {key: kind or str for key, kind in types.items()}
+
+
+def _open_text(path: str, compress: bool, newline=None):
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline=newline)
+    return open(path, 'w', encoding='utf-8', newline=newline)
+
+
+def write_json(path: str, document, compress: bool = False):
+    """
+    Write a document as compact JSON. A list is written one item at a time, each encoded by the C encoder
+    (json.dump and indentation fall back to the pure-Python one), so large results stay fast without being
+    built as one string.
+    """
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    with _open_text(path, compress) as f:
+        if not isinstance(document, list):
+            f.write(encode(document))
+            return
+        f.write('[')
+        for index, item in enumerate(document):
+            if index:
+                f.write(',')
+            f.write(encode(item))
+        f.write(']')
+
+
+def write_ndjson(path: str, records, compress: bool = False):
+    """
+    Write one compact JSON object per line.
+    """
+    with _open_text(path, compress) as f:
+        for record in records():
+            f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+            f.write('\n')
+
+
+def write_csv(path: str, records, compress: bool = False):
+    """
+    Write flattened records as CSV, with the union of all columns as header.
+    """
+    columns = list(table_schema(records))
+    with _open_text(path, compress, newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        for record in records():
+            writer.writerow(record)
+
+
+def write_parquet(path: str, records, compress: bool = False, schema=None):
+    """
+    Write flattened records as Parquet in row groups of CHUNK_ROWS rows (snappy, or zstd when compress is set).
+    schema: Arrow schema to write instead of the one scanned from records, e.g. that of the first part of a
+            dataset, so every part has the same columns and types: missing columns are written as nulls,
+            columns it lacks are dropped, and values are converted to its types (null when they do not convert)
+    Returns the Arrow schema written.
+    """
+    pa, pq = _pyarrow()
+    arrow_types = {bool: pa.bool_(), int: pa.int64(), float: pa.float64(), str: pa.string()}
+    if schema is None:
+        types = table_schema(records)
+        schema = pa.schema([(key, arrow_types[kind]) for key, kind in types.items()])
+    else:
+        kinds = {arrow_type: kind for kind, arrow_type in arrow_types.items()}
+        types = {field.name: kinds[field.type] for field in schema}
+
+    with pq.ParquetWriter(path, schema, compression='zstd' if compress else 'snappy') as writer:
+        chunk = []
+        for record in records():
+            chunk.append(record)
+            if len(chunk) == CHUNK_ROWS:
+                writer.write_table(_arrow_chunk(pa, chunk, types, schema))
+                chunk = []
+        if chunk or not types:
+            writer.write_table(_arrow_chunk(pa, chunk, types, schema))
+    return schema
+
+
+def parquet_schema(path: str):
+    """
+    Return the Arrow schema of a Parquet file.
+    """
+    _, pq = _pyarrow()
+    return pq.read_schema(path)
+
+
+def parquet_available() -> bool:
+    """
+    Return whether pyarrow is installed, without importing it.
+    """
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow).") from None
+    return pyarrow, pyarrow.parquet
+
+
+def _cell(value, kind):
+    if value is None or type(value) is kind:
+        return value
+    if kind is str:
+        return str(value)
+    if kind is float and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if kind is int and isinstance(value, float) and value.is_integer():
+        return int(value)
+    # Only with a given schema: a value that does not fit the column's type is left out
+    return None
+
+
+def _arrow_chunk(pa, chunk, types, schema):
+    columns = {key: [_cell(record.get(key), kind) for record in chunk] for key, kind in types.items()}
+    return pa.Table.from_pydict(columns, schema=schema)
+
+
+def export_path(fmt: str, compress: bool = False, name: str = 'export') -> str:
+    suffix = {'json': '.json', 'ndjson': '.ndjson', 'csv': '.csv', 'parquet': '.parquet'}[fmt]
+    if compress and fmt != 'parquet':
+        suffix += '.gz'
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=f"{name}-", suffix=suffix, dir=EXPORT_DIR)
+    os.close(fd)
+    return path
+
+
+def remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    with _lock:
+        _written.discard(path)
+
+
+def sweep(max_age: float = EXPORT_TTL):
+    """
+    Delete export files older than max_age seconds.
+    """
+    now = time.time()
+    try:
+        entries = list(os.scandir(EXPORT_DIR))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and now - entry.stat().st_mtime > max_age:
+                remove_file(entry.path)
+        except OSError:
+            continue
+
+
+@atexit.register
+def _remove_written():
+    for path in list(_written):
+        remove_file(path)
+
+
+def export(document, fmt: str = 'json', compress: bool = False, records=None, name: str = 'export', session: dict = None) -> str:
+    """
+    Write a result to a new export file and return its path.
+    document: Parsed result written as is by the JSON format
+    fmt: One of FORMATS
+    compress: gzip JSON/NDJSON/CSV, or use zstd instead of snappy for Parquet
+    records: Callable returning a fresh iterator of records for the NDJSON, CSV and Parquet formats
+             (CSV and Parquet flatten them); defaults to the items of a list document or the document itself
+    name: File name prefix, also the key of the session's previous export that this one replaces
+    session: Per-user state dict that remembers the last export file per name
+    """
+    fmt = fmt.lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}, expected one of {', '.join(FORMATS)}.")
+    if records is None:
+        records = (lambda: iter(document)) if isinstance(document, list) else (lambda: iter([document]))
+    sweep()
+
+    path = export_path(fmt, compress, name)
+    with _lock:
+        _written.add(path)
+    try:
+        if fmt == 'json':
+            write_json(path, document, compress)
+        elif fmt == 'ndjson':
+            write_ndjson(path, records, compress)
+        else:
+            flat = lambda: (flatten(record) for record in records())
+            (write_csv if fmt == 'csv' else write_parquet)(path, flat, compress)
+    except BaseException:
+        remove_file(path)
+        raise
+
+    if session is not None:
+        exports = session.setdefault('exports', {})
+        previous = exports.get(name)
+        if previous and previous != path:
+            remove_file(previous)
+        exports[name] = path
+    return path
@@ -0,0 +1,173 @@
+import copy
+import time
+import bisect
+import difflib
+import threading
+from itertools import islice
+
+from cache import SingleFlight
+
+# Summary attributes of a live flight that identify it, as typed by users
+INDEX_FIELDS = ('registration', 'callsign', 'number', 'icao_24bit')
+
+
+def index_keys(flight):
+    """
+    Return the normalized lookup keys of a live flight summary (registration, callsign, flight number, ICAO24).
+    Registrations are also indexed without their dash, so "GEUUA" finds "G-EUUA".
+    """
+    keys = set()
+    for field in INDEX_FIELDS:
+        value = getattr(flight, field, None)
+        if not value or value == 'N/A':
+            continue
+        value = str(value).strip().upper()
+        keys.add(value)
+        if '-' in value:
+            keys.add(value.replace('-', ''))
+    return keys
+
+
+class FlightIndex:
+    """
+    In-memory index from flight identifiers to live flight summaries, rebuilt from bulk snapshots.
+    Exact lookups are one dict access; prefix matches bisect a sorted key list and fuzzy matches
+    (suggestions only) compare against the keys sharing the first character.
+    The indexed summaries are shared by every session, so lookups return copies for callers to fill
+    with set_flight_details.
+    The index is refreshed in the background once it is older than refresh_interval seconds, and
+    lookups never wait for a refresh: until the first snapshot is in, every lookup is a miss.
+    fetch: Callable returning the current list of live flight summaries
+    refresh_interval: Seconds a snapshot is used before it is refreshed (0 disables the index)
+    """
+    def __init__(self, fetch, refresh_interval: float = 60):
+        self.fetch = fetch
+        self.refresh_interval = refresh_interval
+        self._by_key = {}
+        self._keys = []
+        self._built_at = None
+        self._attempted_at = None
+        self._refresh = SingleFlight()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'prefix_hits': 0, 'misses': 0, 'refreshes': 0, 'errors': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.refresh_interval > 0
+
+    def age(self):
+        """
+        Seconds since the current snapshot was built, or None before the first one.
+        """
+        return None if self._built_at is None else time.monotonic() - self._built_at
+
+    def refresh(self):
+        """
+        Fetch a snapshot and swap it in. Returns the number of indexed flights.
+        """
+        by_key = {}
+        for flight in self.fetch():
+            for key in index_keys(flight):
+                by_key.setdefault(key, flight)
+        keys = sorted(by_key)
+        with self._lock:
+            self._by_key, self._keys, self._built_at = by_key, keys, time.monotonic()
+            self.stats['refreshes'] += 1
+        return len({id(flight) for flight in by_key.values()})
+
+    def _safe_refresh(self):
+        try:
+            return self.refresh()
+        except Exception:
+            with self._lock:
+                self.stats['errors'] += 1
+            raise
+
+    def ensure_fresh(self):
+        """
+        Start a background refresh when there is no snapshot yet or the current one is too old.
+        After a failed refresh the next attempt waits for another refresh_interval.
+        """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        # Start at most one snapshot per interval, so a failing upstream is not retried on every lookup
+        if self._attempted_at is not None and now - self._attempted_at < self.refresh_interval:
+            return
+        age = self.age()
+        if age is None or age > self.refresh_interval:
+            self._attempted_at = now
+            self._refresh.do_in_background('snapshot', self._safe_refresh)
+
+    def lookup(self, identifier: str):
+        """
+        Return a copy of the live flight whose registration, callsign, flight number or ICAO24 equals
+        identifier, or None.
+        """
+        self.ensure_fresh()
+        flight = self._by_key.get(identifier.strip().upper())
+        with self._lock:
+            self.stats['hits' if flight is not None else 'misses'] += 1
+        return copy.copy(flight)
+
+    def match(self, identifier: str, limit: int = 10, cutoff: float = 0.8, fuzzy: bool = True):
+        """
+        Return up to limit (key, flight) candidates for a partial identifier: keys starting with it first,
+        then, if fuzzy and nothing starts with it, close matches (e.g. a mistyped character).
+        The flights are the shared index objects; copy them before modifying.
+        """
+        self.ensure_fresh()
+        prefix = identifier.strip().upper()
+        by_key, keys = self._by_key, self._keys
+        if not prefix or not keys:
+            return []
+        start = bisect.bisect_left(keys, prefix)
+        matches = []
+        for key in islice(keys, start, None):
+            if not key.startswith(prefix) or len(matches) == limit:
+                break
+            matches.append(key)
+        if not matches and fuzzy:
+            matches = difflib.get_close_matches(prefix, self._fuzzy_candidates(keys, prefix), n=limit, cutoff=cutoff)
+        return [(key, by_key[key]) for key in matches]
+
+    @staticmethod
+    def _fuzzy_candidates(keys, prefix):
+        # Only compare against keys sharing the first character and of a similar length, a small slice
+        # of the index instead of every key
+        start = bisect.bisect_left(keys, prefix[0])
+        end = bisect.bisect_left(keys, chr(ord(prefix[0]) + 1), start)
+        return [key for key in islice(keys, start, end) if abs(len(key) - len(prefix)) <= 2]
+
+    def resolve_prefix(self, identifier: str):
+        """
+        Return a copy of the only live flight with an identifier starting with identifier, or None when
+        there is no such flight or several.
+        """
+        candidates = {id(flight): flight for _, flight in self.match(identifier, fuzzy=False)}
+        if len(candidates) != 1:
+            return None
+        with self._lock:
+            self.stats['prefix_hits'] += 1
+        return copy.copy(next(iter(candidates.values())))
+
+    def suggest(self, identifier: str, limit: int = 5):
+        """
+        Return up to limit distinct identifiers of live flights resembling identifier, for "did you mean" hints.
+        """
+        seen, suggestions = set(), []
+        for key, flight in self.match(identifier, limit=limit * 4):
+            if id(flight) not in seen:
+                seen.add(id(flight))
+                suggestions.append(key)
+        return suggestions[:limit]
+
+    def info(self) -> dict:
+        """
+        Return the index size, snapshot age and lookup counters.
+        """
+        with self._lock:
+            info = dict(self.stats)
+            info['keys'] = len(self._by_key)
+        info['age'] = self.age()
+        return info
@@ -1,345 +1,1089 @@
-import re
-import json
-import datetime
-import folium
-from collections import deque
-from folium.plugins import AntPath
-from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
-from FlightRadar24 import FlightRadar24API
-
-fr_api = FlightRadar24API()
-cached_fr24_results = ['', '']
-cached_flight = deque(maxlen=1)
-
-def get_local_time(airport_details=None, timezone_name=None):
-    """
-    Get the current local time for a given airport.
-    airport_details: JSON object containing airport details from FlightRadar24 API
-    timezone_name: Optional timezone name to use if not provided in airport_details.
-    If neither is provided, returns "Not available".
-    """
-    if not airport_details and not timezone_name:
-        return "Not available"
-    
-    try:
-        if not timezone_name:
-            timezone_name = airport_details['airport']['pluginData']['details']['timezone']['name']
-        tz = ZoneInfo(timezone_name)
-        local_time = datetime.datetime.now(tz)
-        return local_time.strftime('%m-%d-%Y %I:%M%p')
-    except (KeyError, ZoneInfoNotFoundError):
-        return "Timezone not available"
-
-def remove_parentheses(text):
-    """
-    Remove text within parentheses and the parentheses themselves from a string.
-    """
-    return re.sub(r'\s*\(.*?\)', '', text).strip()
-
-def convert_time_in_string(text: str) -> str:
-    """
-    Finds a 24-hour time (HH:MM) in a string and converts it to 12-hour format (e.g., 05:05PM).
-    If no time is found, the original string is returned.
-
-    Args:
-        text: The input string, which may or may not contain a time.
-              e.g., "Delayed 17:05", "Landed 09:30", "On time"
-
-    Returns:
-        The string with the time converted, or the original string.
-    """
-    # This regex finds a pattern of one or two digits, a colon, and two digits.
-    # It's designed to match HH:MM or H:MM.
-    time_pattern = re.compile(r'\b(\d{1,2}):(\d{2})\b')
-
-    # The `sub` function finds the pattern and calls the lambda for each match.
-    def replacer(match):
-        time_str = match.group(0)  # The full matched string, e.g., "17:05"
-        try:
-            # Parse the found time string
-            t = datetime.datetime.strptime(time_str, '%H:%M').time()
-            # Format it to 12-hour format, e.g., "05:05PM"
-            formatted_time = t.strftime('%I:%M%p')
-
-            return formatted_time
-        except ValueError:
-            # If strptime fails (e.g., for "99:99"), return the original match
-            return time_str
-
-    return time_pattern.sub(replacer, text)
-
-def get_airport_details(airport_code):
-    try:
-        airport_details = fr_api.get_airport_details(airport_code)
-        cached_fr24_results[0] = json.dumps(airport_details, indent=2)
-        return airport_details
-    except Exception as e:
-        print(f"The IATA / ICAO Code is invalid: {e}")
-        return None
-
-def airport_dep_board(airport_details):
-    """
-    Get the departure board for a given airport.
-    airport_details: JSON object containing airport details from FlightRadar24 API"""
-    if airport_details is None:
-        return []
-    
-    try:
-        timezone_name = airport_details['airport']['pluginData']['details']['timezone']['name']
-        tz = ZoneInfo(timezone_name)
-    except (KeyError, ZoneInfoNotFoundError):
-        tz = None
-
-    departures = airport_details['airport']['pluginData']['schedule']['departures']['data']
-    if not departures:
-        print("No departures found for this airport.")
-        return []
-    
-    # Build a flat list of rows with departure details
-    rows = []
-    for dep_flight in departures:
-        flight = dep_flight['flight']['identification']['number']['default'] if dep_flight['flight']['identification']['number']['default'] else ''
-        airline = remove_parentheses(dep_flight['flight']['airline']['name']) if dep_flight['flight']['airline'] else ''
-        destination_iata = dep_flight['flight']['airport']['destination']['code']['iata']
-        # destination_name = dep_flight['flight']['airport']['destination']['name']
-        destination_city = dep_flight['flight']['airport']['destination']['position']['region']['city']
-        scheduled_departure = datetime.datetime.fromtimestamp(dep_flight['flight']['time']['scheduled']['departure'], tz=tz).strftime('%m-%d-%Y %I:%M%p')
-        status = convert_time_in_string(dep_flight['flight']['status']['text'])
-        terminal = dep_flight['flight']['airport']['origin']['info']['terminal'] if dep_flight['flight']['airport']['origin']['info']['terminal'] else ''
-        gate = dep_flight['flight']['airport']['origin']['info']['gate'] if dep_flight['flight']['airport']['origin']['info']['gate'] else ''
-
-        # Append the flight details to the rows list
-        rows.append([
-            destination_iata,
-            destination_city,
-            airline,
-            flight,
-            scheduled_departure,
-            status,
-            terminal,
-            gate
-        ])
-
-    return rows
-
-def airport_arr_board(airport_details):
-    """
-    Get the arrival board for a given airport.
-    airport_details: JSON object containing airport details from FlightRadar24 API
-    """
-    if airport_details is None:
-        return []
-    
-    try:
-        timezone_name = airport_details['airport']['pluginData']['details']['timezone']['name']
-        tz = ZoneInfo(timezone_name)
-    except (KeyError, ZoneInfoNotFoundError):
-        tz = None
-    
-    arrivals = airport_details['airport']['pluginData']['schedule']['arrivals']['data']
-    if not arrivals:
-        print("No arrivals found for this airport.")
-        return []
-    
-    # Build a flat list of rows with arrival details
-    rows = []
-    for arr_flight in arrivals:
-        flight = arr_flight['flight']['identification']['number']['default'] if arr_flight['flight']['identification']['number']['default'] else ''
-        airline = remove_parentheses(arr_flight['flight']['airline']['name']) if arr_flight['flight']['airline'] else ''
-        origin_iata = arr_flight['flight']['airport']['origin']['code']['iata']
-        # origin_name = arr_flight['flight']['airport']['origin']['name']
-        origin_city = arr_flight['flight']['airport']['origin']['position']['region']['city']
-        scheduled_arrival = datetime.datetime.fromtimestamp(arr_flight['flight']['time']['scheduled']['arrival'], tz=tz).strftime('%m-%d-%Y %I:%M%p')
-        status = convert_time_in_string(arr_flight['flight']['status']['text'])
-        terminal = arr_flight['flight']['airport']['destination']['info']['terminal'] if arr_flight['flight']['airport']['destination']['info']['terminal'] else ''
-        gate = arr_flight['flight']['airport']['destination']['info']['gate'] if arr_flight['flight']['airport']['destination']['info']['gate'] else ''
-
-        # Append the flight details to the rows list
-        rows.append([
-            origin_iata,
-            origin_city,
-            airline,
-            flight,
-            scheduled_arrival,
-            status,
-            terminal,
-            gate
-        ])
-
-    return rows
-
-def delay_index(airport_details):
-    """
-    Get the delay index for a given airport.
-    airport_details: JSON object containing airport details from FlightRadar24 API
-    """
-    if airport_details is None:
-        return
-    
-    delay_index = airport_details['airport']['pluginData']['details']['delayIndex']
-    arrivals = delay_index['arrivals']
-    departures = delay_index['departures']
-
-    return arrivals, departures
-
-def weather(airport_details):
-    """
-    Get the weather for a given airport.
-    airport_details: JSON object containing airport details from FlightRadar24 API
-    """
-    if airport_details is None:
-        return
-    
-    weather = airport_details['airport']['pluginData']['weather']
-    if not weather:
-        print("No weather data found for this airport.")
-        return None
-    
-    temp_c = weather['temp']['celsius']
-    temp_f = weather['temp']['fahrenheit']
-    condition = weather['sky']['condition']['text']
-    humidity = weather['humidity']
-
-    wind_speed_kmh = weather['wind']['speed']['kmh']
-    wind_speed_mph = weather['wind']['speed']['mph']
-    wind_speed_text = weather['wind']['speed']['text']
-    wind_direction_degree = weather['wind']['direction']['degree']
-    wind_direction_text = weather['wind']['direction']['text']
-
-    visibility_km = weather['sky']['visibility']['km']
-    visibility_miles = weather['sky']['visibility']['mi']
-
-    return temp_c, temp_f, condition, humidity, wind_speed_kmh, wind_speed_mph, wind_speed_text, wind_direction_degree, wind_direction_text, visibility_km, visibility_miles
-
-def get_flight_status(flight_id):
-    """
-    Get the status of a flight by its ID. This function now returns the full details dictionary.
-    """
-    flight_id = flight_id.strip().upper()
-    
-    flights = fr_api.get_flights(registration=flight_id)
-
-    if not flights:
-        flight_id = fr_api.search(flight_id)['live']
-        if len(flight_id) == 0:
-            cached_flight.clear()
-            return "No live flight found."
-        
-        flight_id = flight_id[0]['label'].split(' ')[-1][1:-1]
-        flights = fr_api.get_flights(registration=flight_id)
-
-        if not flights:
-            cached_flight.clear()
-            return "No live flight found."
-
-    # Get the first flight object from the list. This is a "summary" object.
-    flight_obj = flights[0]
-    
-    try:
-        # Fetch the full details dictionary using the summary object.
-        details = fr_api.get_flight_details(flight_obj)
-        
-        # Apply the fetched details to the flight object to make it complete.
-        flight_obj.set_flight_details(details)
-        
-        # Cache the fully detailed object and the raw JSON for export.
-        cached_flight.append(flight_obj)
-        cached_fr24_results[1] = json.dumps(details, indent=2)
-
-        # For the text status, format some key info from the now-detailed object.
-        status_text = f"""
-        {flight_obj.callsign}
-        {flight_obj.registration}
-        {flight_obj.aircraft_code}
-        Origin: {flight_obj.origin_airport_name} ({flight_obj.origin_airport_iata})
-        Destination: {flight_obj.destination_airport_name} ({flight_obj.destination_airport_iata})
-        Status: {convert_time_in_string(flight_obj.status_text)}
-        """
-        return status_text.strip()
-
-    except Exception as e:
-        print(f"Error fetching details for {flight_obj.id}: {e}")
-        cached_flight.clear()
-        return f"Could not retrieve details for flight {flight_id}."
-
-def get_flight_map():
-    flight = cached_flight[0] if cached_flight else None
-
-    if not flight:
-        return folium.Map(location=[0, 0], zoom_start=1)
-    
-    # The flight object in the cache is now fully detailed.
-    # We can directly check for the 'trail' attribute.
-    if not hasattr(flight, 'trail') or not flight.trail:
-        print("Flight object has no trail data.")
-        return folium.Map(location=[0, 0], zoom_start=1)
-    
-    # 1. Determine the longitude offset needed to prevent map wrapping.
-    origin_lon = flight.origin_airport_longitude
-    destination_lon = flight.destination_airport_longitude
-
-    lon_diff = destination_lon - origin_lon
-
-    # 2. Apply the calculated offset to all points in the trail.
-    offset = 0
-    if lon_diff > 180:
-        offset = -360
-    elif lon_diff < -180:
-        offset = 360
-    
-    trail_coordinates = [(point['lat'], point['lng'] + offset * ((1 if point['lng'] >= 0 else 0) if offset == -360 else (1 if point['lng'] <= 0 else 0))) for point in flight.trail]
-
-    # 3. Create the flight map with the adjusted trail coordinates.
-    # print(f"offset: {offset} for {flight.callsign or flight.registration}")
-
-    current_position = (trail_coordinates[0][0], trail_coordinates[0][1])
-    
-    flight_map = folium.Map(location=current_position, zoom_start=6, tiles="CartoDB positron")
-
-    AntPath(locations=trail_coordinates, color='blue', weight=2.5, delay=800, dash_array=[10, 20]).add_to(flight_map)
-
-    # Aircraft popup information
-    aircraft_popup = f"""
-    <b>{flight.callsign or flight.registration}</b><br>
-    Altitude: {flight.altitude} ft<br>
-    Speed: {flight.ground_speed} kts<br>
-    Heading: {flight.heading}°
-    """
-
-    # Create a plane icon with rotation based on the flight's heading
-    plane_color = flight.status_icon if flight.status_icon else 'black'
-    icon_html = f"""
-    <div style="transform: rotate({flight.heading}deg);">
-        <i class="fa-solid fa-plane-up" style="font-size:20px; color:{plane_color}; -webkit-text-stroke: 1px black;"></i>
-    </div>
-    """
-    plane_icon = folium.DivIcon(html=icon_html)
-
-    folium.Marker(
-        location=current_position,
-        popup=folium.Popup(aircraft_popup, max_width=300),
-        icon=plane_icon
-    ).add_to(flight_map)
-
-    # Add origin and destination markers
-    if flight.origin_airport_iata:
-        origin_popup = f"""<b>{flight.origin_airport_name} ({flight.origin_airport_iata})</b><br>
-        {"Terminal " + flight.origin_airport_terminal + " " if flight.origin_airport_terminal  != "N/A" else ''}{"Gate " + flight.origin_airport_gate if flight.origin_airport_gate != "N/A" else ''}<br>
-        Local Time: {get_local_time(timezone_name=flight.origin_airport_timezone_name)}<br>"""
-        folium.Marker(
-            location=[flight.origin_airport_latitude, flight.origin_airport_longitude],
-            popup=origin_popup,
-            icon=folium.Icon(color='green', icon='plane-departure')
-        ).add_to(flight_map)
-    
-    if flight.destination_airport_iata:
-        destination_popup = f"""<b>{flight.destination_airport_name} ({flight.destination_airport_iata})</b><br>
-        {"Terminal " + flight.destination_airport_terminal + " " if flight.destination_airport_terminal  != "N/A" else ''}{"Gate " + flight.destination_airport_gate if flight.destination_airport_gate != "N/A" else ''}<br>
-        Local Time: {get_local_time(timezone_name=flight.destination_airport_timezone_name)}<br>"""
-        folium.Marker(
-            location=[flight.destination_airport_latitude, flight.destination_airport_longitude + offset],
-            popup=destination_popup,
-            icon=folium.Icon(color='red', icon='plane-arrival')
-        ).add_to(flight_map)
-
-    return flight_map
\ No newline at end of file
+import os
+import re
+import json
+import time
+import asyncio
+import datetime
+import threading
+import dataclasses
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from session import get_session
+import metrics
+import scheduler
+from scheduler import INTERACTIVE, BACKGROUND, UpstreamUnavailable
+from cache import TTLCache, SingleFlight, AsyncSingleFlight
+from async_http import get_http
+from flight_index import FlightIndex
+from airports import add_fr24_airport, add_fr24_flight, resolve_code
+
+def use_base_url(base_url: str):
+    """
+    Route every FlightRadar24 endpoint through base_url, e.g. the local replay server.
+    https://<host>/<path> becomes <base_url>/<host>/<path>.
+    """
+    from FlightRadar24.core import Core
+    base_url = base_url.rstrip('/')
+    for name, value in list(vars(Core).items()):
+        if isinstance(value, str) and value.startswith('https://'):
+            setattr(Core, name, f"{base_url}/{value[len('https://'):]}")
+
+def _configured_base_url(path: str = 'config.json'):
+    if os.environ.get('FR24_BASE_URL'):
+        return os.environ['FR24_BASE_URL']
+    try:
+        with open(path, 'r') as f:
+            return json.load(f).get('fr24_base_url')
+    except (OSError, ValueError):
+        return None
+
+_fr_api = None
+_fr_api_lock = threading.Lock()
+
+def get_fr_api():
+    """
+    Return the shared FlightRadar24API client, creating it on first use.
+    The SDK is imported and the configured base URL applied only then, so importing this module stays cheap.
+    """
+    global _fr_api
+    if _fr_api is not None:
+        return _fr_api
+    with _fr_api_lock:
+        if _fr_api is None:
+            from FlightRadar24 import FlightRadar24API
+            base_url = _configured_base_url()
+            if base_url:
+                use_base_url(base_url)
+            _fr_api = FlightRadar24API()
+    return _fr_api
+
+def fr_core():
+    """
+    Return the SDK's endpoint and header table, with the configured base URL applied.
+    """
+    get_fr_api()
+    from FlightRadar24.core import Core
+    return Core
+
+# Seconds each component of an airport payload stays fresh. The payload is fetched as a whole,
+# so a lookup is served from cache while all of the components it asks for are fresh.
+AIRPORT_COMPONENTS = ('schedule', 'details', 'weather')
+AIRPORT_COMPONENT_TTL = {'schedule': 30, 'details': 5 * 60, 'weather': 5 * 60}
+AIRPORT_STALE_GRACE = 60
+
+airport_cache = TTLCache('airport_details', ttl=max(AIRPORT_COMPONENT_TTL.values()) + AIRPORT_STALE_GRACE, maxsize=256)
+airport_flight = SingleFlight()
+airport_stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'fetches': 0}
+_airport_stats_lock = threading.Lock()
+
+# Fleet lookups resolve identifiers concurrently; identical lookups from concurrent users share one request
+FLEET_MAX_WORKERS = 8
+FLEET_MAX_SIZE = 100
+FLEET_HEADERS = ["Query", "Callsign", "Registration", "Aircraft", "Origin", "Destination", "Altitude (ft)", "Speed (kts)", "Status"]
+flight_lookup = SingleFlight()
+# Concurrent upstream requests of one async fleet lookup
+FLEET_ASYNC_CONCURRENCY = 32
+
+# Seconds between bulk live-flight snapshots for the identifier index (0 disables it)
+FLIGHT_INDEX_REFRESH = float(os.environ.get('FR24_INDEX_REFRESH', 60))
+
+_zone_bounds = None
+
+def zone_bounds() -> list:
+    """
+    Return the bounds of every FlightRadar24 zone. The zone list is static, so it is fetched once per process.
+    """
+    global _zone_bounds
+    if _zone_bounds is None:
+        api = get_fr_api()
+        zones = scheduler.fr24.call('fr24.zones', api.get_zones, BACKGROUND)
+        _zone_bounds = [api.get_bounds(zone) for zone in zones.values()]
+    return _zone_bounds
+
+@metrics.timed('fr24.live_snapshot')
+def live_flights_snapshot():
+    """
+    Fetch the summaries of all live flights, one request per FlightRadar24 zone, deduplicated by flight id.
+    """
+    api = get_fr_api()
+    bounds = zone_bounds()
+    def zone_flights(zone):
+        return scheduler.fr24.call('fr24.get_flights', lambda: api.get_flights(bounds=zone), BACKGROUND)
+
+    with ThreadPoolExecutor(max_workers=FLEET_MAX_WORKERS) as executor:
+        snapshots = list(executor.map(zone_flights, bounds))
+    return list({flight.id: flight for snapshot in snapshots for flight in snapshot}.values())
+
+flight_index = FlightIndex(live_flights_snapshot, refresh_interval=FLIGHT_INDEX_REFRESH)
+
+def get_local_time(airport_details=None, timezone_name=None):
+    """
+    Get the current local time for a given airport.
+    airport_details: JSON object containing airport details from FlightRadar24 API
+    timezone_name: Optional timezone name to use if not provided in airport_details.
+    If neither is provided, returns "Not available".
+    """
+    if not airport_details and not timezone_name:
+        return "Not available"
+    
+    try:
+        if not timezone_name:
+            timezone_name = airport_details['airport']['pluginData']['details']['timezone']['name']
+        tz = ZoneInfo(timezone_name)
+        local_time = datetime.datetime.now(tz)
+        return local_time.strftime('%m-%d-%Y %I:%M%p')
+    except (KeyError, ZoneInfoNotFoundError):
+        return "Timezone not available"
+
+# Compiled once at import; both helpers run for every board row.
+PARENTHESES_PATTERN = re.compile(r'\s*\(.*?\)')
+# This regex finds a pattern of one or two digits, a colon, and two digits.
+# It's designed to match HH:MM or H:MM.
+TIME_PATTERN = re.compile(r'\b(\d{1,2}):(\d{2})\b')
+
+@lru_cache(maxsize=4096)
+def remove_parentheses(text):
+    """
+    Remove text within parentheses and the parentheses themselves from a string.
+    """
+    return PARENTHESES_PATTERN.sub('', text).strip()
+
+def _time_replacer(match):
+    time_str = match.group(0)  # The full matched string, e.g., "17:05"
+    try:
+        # Parse the found time string
+        t = datetime.datetime.strptime(time_str, '%H:%M').time()
+        # Format it to 12-hour format, e.g., "05:05PM"
+        return t.strftime('%I:%M%p')
+    except ValueError:
+        # If strptime fails (e.g., for "99:99"), return the original match
+        return time_str
+
+@lru_cache(maxsize=4096)
+def convert_time_in_string(text: str) -> str:
+    """
+    Finds a 24-hour time (HH:MM) in a string and converts it to 12-hour format (e.g., 05:05PM).
+    If no time is found, the original string is returned.
+
+    Args:
+        text: The input string, which may or may not contain a time.
+              e.g., "Delayed 17:05", "Landed 09:30", "On time"
+
+    Returns:
+        The string with the time converted, or the original string.
+    """
+    return TIME_PATTERN.sub(_time_replacer, text)
+
+def get_airport_details(airport_code, session: dict = None, components=AIRPORT_COMPONENTS, priority: int = INTERACTIVE):
+    """
+    Fetch the airport details payload and keep it in the session for export.
+    Payloads are cached per airport; a cached payload is used while every requested component is fresh
+    (see AIRPORT_COMPONENT_TTL), served stale for up to AIRPORT_STALE_GRACE seconds longer while it is
+    refreshed in the background, and concurrent lookups for the same airport share one upstream fetch.
+    While FlightRadar24 is unavailable, the last payload of the airport is served however old it is.
+    airport_code: IATA or ICAO code, or an airport name or city known to the airport store
+    session: Per-user state dict (defaults to the shared session)
+    components: Components of the payload the caller needs fresh ("schedule", "details", "weather")
+    priority: Scheduler priority of the upstream fetch (BACKGROUND for automatic refreshes)
+    """
+    try:
+        # Airport names and cities are resolved to a code with the offline airport store
+        code = resolve_code(airport_code)
+        state, airport_details = _cached_airport(code, components)
+        if state == 'stale':
+            airport_flight.do_in_background(code, lambda: _fetch_airport_details(code, BACKGROUND))
+        elif state == 'miss':
+            try:
+                airport_details = airport_flight.do(code, lambda: _fetch_airport_details(code, priority))
+            except Exception as error:
+                airport_details = _stale_airport(code, error)
+        (get_session() if session is None else session)['airport_details'] = airport_details
+        return airport_details
+    except Exception as e:
+        print(f"The IATA / ICAO Code is invalid: {e}")
+        return None
+
+def _cached_airport(code, components):
+    """
+    Look up an airport payload in the cache for the given components.
+    Returns (state, payload): "fresh" or "stale" (served, refresh it in the background) with the cached
+    payload, or "miss" with None.
+    """
+    max_age = min(AIRPORT_COMPONENT_TTL[component] for component in components)
+    entry = airport_cache.get(code)
+    age = time.time() - entry[0] if entry else None
+    if entry and age <= max_age:
+        _count_airport('hits')
+        return 'fresh', entry[1]
+    if entry and age <= max_age + AIRPORT_STALE_GRACE:
+        _count_airport('stale_hits')
+        return 'stale', entry[1]
+    _count_airport('misses')
+    return 'miss', None
+
+def _fetch_airport_details(code, priority: int = INTERACTIVE):
+    airport_details = scheduler.fr24.call('fr24.airport_details', lambda: get_fr_api().get_airport_details(code), priority)
+    return _store_airport_details(code, airport_details)
+
+def _stale_airport(code, error):
+    """
+    Return the last cached payload of an airport, however old, when its fetch failed for a transient reason.
+    Otherwise re-raise the error.
+    """
+    transient = isinstance(error, UpstreamUnavailable) or scheduler.is_transient(error)
+    entry = airport_cache.get_stale(code) if transient else None
+    if entry is None:
+        raise error
+    print(f"Serving stale airport details for {code}: {error}")
+    return entry[1]
+
+def _store_airport_details(code, airport_details):
+    airport_cache.set(code, (time.time(), airport_details))
+    add_fr24_airport(airport_details)
+    _count_airport('fetches')
+    return airport_details
+
+def _count_airport(key):
+    with _airport_stats_lock:
+        airport_stats[key] += 1
+
+def flight_index_stats():
+    """
+    Return the size, snapshot age and hit counters of the live-flight identifier index.
+    """
+    return flight_index.info()
+
+def airport_cache_stats():
+    """
+    Return hit ratio, stale serves, upstream fetches and coalesced requests of the airport details cache.
+    """
+    with _airport_stats_lock:
+        stats = dict(airport_stats)
+    lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+    stats['hit_ratio'] = (stats['hits'] + stats['stale_hits']) / lookups if lookups else 0.0
+    stats['coalesced'] = airport_flight.stats['coalesced']
+    stats['cached_airports'] = len(airport_cache)
+    return stats
+
+def airport_dep_board(airport_details):
+    """
+    Get the departure board for a given airport.
+    airport_details: JSON object containing airport details from FlightRadar24 API"""
+    return _board_rows(airport_details, 'departures')
+
+def airport_arr_board(airport_details):
+    """
+    Get the arrival board for a given airport.
+    airport_details: JSON object containing airport details from FlightRadar24 API
+    """
+    return _board_rows(airport_details, 'arrivals')
+
+def _board_rows(airport_details, direction):
+    if airport_details is None:
+        return []
+
+    entries = BOARD_SCHEMAS[direction].entries(airport_details)
+    if not entries:
+        print(f"No {direction} found for this airport.")
+        return []
+
+    # Build a flat list of rows with flight details
+    with metrics.span('boards.format'):
+        return BOARD_SCHEMAS[direction].extract(entries, board_timezone(airport_details)).rows()
+
+def _path_getter(*keys):
+    """
+    Turn a nested key path into a getter that returns None as soon as a level is missing or null,
+    e.g. _path_getter('flight', 'status', 'text') reads obj['flight']['status']['text'].
+    """
+    def get(obj):
+        try:
+            for key in keys:
+                obj = obj[key]
+        except (KeyError, TypeError, IndexError):
+            return None
+        return obj
+    return get
+
+def board_timezone(airport_details):
+    try:
+        return ZoneInfo(airport_details['airport']['pluginData']['details']['timezone']['name'])
+    except (KeyError, TypeError, ZoneInfoNotFoundError):
+        return None
+
+BOARD_TIME_FORMAT = '%m-%d-%Y %I:%M%p'
+_EPOCH = datetime.date(1970, 1, 1)
+_MINUTE_LABELS = [datetime.time(minute // 60, minute % 60).strftime('%I:%M%p') for minute in range(24 * 60)]
+# UTC offset changes happen on quarter-hour boundaries, so one offset lookup covers a 15 minute bucket
+_OFFSET_BUCKET = 15 * 60
+
+def format_timestamps(timestamps, tz, fmt: str = BOARD_TIME_FORMAT) -> list:
+    """
+    Format a column of Unix timestamps in one timezone.
+    For the board format the UTC offset is looked up once per 15 minute bucket and the date and
+    time-of-day labels are shared across rows, instead of building a datetime for every row.
+    Missing timestamps become empty strings.
+    """
+    if fmt != BOARD_TIME_FORMAT or tz is None:
+        formatted = {ts: datetime.datetime.fromtimestamp(ts, tz=tz).strftime(fmt) for ts in set(timestamps) if ts is not None}
+        return [formatted.get(ts, '') for ts in timestamps]
+
+    offsets, days, result = {}, {}, []
+    for ts in timestamps:
+        if ts is None:
+            result.append('')
+            continue
+        bucket = int(ts // _OFFSET_BUCKET)
+        offset = offsets.get(bucket)
+        if offset is None:
+            start = datetime.datetime.fromtimestamp(bucket * _OFFSET_BUCKET, tz=tz).utcoffset()
+            end = datetime.datetime.fromtimestamp((bucket + 1) * _OFFSET_BUCKET - 1, tz=tz).utcoffset()
+            offset = offsets[bucket] = int(start.total_seconds()) if start == end else False
+        if offset is False:
+            result.append(datetime.datetime.fromtimestamp(ts, tz=tz).strftime(fmt))
+            continue
+        day, seconds = divmod(int(ts) + offset, 86400)
+        label = days.get(day)
+        if label is None:
+            label = days[day] = (_EPOCH + datetime.timedelta(days=day)).strftime('%m-%d-%Y ')
+        result.append(label + _MINUTE_LABELS[seconds // 60])
+    return result
+
+
+class BoardTable:
+    """
+    Column table of one arrival or departure board, in schedule order.
+    scheduled_ts keeps the raw Unix timestamps next to the formatted scheduled column.
+    """
+    COLUMNS = ('airport', 'city', 'airline', 'flight', 'scheduled', 'status', 'terminal', 'gate')
+
+    def __init__(self, **columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['flight'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def rows(self):
+        return [list(row) for row in zip(*(self.columns[name] for name in self.COLUMNS))]
+
+
+class BoardSchema:
+    """
+    Precompiled field paths for the departure or arrival board of an FR24 airport payload.
+    The local airport's info supplies terminal and gate; the other airport is the origin or destination shown.
+    """
+    def __init__(self, direction: str):
+        local, other, time_key = ('origin', 'destination', 'departure') if direction == 'departures' else ('destination', 'origin', 'arrival')
+        self.direction = direction
+        self.entries = _path_getter('airport', 'pluginData', 'schedule', direction, 'data')
+        self.flight_id = _path_getter('flight', 'identification', 'id')
+        self.number = _path_getter('flight', 'identification', 'number', 'default')
+        self.airline = _path_getter('flight', 'airline', 'name')
+        self.airport = _path_getter('flight', 'airport', other, 'code', 'iata')
+        self.city = _path_getter('flight', 'airport', other, 'position', 'region', 'city')
+        self.scheduled = _path_getter('flight', 'time', 'scheduled', time_key)
+        self.status = _path_getter('flight', 'status', 'text')
+        self.terminal = _path_getter('flight', 'airport', local, 'info', 'terminal')
+        self.gate = _path_getter('flight', 'airport', local, 'info', 'gate')
+
+    def extract(self, entries, tz) -> BoardTable:
+        """
+        Extract and format a list of board entries into a BoardTable.
+        """
+        scheduled_ts = [self.scheduled(entry) for entry in entries]
+        return BoardTable(
+            airport=[self.airport(entry) for entry in entries],
+            city=[self.city(entry) for entry in entries],
+            airline=[remove_parentheses(name) if name else '' for name in map(self.airline, entries)],
+            flight=[number or '' for number in map(self.number, entries)],
+            scheduled=format_timestamps(scheduled_ts, tz),
+            scheduled_ts=scheduled_ts,
+            status=[convert_time_in_string(text) if text else '' for text in map(self.status, entries)],
+            terminal=[terminal or '' for terminal in map(self.terminal, entries)],
+            gate=[gate or '' for gate in map(self.gate, entries)],
+        )
+
+    def identity(self, entry):
+        """
+        Identify an entry across refreshes: the FR24 flight id when present, else flight number and scheduled time.
+        """
+        return self.flight_id(entry) or (self.number(entry), self.scheduled(entry))
+
+    def signature(self, entry):
+        """
+        The raw fields shown on a board row; a row is re-formatted only when these change.
+        """
+        return (self.number(entry), self.airline(entry), self.airport(entry), self.city(entry),
+                self.scheduled(entry), self.status(entry), self.terminal(entry), self.gate(entry))
+
+
+BOARD_SCHEMAS = {direction: BoardSchema(direction) for direction in ('departures', 'arrivals')}
+
+@metrics.timed('boards.live_diff')
+def live_board(airport_details, direction: str, previous: dict = None):
+    """
+    Build a departure or arrival board and diff it against the previous refresh by flight identity.
+    Rows of flights whose raw fields did not change are reused from previous; only the changed
+    entries are extracted and formatted, in one batch.
+
+    airport_details: JSON object containing airport details from FlightRadar24 API
+    direction: "departures" or "arrivals"
+    previous: Board state returned by the previous call, or None for the first refresh
+
+    Returns (board, rows, changes): the board state for the next call, all rows in schedule order,
+    and the changed rows prefixed with "Added", "Updated" or "Removed".
+    """
+    previous = previous or {}
+    if airport_details is None:
+        return {}, [], [["Removed"] + row for _, row in previous.values()]
+
+    schema = BOARD_SCHEMAS[direction]
+    board, changed = {}, []
+    for entry in schema.entries(airport_details) or []:
+        identity = schema.identity(entry)
+        signature = schema.signature(entry)
+        cached = previous.get(identity)
+        if cached is not None and cached[0] == signature:
+            board[identity] = cached
+        else:
+            board[identity] = (signature, None)
+            changed.append((identity, entry, "Updated" if cached is not None else "Added"))
+
+    changes = []
+    if changed:
+        rows = schema.extract([entry for _, entry, _ in changed], board_timezone(airport_details)).rows()
+        for (identity, _, change), row in zip(changed, rows):
+            board[identity] = (board[identity][0], row)
+            changes.append([change] + row)
+
+    changes.extend(["Removed"] + row for identity, (_, row) in previous.items() if identity not in board)
+    return board, [row for _, row in board.values()], changes
+
+def delay_index(airport_details):
+    """
+    Get the delay index for a given airport.
+    airport_details: JSON object containing airport details from FlightRadar24 API
+    """
+    if airport_details is None:
+        return
+    
+    delay_index = airport_details['airport']['pluginData']['details']['delayIndex']
+    arrivals = delay_index['arrivals']
+    departures = delay_index['departures']
+
+    return arrivals, departures
+
+def weather(airport_details):
+    """
+    Get the weather for a given airport.
+    airport_details: JSON object containing airport details from FlightRadar24 API
+    """
+    if airport_details is None:
+        return
+    
+    weather = airport_details['airport']['pluginData']['weather']
+    if not weather:
+        print("No weather data found for this airport.")
+        return None
+    
+    temp_c = weather['temp']['celsius']
+    temp_f = weather['temp']['fahrenheit']
+    condition = weather['sky']['condition']['text']
+    humidity = weather['humidity']
+
+    wind_speed_kmh = weather['wind']['speed']['kmh']
+    wind_speed_mph = weather['wind']['speed']['mph']
+    wind_speed_text = weather['wind']['speed']['text']
+    wind_direction_degree = weather['wind']['direction']['degree']
+    wind_direction_text = weather['wind']['direction']['text']
+
+    visibility_km = weather['sky']['visibility']['km']
+    visibility_miles = weather['sky']['visibility']['mi']
+
+    return temp_c, temp_f, condition, humidity, wind_speed_kmh, wind_speed_mph, wind_speed_text, wind_direction_degree, wind_direction_text, visibility_km, visibility_miles
+
+def find_live_flight(flight_id: str, priority: int = INTERACTIVE):
+    """
+    Resolve a registration, callsign, flight number or ICAO24 address to the summary object of its live flight, or None.
+    The live-flight index is tried first; on a miss, registrations are looked up directly and anything
+    else goes through the search endpoint, and finally a partial identifier matching a single indexed flight is used.
+    priority: Scheduler priority of the upstream requests
+    """
+    flight_id = flight_id.strip().upper()
+    # Most identifiers are in the live-flight index, which saves the search round-trip
+    flight = flight_index.lookup(flight_id) if flight_index.enabled else None
+    if flight is not None:
+        return flight
+
+    flights = scheduler.fr24.call('fr24.get_flights', lambda: get_fr_api().get_flights(registration=flight_id), priority)
+
+    if not flights:
+        results = scheduler.fr24.call('fr24.search', lambda: get_fr_api().search(flight_id), priority)['live']
+        if len(results) > 0:
+            registration = results[0]['label'].split(' ')[-1][1:-1]
+            flights = scheduler.fr24.call('fr24.get_flights', lambda: get_fr_api().get_flights(registration=registration), priority)
+
+    # Get the first flight object from the list. This is a "summary" object.
+    if flights:
+        return flights[0]
+    # Last resort: a partial identifier that matches exactly one indexed flight
+    return flight_index.resolve_prefix(flight_id) if flight_index.enabled else None
+
+def load_flight_details(flight_obj, priority: int = INTERACTIVE):
+    """
+    Fetch the full details of a summary flight object and apply them to it. Returns the details dictionary.
+    """
+    details = scheduler.fr24.call('fr24.flight_details', lambda: get_fr_api().get_flight_details(flight_obj), priority)
+    with metrics.span('flight.apply_details'):
+        flight_obj.set_flight_details(details)
+    add_fr24_flight(details)
+    return details
+
+def get_flight_status(flight_id, session: dict = None):
+    """
+    Get the status of a flight by its ID. This function now returns the full details dictionary.
+    session: Per-user state dict that keeps the tracked flight for the map and export (defaults to the shared session)
+    """
+    session = get_session() if session is None else session
+    flight_id = flight_id.strip().upper()
+
+    try:
+        flight_obj = find_live_flight(flight_id)
+    except UpstreamUnavailable as e:
+        session.pop('flight', None)
+        return str(e)
+    if flight_obj is None:
+        return no_flight_status(flight_id, session)
+    
+    try:
+        # Fetch the full details and apply them to the flight object to make it complete.
+        details = load_flight_details(flight_obj)
+        return flight_status_text(flight_obj, details, session)
+
+    except Exception as e:
+        print(f"Error fetching details for {flight_obj.id}: {e}")
+        session.pop('flight', None)
+        return f"Could not retrieve details for flight {flight_id}."
+
+def no_flight_status(flight_id, session):
+    """
+    Status text when no live flight matches, with "did you mean" suggestions from the live-flight index.
+    """
+    session.pop('flight', None)
+    suggestions = flight_index.suggest(flight_id) if flight_index.enabled else []
+    if suggestions:
+        return f"No live flight found. Did you mean: {', '.join(suggestions)}?"
+    return "No live flight found."
+
+def flight_status_text(flight_obj, details, session):
+    """
+    Keep a detailed flight in the session for the map and export, and format its status text.
+    """
+    # Keep the fully detailed object for the map and the raw details for export.
+    session['flight'] = flight_obj
+    session['flight_details'] = details
+
+    # For the text status, format some key info from the now-detailed object.
+    status_text = f"""
+        {flight_obj.callsign}
+        {flight_obj.registration}
+        {flight_obj.aircraft_code}
+        Origin: {flight_obj.origin_airport_name} ({flight_obj.origin_airport_iata})
+        Destination: {flight_obj.destination_airport_name} ({flight_obj.destination_airport_iata})
+        Status: {convert_time_in_string(flight_obj.status_text)}
+        """
+    return status_text.strip()
+
+def parse_fleet(identifiers):
+    """
+    Split a list or a comma/whitespace separated string of registrations and flight numbers
+    into unique, normalized identifiers (first occurrence order).
+    """
+    if isinstance(identifiers, str):
+        identifiers = re.split(r'[\s,;]+', identifiers)
+    return list(dict.fromkeys(identifier.strip().upper() for identifier in identifiers if identifier and identifier.strip()))
+
+def get_fleet_status(identifiers, session: dict = None, max_workers: int = FLEET_MAX_WORKERS):
+    """
+    Look up the live status of many registrations or flight numbers at once.
+    Identifiers are resolved concurrently, then the details of each distinct flight are fetched once,
+    even when several identifiers (e.g. a registration and its flight number) resolve to the same aircraft.
+    Returns one row per identifier (see FLEET_HEADERS).
+    identifiers: List or comma/whitespace separated string of identifiers (at most FLEET_MAX_SIZE are used)
+    session: Per-user state dict that keeps the fleet for the map and export (defaults to the shared session)
+    max_workers: Maximum number of concurrent upstream requests
+    """
+    session = get_session() if session is None else session
+    queries = parse_fleet(identifiers)[:FLEET_MAX_SIZE]
+    if not queries:
+        session.pop('fleet', None)
+        session.pop('fleet_details', None)
+        return []
+
+    def resolve(query):
+        try:
+            return flight_lookup.do(('resolve', query), lambda: find_live_flight(query, BACKGROUND))
+        except Exception as e:
+            print(f"Error resolving {query}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        resolved = dict(zip(queries, executor.map(resolve, queries)))
+        flights = distinct_flights(resolved)
+
+        def detail(flight_obj):
+            try:
+                details = flight_lookup.do(('details', flight_obj.id), lambda: load_flight_details(flight_obj, BACKGROUND))
+                # A coalesced lookup may have been made for another copy of the same flight
+                flight_obj.set_flight_details(details)
+                return details
+            except Exception as e:
+                print(f"Error fetching details for {flight_obj.id}: {e}")
+                return None
+
+        details = dict(zip(flights, executor.map(detail, flights.values())))
+
+    return fleet_rows(queries, resolved, flights, details, session)
+
+def distinct_flights(resolved: dict) -> dict:
+    """
+    Map flight id -> flight object for the resolved identifiers of a fleet lookup, one per aircraft.
+    """
+    flights = {}
+    for flight_obj in resolved.values():
+        if flight_obj is not None:
+            flights.setdefault(flight_obj.id, flight_obj)
+    return flights
+
+def fleet_rows(queries, resolved: dict, flights: dict, details: dict, session: dict):
+    """
+    Keep the detailed fleet in the session for the map and export, and build one row per identifier.
+    resolved: Identifier -> flight summary (or None); flights: Flight id -> flight object; details: Flight id -> details (or None)
+    """
+    session['fleet'] = [flights[flight_key] for flight_key in flights if details[flight_key] is not None]
+    session['fleet_details'] = {flight_key: value for flight_key, value in details.items() if value is not None}
+
+    rows = []
+    for query in queries:
+        summary = resolved[query]
+        if summary is None:
+            rows.append([query, "", "", "", "", "", "", "", "No live flight found."])
+            continue
+        flight_obj = flights[summary.id]
+        if details[summary.id] is None:
+            rows.append([query, summary.callsign, summary.registration, summary.aircraft_code, summary.origin_airport_iata, summary.destination_airport_iata,
+                         summary.altitude, summary.ground_speed, "Could not retrieve details."])
+            continue
+        rows.append([query, flight_obj.callsign, flight_obj.registration, flight_obj.aircraft_code, flight_obj.origin_airport_iata, flight_obj.destination_airport_iata,
+                     flight_obj.altitude, flight_obj.ground_speed, convert_time_in_string(flight_obj.status_text or "")])
+    return rows
+
+def schedule_records(airport_details):
+    """
+    Yield the departure and arrival board entries of an airport payload as records, for tabular exports.
+    """
+    for direction, schema in BOARD_SCHEMAS.items():
+        for entry in schema.entries(airport_details) or []:
+            yield {'direction': direction, **entry}
+
+def trail_records(flight_details):
+    """
+    Yield the trail points of a flight's details, newest first, tagged with the flight id.
+    """
+    flight_key = (flight_details.get('identification') or {}).get('id')
+    for point in flight_details.get('trail') or []:
+        yield {'flight_id': flight_key, **point}
+
+def fleet_records(fleet_details):
+    """
+    Yield one record per tracked aircraft of a fleet lookup; trails are left out to keep one row per aircraft.
+    """
+    for flight_key, details in fleet_details.items():
+        yield {'flight_id': flight_key, **{key: value for key, value in details.items() if key != 'trail'}}
+
+# Douglas-Peucker tolerance in screen pixels; converted to degrees for the zoom level being rendered
+TRAIL_TOLERANCE_PX = 1.0
+TRAIL_ZOOM = 6
+
+def trail_arrays(trail):
+    """
+    Convert a FlightRadar24 trail (list of point dicts, newest first) into float arrays.
+    trail: List of trail points with 'lat' and 'lng' keys
+    """
+    lat = np.fromiter((point['lat'] for point in trail), dtype=np.float64, count=len(trail))
+    lng = np.fromiter((point['lng'] for point in trail), dtype=np.float64, count=len(trail))
+    return lat, lng
+
+def antimeridian_offset(origin_lon: float, destination_lon: float) -> int:
+    """
+    Longitude offset (-360, 0 or 360) that keeps a route from wrapping around the map.
+    """
+    lon_diff = destination_lon - origin_lon
+    if lon_diff > 180:
+        return -360
+    if lon_diff < -180:
+        return 360
+    return 0
+
+def unwrap_longitudes(lng, offset: int):
+    """
+    Move the trail points on the far side of the antimeridian into the frame of the route.
+    lng: Array of longitudes in [-180, 180]
+    offset: Result of antimeridian_offset
+    """
+    if offset == -360:
+        return np.where(lng >= 0, lng - 360, lng)
+    if offset == 360:
+        return np.where(lng <= 0, lng + 360, lng)
+    return lng
+
+def zoom_tolerance(zoom: float, pixels: float = TRAIL_TOLERANCE_PX) -> float:
+    """
+    Size in degrees of longitude of the given number of screen pixels at a Web Mercator zoom level.
+    """
+    return pixels * 360.0 / (256 * 2 ** zoom)
+
+@metrics.timed('map.simplify_trail')
+def simplify_trail(lat, lng, tolerance: float):
+    """
+    Ramer-Douglas-Peucker simplification of a polyline. Returns the indices of the points to keep,
+    always including the first and last point.
+    lat, lng: Coordinate arrays
+    tolerance: Maximum distance in degrees between the original and the simplified line
+    """
+    n = len(lat)
+    if n < 3 or tolerance <= 0:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        y0, x0, y1, x1 = lat[start], lng[start], lat[end], lng[end]
+        ys, xs = lat[start + 1:end], lng[start + 1:end]
+        dy, dx = y1 - y0, x1 - x0
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(xs - x0, ys - y0)
+        else:
+            distances = np.abs(dx * (y0 - ys) - dy * (x0 - xs)) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return np.flatnonzero(keep)
+
+def flight_trail(flight, zoom: int = TRAIL_ZOOM, tolerance_px: float = TRAIL_TOLERANCE_PX):
+    """
+    Return the antimeridian offset of a detailed flight's route and its trail as [lat, lon] pairs,
+    unwrapped into the route's frame and simplified for the zoom level.
+    """
+    # Determine the longitude offset needed to prevent map wrapping.
+    offset = antimeridian_offset(flight.origin_airport_longitude, flight.destination_airport_longitude)
+    lat, lng = trail_arrays(flight.trail)
+    lng = unwrap_longitudes(lng, offset)
+    keep = simplify_trail(lat, lng, zoom_tolerance(zoom, tolerance_px))
+    return offset, np.column_stack((lat[keep], lng[keep])).tolist()
+
+def plane_marker(flight, location):
+    """
+    Build the aircraft marker of a flight: a plane icon rotated to its heading with a popup.
+    """
+    import folium
+    # Aircraft popup information
+    aircraft_popup = f"""
+    <b>{flight.callsign or flight.registration}</b><br>
+    Altitude: {flight.altitude} ft<br>
+    Speed: {flight.ground_speed} kts<br>
+    Heading: {flight.heading}°
+    """
+
+    # Create a plane icon with rotation based on the flight's heading
+    plane_color = flight.status_icon if flight.status_icon else 'black'
+    icon_html = f"""
+    <div style="transform: rotate({flight.heading}deg);">
+        <i class="fa-solid fa-plane-up" style="font-size:20px; color:{plane_color}; -webkit-text-stroke: 1px black;"></i>
+    </div>
+    """
+    plane_icon = folium.DivIcon(html=icon_html)
+
+    return folium.Marker(
+        location=location,
+        popup=folium.Popup(aircraft_popup, max_width=300),
+        icon=plane_icon
+    )
+
+@metrics.timed('map.flight')
+def get_flight_map(session: dict = None, zoom: int = TRAIL_ZOOM, tolerance_px: float = TRAIL_TOLERANCE_PX):
+    """
+    Render the tracked flight of the session on a map.
+    The trail is simplified for the initial zoom level; the full-resolution trail stays in the session's flight details for export.
+    session: Per-user state dict (defaults to the shared session)
+    zoom: Initial zoom level of the map
+    tolerance_px: Simplification tolerance in screen pixels at that zoom (0 keeps every trail point)
+    """
+    # folium is only needed once a map is rendered
+    import folium
+    from folium.plugins import AntPath
+    flight = (get_session() if session is None else session).get('flight')
+
+    if not flight:
+        return folium.Map(location=[0, 0], zoom_start=1)
+    
+    # The flight object in the cache is now fully detailed.
+    # We can directly check for the 'trail' attribute.
+    if not hasattr(flight, 'trail') or not flight.trail:
+        print("Flight object has no trail data.")
+        return folium.Map(location=[0, 0], zoom_start=1)
+    
+    # 1. Unwrap the trail into the route's frame and drop points that are invisible at this zoom.
+    offset, trail_coordinates = flight_trail(flight, zoom, tolerance_px)
+
+    # 2. Create the flight map with the adjusted trail coordinates.
+    current_position = (trail_coordinates[0][0], trail_coordinates[0][1])
+    
+    flight_map = folium.Map(location=current_position, zoom_start=zoom, tiles="CartoDB positron")
+
+    AntPath(locations=trail_coordinates, color='blue', weight=2.5, delay=800, dash_array=[10, 20]).add_to(flight_map)
+    plane_marker(flight, current_position).add_to(flight_map)
+
+    # Add origin and destination markers
+    if flight.origin_airport_iata:
+        origin_popup = f"""<b>{flight.origin_airport_name} ({flight.origin_airport_iata})</b><br>
+        {"Terminal " + flight.origin_airport_terminal + " " if flight.origin_airport_terminal  != "N/A" else ''}{"Gate " + flight.origin_airport_gate if flight.origin_airport_gate != "N/A" else ''}<br>
+        Local Time: {get_local_time(timezone_name=flight.origin_airport_timezone_name)}<br>"""
+        folium.Marker(
+            location=[flight.origin_airport_latitude, flight.origin_airport_longitude],
+            popup=origin_popup,
+            icon=folium.Icon(color='green', icon='plane-departure')
+        ).add_to(flight_map)
+    
+    if flight.destination_airport_iata:
+        destination_popup = f"""<b>{flight.destination_airport_name} ({flight.destination_airport_iata})</b><br>
+        {"Terminal " + flight.destination_airport_terminal + " " if flight.destination_airport_terminal  != "N/A" else ''}{"Gate " + flight.destination_airport_gate if flight.destination_airport_gate != "N/A" else ''}<br>
+        Local Time: {get_local_time(timezone_name=flight.destination_airport_timezone_name)}<br>"""
+        folium.Marker(
+            location=[flight.destination_airport_latitude, flight.destination_airport_longitude + offset],
+            popup=destination_popup,
+            icon=folium.Icon(color='red', icon='plane-arrival')
+        ).add_to(flight_map)
+
+    return flight_map
+
+FLEET_ZOOM = 3
+
+@metrics.timed('map.fleet')
+def get_fleet_map(session: dict = None, zoom: int = FLEET_ZOOM, tolerance_px: float = TRAIL_TOLERANCE_PX):
+    """
+    Render every aircraft of the session's fleet lookup on one map, with simplified trails.
+    session: Per-user state dict (defaults to the shared session)
+    zoom: Zoom level the trails are simplified for; the map is fitted to the aircraft
+    tolerance_px: Simplification tolerance in screen pixels at that zoom
+    """
+    import folium
+    fleet = (get_session() if session is None else session).get('fleet')
+    if not fleet:
+        return folium.Map(location=[0, 0], zoom_start=1)
+
+    fleet_map = folium.Map(location=[0, 0], zoom_start=zoom, tiles="CartoDB positron")
+    positions = []
+    for flight in fleet:
+        if getattr(flight, 'trail', None):
+            _, trail_coordinates = flight_trail(flight, zoom, tolerance_px)
+            folium.PolyLine(locations=trail_coordinates, color='blue', weight=2, opacity=0.6).add_to(fleet_map)
+            position = trail_coordinates[0]
+        else:
+            position = [flight.latitude, flight.longitude]
+        plane_marker(flight, position).add_to(fleet_map)
+        positions.append(position)
+
+    lats, lons = zip(*positions)
+    fleet_map.fit_bounds([[min(lats), min(lons)], [max(lats), max(lons)]], max_zoom=8)
+    return fleet_map
+
+# Async counterparts of the FlightRadar24 lookups, for coroutine handlers. They share the caches and the
+# live-flight index with the blocking versions, but requests go through the pooled async HTTP client.
+
+class AsyncFlightRadar:
+    """
+    Async versions of the FlightRadar24API calls used here, over the shared pooled async HTTP client.
+    Endpoint URLs are read from the SDK's Core table on every call, so use_base_url applies to them as well.
+    """
+    async def _get_json(self, url, params=None, allowed_status=()):
+        # httpx only decodes brotli when the optional brotli package is installed
+        headers = dict(fr_core().json_headers, **{'accept-encoding': 'gzip, deflate'})
+        response = await get_http().get(url, params=params, headers=headers)
+        if response.status_code >= 400 and response.status_code not in allowed_status:
+            response.raise_for_status()
+        return response.status_code, response.json()
+
+    async def get_airport_details(self, code: str, flight_limit: int = 100, page: int = 1):
+        """
+        Return the airport payload, validated the way FlightRadar24API.get_airport_details does: a code that
+        is not 3 or 4 characters long raises ValueError, and an unknown airport raises AirportNotFoundError.
+        """
+        from FlightRadar24.errors import AirportNotFoundError
+        if not 3 <= len(code) <= 4:
+            raise ValueError(f"The code '{code}' is invalid. It must be the IATA or ICAO of the airport.")
+        status, content = await self._get_json(fr_core().api_airport_data_url, {'format': 'json', 'code': code, 'limit': flight_limit, 'page': page}, allowed_status=(400,))
+        if status == 400:
+            errors = ((content or {}).get('errors') or {}).get('errors', {}).get('parameters', {})
+            if 'limit' in errors:
+                raise ValueError(errors['limit'].get('notBetween'))
+            raise AirportNotFoundError(f"An airport with the code '{code}' was not found.", errors)
+        result = content['result']['response']
+        # An unknown code still gets a 200 with an (almost) empty airport
+        data = (result.get('airport') or {}).get('pluginData') or {}
+        if 'details' not in data and not data.get('runways') and len(data) <= 3:
+            raise AirportNotFoundError(f"An airport with the code '{code}' was not found.")
+        return result
+
+    async def get_flight_details(self, flight):
+        return (await self._get_json(fr_core().flight_data_url.format(flight.id)))[1]
+
+    async def get_flights(self, registration: str = None):
+        params = dataclasses.asdict(get_fr_api().get_flight_tracker_config())
+        if registration:
+            params['reg'] = registration
+        _, content = await self._get_json(fr_core().real_time_flight_tracker_data_url, params)
+        from FlightRadar24.entities.flight import Flight
+        # Non-numeric keys are feed metadata (full_count, version, stats)
+        return [Flight(flight_id, info) for flight_id, info in content.items() if flight_id[:1].isdigit()]
+
+    async def search(self, query: str, limit: int = 50):
+        """
+        Search FlightRadar24 and group the results by type ("live", "schedule", "aircraft", ...).
+        """
+        _, content = await self._get_json(fr_core().search_data_url.format(query, limit))
+        grouped = {}
+        for result in content.get('results', []):
+            grouped.setdefault(result.get('type'), []).append(result)
+        return grouped
+
+fr_async = AsyncFlightRadar()
+airport_flight_async = AsyncSingleFlight()
+flight_lookup_async = AsyncSingleFlight()
+
+async def get_airport_details_async(airport_code, session: dict = None, components=AIRPORT_COMPONENTS, priority: int = INTERACTIVE):
+    """
+    Async counterpart of get_airport_details.
+    """
+    try:
+        code = resolve_code(airport_code)
+        state, airport_details = _cached_airport(code, components)
+        if state == 'stale':
+            airport_flight_async.do_in_background(code, lambda: _fetch_airport_details_async(code, BACKGROUND))
+        elif state == 'miss':
+            try:
+                airport_details = await airport_flight_async.do(code, lambda: _fetch_airport_details_async(code, priority))
+            except Exception as error:
+                airport_details = _stale_airport(code, error)
+        (get_session() if session is None else session)['airport_details'] = airport_details
+        return airport_details
+    except Exception as e:
+        print(f"The IATA / ICAO Code is invalid: {e}")
+        return None
+
+async def _fetch_airport_details_async(code, priority: int = INTERACTIVE):
+    airport_details = await scheduler.fr24.call_async('fr24.airport_details', lambda: fr_async.get_airport_details(code), priority)
+    # The cache and airport store writes go to disk, off the event loop
+    return await asyncio.to_thread(_store_airport_details, code, airport_details)
+
+async def find_live_flight_async(flight_id: str, priority: int = INTERACTIVE):
+    """
+    Async counterpart of find_live_flight.
+    """
+    flight_id = flight_id.strip().upper()
+    flight = flight_index.lookup(flight_id) if flight_index.enabled else None
+    if flight is not None:
+        return flight
+
+    flights = await scheduler.fr24.call_async('fr24.get_flights', lambda: fr_async.get_flights(registration=flight_id), priority)
+    if not flights:
+        results = (await scheduler.fr24.call_async('fr24.search', lambda: fr_async.search(flight_id), priority)).get('live', [])
+        if results:
+            registration = results[0]['label'].split(' ')[-1][1:-1]
+            flights = await scheduler.fr24.call_async('fr24.get_flights', lambda: fr_async.get_flights(registration=registration), priority)
+
+    if flights:
+        return flights[0]
+    return flight_index.resolve_prefix(flight_id) if flight_index.enabled else None
+
+async def load_flight_details_async(flight_obj, priority: int = INTERACTIVE):
+    """
+    Async counterpart of load_flight_details.
+    """
+    details = await scheduler.fr24.call_async('fr24.flight_details', lambda: fr_async.get_flight_details(flight_obj), priority)
+    with metrics.span('flight.apply_details'):
+        flight_obj.set_flight_details(details)
+    await asyncio.to_thread(add_fr24_flight, details)
+    return details
+
+async def get_flight_status_async(flight_id, session: dict = None):
+    """
+    Async counterpart of get_flight_status.
+    """
+    session = get_session() if session is None else session
+    flight_id = flight_id.strip().upper()
+
+    try:
+        flight_obj = await find_live_flight_async(flight_id)
+    except UpstreamUnavailable as e:
+        session.pop('flight', None)
+        return str(e)
+    if flight_obj is None:
+        # Suggestions compare against the index keys, which is CPU work for a worker thread
+        return await asyncio.to_thread(no_flight_status, flight_id, session)
+    try:
+        details = await load_flight_details_async(flight_obj)
+        return flight_status_text(flight_obj, details, session)
+    except Exception as e:
+        print(f"Error fetching details for {flight_obj.id}: {e}")
+        session.pop('flight', None)
+        return f"Could not retrieve details for flight {flight_id}."
+
+async def get_fleet_status_async(identifiers, session: dict = None, max_concurrency: int = FLEET_ASYNC_CONCURRENCY):
+    """
+    Async counterpart of get_fleet_status.
+    max_concurrency: Maximum number of upstream requests in flight at once
+    """
+    session = get_session() if session is None else session
+    queries = parse_fleet(identifiers)[:FLEET_MAX_SIZE]
+    if not queries:
+        session.pop('fleet', None)
+        session.pop('fleet_details', None)
+        return []
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def resolve(query):
+        try:
+            async with semaphore:
+                return await flight_lookup_async.do(('resolve', query), lambda: find_live_flight_async(query, BACKGROUND))
+        except Exception as e:
+            print(f"Error resolving {query}: {e}")
+            return None
+
+    async def detail(flight_obj):
+        try:
+            async with semaphore:
+                details = await flight_lookup_async.do(('details', flight_obj.id), lambda: load_flight_details_async(flight_obj, BACKGROUND))
+            # A coalesced lookup may have been made for another copy of the same flight
+            flight_obj.set_flight_details(details)
+            return details
+        except Exception as e:
+            print(f"Error fetching details for {flight_obj.id}: {e}")
+            return None
+
+    resolved = dict(zip(queries, await asyncio.gather(*(resolve(query) for query in queries))))
+    flights = distinct_flights(resolved)
+    details = dict(zip(flights, await asyncio.gather(*(detail(flight_obj) for flight_obj in flights.values()))))
+    return fleet_rows(queries, resolved, flights, details, session)
@@ -0,0 +1,62 @@
+"""
+Concurrent load test against a running Flight Searcher app.
+
+Start the replay server and point config.json at it (see replay_server.py), start the app
+with `python app.py`, then run for example:
+
+    python loadtest.py --url http://127.0.0.1:7860 --concurrency 32 --requests 500
+"""
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+from gradio_client import Client
+
+SCENARIOS = {
+    'search_flights': ('/search_flights', ('SEA', 'JFK', '2025-08-01', 1, False)),
+    'search_flexible_dates': ('/search_flexible_dates', ('SEA', 'JFK', '2025-08-01', '2025-08-07', 1, False)),
+    'explore_anywhere': ('/explore_anywhere', ('SEA', '2025-08-01', 1, False)),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the Flight Searcher Gradio app.")
+    parser.add_argument('--url', default='http://127.0.0.1:7860')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='search_flights')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    api_name, inputs = SCENARIOS[args.scenario]
+    clients = [Client(args.url, verbose=False) for _ in range(args.concurrency)]
+
+    def call(i):
+        start = time.perf_counter()
+        try:
+            clients[i % len(clients)].predict(*inputs, api_name=api_name)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(call, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, error in results if error is None)
+    errors = [error for _, error in results if error is not None]
+    print(f"{args.scenario}: {args.requests} requests at concurrency {args.concurrency} in {elapsed:.2f}s")
+    print(f"throughput: {args.requests / elapsed:.1f} req/s, errors: {len(errors)}")
+    if latencies:
+        def pct(q):
+            return latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))] * 1000
+        print(f"latency ms: p50 {statistics.median(latencies) * 1000:.0f}, p95 {pct(95):.0f}, p99 {pct(99):.0f}, max {latencies[-1] * 1000:.0f}")
+    for error in errors[:5]:
+        print(f"  {type(error).__name__}: {error}")
+    return 1 if errors and not latencies else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
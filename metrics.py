@@ -0,0 +1,382 @@
+"""
+In-process metrics for the app's hot paths, served in the Prometheus text format.
+
+Stages (upstream calls and parse/format/render steps) are timed with span() or the timed() decorator
+into latency histograms, with a counter of failures per exception type. Gradio handlers are wrapped
+with request() for end-to-end latency. Existing stats dicts (caches, connection pool, indexes) are
+exported as gauges through register_collector(). render() produces the /metrics payload.
+
+Set FLIGHT_SEARCHER_PROFILE to a latency threshold in milliseconds to enable the sampling profiler:
+while a handler runs, its thread's stack is sampled every FLIGHT_SEARCHER_PROFILE_INTERVAL_MS
+(default 5), and requests slower than the threshold have their stacks written in the collapsed
+("folded") format to FLIGHT_SEARCHER_PROFILE_DIR (default profiles/), ready for flamegraph.pl or
+speedscope. Coroutine handlers share the event loop's thread, so their samples are only taken while
+the handler's own task is running on it.
+"""
+import os
+import sys
+import time
+import bisect
+import asyncio
+import inspect
+import functools
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+PREFIX = 'flight_searcher'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PROFILE_SLOW_MS = float(os.environ.get('FLIGHT_SEARCHER_PROFILE') or 0)
+PROFILE_INTERVAL = float(os.environ.get('FLIGHT_SEARCHER_PROFILE_INTERVAL_MS') or 5) / 1000
+PROFILE_DIR = os.environ.get('FLIGHT_SEARCHER_PROFILE_DIR', 'profiles')
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets, one series per label combination.
+    """
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class CounterMetric:
+    """
+    Monotonic counter, one series per label combination.
+    """
+    def __init__(self, name: str, help: str, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, key)} {value}")
+        return lines
+
+
+stage_seconds = Histogram(f'{PREFIX}_stage_seconds', "Latency of upstream calls and parse/format/render steps.", ('stage',))
+stage_errors = CounterMetric(f'{PREFIX}_stage_errors_total', "Stages that raised, by exception type.", ('stage', 'error'))
+request_seconds = Histogram(f'{PREFIX}_request_seconds', "End-to-end latency of UI and API handlers.", ('handler',))
+request_errors = CounterMetric(f'{PREFIX}_request_errors_total', "Handlers that raised, by exception type.", ('handler', 'error'))
+scheduler_wait = Histogram(f'{PREFIX}_scheduler_wait_seconds', "Time outbound calls queued for a rate-limit token.", ('provider', 'priority'))
+scheduler_retries = CounterMetric(f'{PREFIX}_scheduler_retries_total', "Outbound calls retried, by upstream status.", ('provider', 'status'))
+slow_profiles = CounterMetric(f'{PREFIX}_slow_request_profiles_total', "Stack profiles written for slow requests.", ('handler',))
+_collectors = {}
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Time the enclosed block as one stage; exceptions are counted and re-raised.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        stage_errors.inc(stage, type(e).__name__)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage)
+
+
+def timed(stage: str):
+    """
+    Decorator timing every call of a function as a stage.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def register_collector(name: str, collect, label: str = 'name'):
+    """
+    Export the numeric values of a stats function as gauges named flight_searcher_<name>.
+    collect: Callable returning {stat: value} or {label value: {stat: value}}
+    label: Label name of the outer keys of a nested dict
+    """
+    _collectors[name] = (collect, label)
+
+
+def _collector_lines(name: str, collect, label: str) -> list:
+    metric = f"{PREFIX}_{name}"
+    lines = [f"# TYPE {metric} gauge"]
+    try:
+        stats = collect()
+    except Exception as e:
+        print(f"Could not collect {name} metrics: {e}")
+        return []
+    for key, value in (stats or {}).items():
+        rows = value.items() if isinstance(value, dict) else [(None, value)]
+        for stat, number in rows:
+            if isinstance(number, bool):
+                number = int(number)
+            if not isinstance(number, (int, float)):
+                continue
+            names, values = ((label, 'stat'), (key, stat)) if stat is not None else (('stat',), (key,))
+            lines.append(f"{metric}{_labels(names, values)} {number}")
+    return lines
+
+
+def render() -> str:
+    """
+    Return all metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in (request_seconds, request_errors, stage_seconds, stage_errors, scheduler_wait, scheduler_retries, slow_profiles):
+        lines += metric.render()
+    for name, (collect, label) in list(_collectors.items()):
+        lines += _collector_lines(name, collect, label)
+    return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of threads running instrumented requests from one background thread.
+    A request running as an asyncio task only gets the samples taken while its task is the one
+    running on the event loop's thread.
+    interval: Seconds between samples
+    """
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self._active = {}
+        self._wake = threading.Condition()
+        self._thread = None
+
+    def attach(self, thread_id: int, samples: Counter, task=None):
+        """
+        Start sampling a thread into samples; with task, only while that asyncio task is running.
+        """
+        loop = task.get_loop() if task is not None else None
+        with self._wake:
+            self._active[(thread_id, task)] = (loop, samples)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='metrics-profiler', daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def detach(self, thread_id: int, task=None):
+        with self._wake:
+            self._active.pop((thread_id, task), None)
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            with self._wake:
+                while not self._active:
+                    self._wake.wait()
+                active = dict(self._active)
+            frames = sys._current_frames()
+            for (thread_id, task), (loop, samples) in active.items():
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == me:
+                    continue
+                # Between steps of a task, the loop thread runs other requests (or waits for I/O)
+                if task is not None and asyncio.current_task(loop) is not task:
+                    continue
+                samples[collapse_stack(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+def collapse_stack(frame) -> str:
+    """
+    Format a stack as "outer;...;inner" frames of "function (file:line)", the collapsed stack format.
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+profiler = SamplingProfiler() if PROFILE_SLOW_MS > 0 else None
+
+
+def write_profile(handler: str, samples: Counter, elapsed: float):
+    """
+    Write the collapsed stacks of one slow request to PROFILE_DIR and return the file path.
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{handler}-{time.strftime('%Y%m%d-%H%M%S')}-{int(elapsed * 1000)}ms-{threading.get_ident()}.folded")
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    slow_profiles.inc(handler)
+    return path
+
+
+class RequestSpan:
+    """
+    One instrumented handler call: its start time and, when profiling, its stack samples.
+    """
+    def __init__(self, handler: str):
+        self.handler = handler
+        self.start = time.perf_counter()
+        self.samples = Counter() if profiler is not None else None
+
+    @contextmanager
+    def sampling(self):
+        """
+        Sample the current thread while the enclosed block runs (generator handlers may move between threads).
+        Inside a coroutine, only the steps of the current task are sampled.
+        """
+        if self.samples is None:
+            yield
+            return
+        thread_id = threading.get_ident()
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        profiler.attach(thread_id, self.samples, task)
+        try:
+            yield
+        finally:
+            profiler.detach(thread_id, task)
+
+    def finish(self, error: BaseException = None):
+        elapsed = time.perf_counter() - self.start
+        request_seconds.observe(elapsed, self.handler)
+        if error is not None:
+            request_errors.inc(self.handler, type(error).__name__)
+        if self.samples and elapsed * 1000 >= PROFILE_SLOW_MS:
+            try:
+                path = write_profile(self.handler, self.samples, elapsed)
+                print(f"Slow request {self.handler} ({elapsed * 1000:.0f} ms), stacks written to {path}")
+            except OSError as e:
+                print(f"Could not write profile for {self.handler}: {e}")
+
+
+def request(handler: str):
+    """
+    Decorator for Gradio handlers: records end-to-end latency and errors, and profiles slow calls.
+    Generator handlers are timed from the first step until they finish. Coroutine and async generator
+    handlers are timed the same way, and profiled only while their own task runs on the event loop.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                call = RequestSpan(handler)
+                error = None
+                try:
+                    with call.sampling():
+                        return await fn(*args, **kwargs)
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    call.finish(error)
+            return wrapper
+
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                call = RequestSpan(handler)
+                error = None
+                generator = fn(*args, **kwargs)
+                try:
+                    while True:
+                        # Each step may run in a different task
+                        with call.sampling():
+                            try:
+                                value = await generator.__anext__()
+                            except StopAsyncIteration:
+                                return
+                        yield value
+                except BaseException as e:
+                    if not isinstance(e, GeneratorExit):
+                        error = e
+                    raise
+                finally:
+                    await generator.aclose()
+                    call.finish(error)
+            return wrapper
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                call = RequestSpan(handler)
+                error = None
+                try:
+                    generator = fn(*args, **kwargs)
+                    while True:
+                        with call.sampling():
+                            try:
+                                value = next(generator)
+                            except StopIteration:
+                                return
+                        yield value
+                except BaseException as e:
+                    if not isinstance(e, GeneratorExit):
+                        error = e
+                    raise
+                finally:
+                    call.finish(error)
+            return wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            call = RequestSpan(handler)
+            error = None
+            try:
+                with call.sampling():
+                    return fn(*args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                call.finish(error)
+        return wrapper
+    return decorator
@@ -0,0 +1,175 @@
+import re
+import numpy as np
+from utils import convert_time_formats, durations_to_strings, iso_durations_to_seconds
+
+OFFER_HEADERS = ["Offer #", "Flight #", "Route", "Aircraft", "DEP & ARR Terminals", "DEP Time", "ARR Time", "Duration", "Total Price"]
+SORT_COLUMNS = {
+    "Price": "price",
+    "Stops": "stops",
+    "Duration": "duration",
+    "Departure": "departure",
+    "Arrival": "arrival",
+}
+# Departure window bounds, typed by users as HH:MM
+HHMM = re.compile(r'([01]?\d|2[0-3]):([0-5]\d)')
+
+
+class OfferTable:
+    """
+    Columnar view of parsed Amadeus flight offers.
+    Offer-level columns (price, carrier, stops, duration, departure, arrival) are typed numpy arrays,
+    and segment-level display strings are formatted once, so sorting, filtering and re-rendering
+    never re-parse the response.
+    data: Parsed list of flight-offer objects
+    """
+    def __init__(self, data):
+        self.data = data
+        n = len(data)
+        self.price = np.array([offer["price"]["total"] for offer in data], dtype=str).astype(np.float64)
+        self.currency = np.array([offer["price"]["currency"] for offer in data], dtype=object)
+
+        # One pass over the response collects the raw columns; parsing and offer-level totals are column-wise
+        itin_offer, itin_duration = [], []
+        seg_offer, seg_number, seg_carrier, seg_stops = [], [], [], []
+        flight, route, aircraft, terminals, dep_at, arr_at, seg_duration = [], [], [], [], [], [], []
+        for i, offer in enumerate(data):
+            for itinerary in offer["itineraries"]:
+                itin_offer.append(i)
+                itin_duration.append(itinerary["duration"])
+                for seg_idx, segment in enumerate(itinerary["segments"], start=1):
+                    departure, arrival = segment["departure"], segment["arrival"]
+                    seg_offer.append(i)
+                    seg_number.append(seg_idx)
+                    seg_carrier.append(segment["carrierCode"])
+                    seg_stops.append(segment.get("numberOfStops", 0))
+                    flight.append(f"{segment['carrierCode']}{segment['number']}")
+                    route.append(f"{departure['iataCode']} - {arrival['iataCode']}")
+                    aircraft.append(segment["aircraft"]["code"] if "aircraft" in segment else "")
+                    terminals.append(f"{departure.get('terminal', '?')} - {arrival.get('terminal', '?')}")
+                    dep_at.append(departure["at"])
+                    arr_at.append(arrival["at"])
+                    seg_duration.append(segment["duration"])
+
+        self.seg_offer = np.array(seg_offer, dtype=np.int64)
+        self.seg_carrier = np.array(seg_carrier, dtype=object)
+        self.seg_count = np.bincount(self.seg_offer, minlength=n).astype(np.int64)
+        self.seg_start = np.concatenate(([0], np.cumsum(self.seg_count)[:-1])).astype(np.int64) if n else np.empty(0, dtype=np.int64)
+        itin_offer = np.array(itin_offer, dtype=np.int64)
+        itin_count = np.bincount(itin_offer, minlength=n)
+        extra_stops = np.bincount(self.seg_offer, weights=np.array(seg_stops, dtype=np.float64), minlength=n)
+        self.stops = (self.seg_count - itin_count + extra_stops).astype(np.int32)
+        self.duration = np.bincount(itin_offer, weights=iso_durations_to_seconds(itin_duration), minlength=n).astype(np.int64)
+        self.carrier = np.array([(offer.get("validatingAirlineCodes") or [seg_carrier[start]])[0]
+                                 for offer, start in zip(data, self.seg_start.tolist())], dtype=object)
+        dep_at, arr_at = np.array(dep_at, dtype=object), np.array(arr_at, dtype=object)
+        self.departure = np.array(dep_at[self.seg_start], dtype='datetime64[s]')
+        self.arrival = np.array(arr_at[self.seg_start + self.seg_count - 1], dtype='datetime64[s]')
+
+        # Segment display strings, formatted once and reused by every render
+        self.seg_label = np.array([f"{o + 1}-{s}" for o, s in zip(seg_offer, seg_number)], dtype=object)
+        self.seg_flight = np.array(flight, dtype=object)
+        self.seg_route = np.array(route, dtype=object)
+        self.seg_aircraft = np.array(aircraft, dtype=object)
+        self.seg_terminals = np.array(terminals, dtype=object)
+        self.seg_dep = np.array(convert_time_formats(dep_at), dtype=object)
+        self.seg_arr = np.array(convert_time_formats(arr_at), dtype=object)
+        self.seg_duration = np.array(durations_to_strings(seg_duration), dtype=object)
+
+    def __len__(self):
+        return len(self.data)
+
+    def select(self, max_stops: int = None, carrier: str = None, depart_from: str = None, depart_to: str = None, max_price: float = None):
+        """
+        Return the indices of offers matching all given filters.
+        max_stops: Maximum number of stops
+        carrier: Airline code that must operate at least one segment
+        depart_from / depart_to: Local departure time-of-day window in HH:MM format (inclusive); other formats raise ValueError
+        max_price: Maximum total price
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if max_stops is not None:
+            mask &= self.stops <= max_stops
+        if max_price is not None:
+            mask &= self.price <= max_price
+        if carrier:
+            hits = np.bincount(self.seg_offer[self.seg_carrier == carrier.strip().upper()], minlength=len(self))
+            mask &= hits > 0
+        if depart_from or depart_to:
+            minutes = (self.departure - self.departure.astype('datetime64[D]')).astype('timedelta64[m]').astype(np.int64)
+            if depart_from:
+                mask &= minutes >= _minutes(depart_from)
+            if depart_to:
+                mask &= minutes <= _minutes(depart_to)
+        return np.flatnonzero(mask)
+
+    def sort(self, index, by: str = "price", descending: bool = False):
+        """
+        Order the offer indices by one of the offer-level columns (stable, ties keep API order).
+        """
+        keys = getattr(self, by)[index]
+        order = np.argsort(keys, kind='stable')
+        if descending:
+            order = order[::-1]
+        return index[order]
+
+    def rows(self, index=None):
+        """
+        Render the segment rows of the given offers (all offers by default), in that order.
+        """
+        if index is None:
+            index = np.arange(len(self))
+        counts = self.seg_count[index]
+        if not counts.sum():
+            return []
+        starts = np.repeat(self.seg_start[index], counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        segs = starts + offsets
+        prices = [f"{self.data[o]['price']['total']} {self.currency[o]}" for o in self.seg_offer[segs]]
+        return [list(row) for row in zip(
+            self.seg_label[segs],
+            self.seg_flight[segs],
+            self.seg_route[segs],
+            self.seg_aircraft[segs],
+            self.seg_terminals[segs],
+            self.seg_dep[segs],
+            self.seg_arr[segs],
+            self.seg_duration[segs],
+            prices,
+        )]
+
+
+def segment_records(data):
+    """
+    Yield one flat record per segment of parsed flight offers, with the offer-level price and carrier
+    repeated on each, for tabular exports.
+    """
+    for offer_number, offer in enumerate(data, start=1):
+        price = offer["price"]
+        carrier = (offer.get("validatingAirlineCodes") or [""])[0]
+        for itinerary_number, itinerary in enumerate(offer["itineraries"], start=1):
+            for segment_number, segment in enumerate(itinerary["segments"], start=1):
+                yield {
+                    "offer": offer_number,
+                    "itinerary": itinerary_number,
+                    "segment": segment_number,
+                    "validating_carrier": carrier,
+                    "flight": f"{segment['carrierCode']}{segment['number']}",
+                    "origin": segment["departure"]["iataCode"],
+                    "destination": segment["arrival"]["iataCode"],
+                    "departure_terminal": segment["departure"].get("terminal"),
+                    "arrival_terminal": segment["arrival"].get("terminal"),
+                    "departure": segment["departure"]["at"],
+                    "arrival": segment["arrival"]["at"],
+                    "duration": segment["duration"],
+                    "aircraft": segment.get("aircraft", {}).get("code"),
+                    "stops": segment.get("numberOfStops", 0),
+                    "total_price": float(price["total"]),
+                    "currency": price["currency"],
+                }
+
+
+def _minutes(hhmm: str) -> int:
+    match = HHMM.fullmatch(hhmm.strip())
+    if not match:
+        raise ValueError(f"Use HH:MM (24-hour) for departure times, e.g. 06:00 or 18:30, not {hhmm.strip()!r}.")
+    return int(match.group(1)) * 60 + int(match.group(2))
@@ -0,0 +1,404 @@
+"""
+Local price history of flight-offer searches, kept in an indexed SQLite database.
+
+Every fresh flight-offer response is ingested as one snapshot of its route and date. Offers are
+deduplicated by itinerary fingerprint (the flights and departure times of all their segments): each
+itinerary is stored once with its latest and lowest price, and a price row is only appended when its
+fare changed since the previous snapshot. Per route and date the cheapest fare of every snapshot is
+kept for trends, together with the previous check for price-drop queries.
+
+Usage:
+    python price_history.py trend SEA JFK 2030-01-01
+    python price_history.py lowest SEA JFK
+    python price_history.py drops
+"""
+import os
+import sys
+import time
+import queue
+import atexit
+import sqlite3
+import hashlib
+import argparse
+import datetime
+import threading
+
+from utils import parse_iso_duration
+
+PRICE_HISTORY_PATH = os.environ.get('FLIGHT_SEARCHER_PRICE_HISTORY', 'price_history.sqlite3')
+# Responses waiting for the writer thread, and the most written in one transaction
+INGEST_QUEUE = 1024
+INGEST_BATCH = 64
+TREND_HEADERS = ["Checked At", "Cheapest Price", "Offers", "Change"]
+FARE_HEADERS = ["Date", "Flight #", "Departure", "Arrival", "Stops", "Lowest Price", "Latest Price", "First Seen", "Last Seen"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    origin TEXT NOT NULL, destination TEXT NOT NULL, departure_date TEXT NOT NULL, adults INTEGER NOT NULL,
+    observed_at REAL NOT NULL, min_price REAL, currency TEXT, offers INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_route ON snapshots (origin, destination, departure_date, adults, observed_at);
+CREATE TABLE IF NOT EXISTS routes (
+    origin TEXT NOT NULL, destination TEXT NOT NULL, departure_date TEXT NOT NULL, adults INTEGER NOT NULL,
+    checked_at REAL NOT NULL, min_price REAL, previous_checked_at REAL, previous_min_price REAL, currency TEXT,
+    PRIMARY KEY (origin, destination, departure_date, adults)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fares (
+    fingerprint TEXT NOT NULL, adults INTEGER NOT NULL,
+    origin TEXT NOT NULL, destination TEXT NOT NULL, departure_date TEXT NOT NULL,
+    flights TEXT, departure TEXT, arrival TEXT, stops INTEGER, duration INTEGER, carrier TEXT,
+    first_seen REAL NOT NULL, last_seen REAL NOT NULL, last_price REAL NOT NULL, lowest_price REAL NOT NULL, currency TEXT,
+    PRIMARY KEY (fingerprint, adults)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS fares_route ON fares (origin, destination, departure_date, adults, lowest_price);
+CREATE TABLE IF NOT EXISTS fare_changes (
+    fingerprint TEXT NOT NULL, adults INTEGER NOT NULL, observed_at REAL NOT NULL, price REAL NOT NULL,
+    PRIMARY KEY (fingerprint, adults, observed_at)
+) WITHOUT ROWID;
+"""
+
+
+def fingerprint(offer) -> str:
+    """
+    Identify the itinerary of a flight offer independently of its price and offer id: the flight
+    numbers, airports and departure times of all its segments.
+    """
+    parts = []
+    for itinerary in offer["itineraries"]:
+        for segment in itinerary["segments"]:
+            parts.append(f"{segment['carrierCode']}{segment['number']}|{segment['departure']['iataCode']}|{segment['departure']['at']}|{segment['arrival']['iataCode']}")
+        parts.append('/')
+    return hashlib.blake2b(';'.join(parts).encode('utf-8'), digest_size=12).hexdigest()
+
+
+def fare_rows(data):
+    """
+    Reduce parsed flight offers to one (fingerprint, price, currency, itinerary fields) row per itinerary,
+    keeping the cheapest price of itineraries offered more than once (e.g. in several fare brands).
+    """
+    fares = {}
+    for offer in data:
+        price = float(offer["price"]["total"])
+        key = fingerprint(offer)
+        seen = fares.get(key)
+        if seen is not None and seen[1] <= price:
+            continue
+        segments = [segment for itinerary in offer["itineraries"] for segment in itinerary["segments"]]
+        fares[key] = (
+            key, price, offer["price"].get("currency"),
+            ' '.join(f"{segment['carrierCode']}{segment['number']}" for segment in segments),
+            segments[0]["departure"]["at"],
+            segments[-1]["arrival"]["at"],
+            len(segments) - len(offer["itineraries"]) + sum(segment.get("numberOfStops", 0) for segment in segments),
+            int(sum(parse_iso_duration(itinerary["duration"]) for itinerary in offer["itineraries"]) // 60),
+            (offer.get("validatingAirlineCodes") or [segments[0]["carrierCode"]])[0],
+        )
+    return list(fares.values())
+
+
+def _route(origin: str, destination: str, departure_date: str, adults: int = 1) -> tuple:
+    return origin.strip().upper(), destination.strip().upper(), departure_date.strip(), int(adults)
+
+
+def _timestamp(value) -> str:
+    return datetime.datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M') if value is not None else ""
+
+
+class PriceHistory:
+    """
+    SQLite store of flight-offer snapshots. The connection is opened on first use and shared by all
+    threads behind a lock; the database runs in WAL mode so readers of other processes are not blocked.
+    path: Database file, or None to keep the history in memory only
+    """
+    def __init__(self, path: str = PRICE_HISTORY_PATH):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(INGEST_QUEUE)
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self.stats = {'snapshots': 0, 'fares': 0, 'price_changes': 0, 'dropped': 0, 'errors': 0}
+
+    def _connect(self):
+        if self._db is None:
+            db = sqlite3.connect(self.path or ':memory:', check_same_thread=False, isolation_level=None)
+            if self.path:
+                db.execute('PRAGMA journal_mode=WAL')
+                # Losing the last snapshots on a power cut is acceptable; an fsync per ingest is not
+                db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def ingest(self, origin: str, destination: str, departure_date: str, adults: int, data, observed_at: float = None) -> int:
+        """
+        Record one flight-offer response as a snapshot of its route and date.
+        Returns the number of distinct itineraries in it.
+        data: Parsed list of flight-offer objects
+        observed_at: Epoch seconds of the response (defaults to now)
+        """
+        return self.ingest_many([(origin, destination, departure_date, adults, data, observed_at)])
+
+    def ingest_many(self, snapshots) -> int:
+        """
+        Record several (origin, destination, departure_date, adults, data, observed_at) responses in one transaction.
+        Returns the number of distinct itineraries in them.
+        """
+        return self._commit([self._prepare(*snapshot) for snapshot in snapshots])
+
+    @staticmethod
+    def _prepare(origin: str, destination: str, departure_date: str, adults: int, data, observed_at: float = None) -> tuple:
+        fares = fare_rows(data)
+        cheapest = min(fares, key=lambda fare: fare[1]) if fares else None
+        return (_route(origin, destination, departure_date, adults), time.time() if observed_at is None else observed_at,
+                fares, (cheapest[1], cheapest[2]) if cheapest else (None, None))
+
+    def _commit(self, prepared) -> int:
+        with self._lock:
+            db = self._connect()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                changes = 0
+                for route, observed_at, fares, (min_price, currency) in prepared:
+                    changes += self._write(db, route, observed_at, fares, min_price, currency)
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            self.stats['snapshots'] += len(prepared)
+            self.stats['fares'] += sum(len(fares) for _, _, fares, _ in prepared)
+            self.stats['price_changes'] += changes
+        return sum(len(fares) for _, _, fares, _ in prepared)
+
+    @staticmethod
+    def _write(db, route, observed_at, fares, min_price, currency) -> int:
+        adults = route[3]
+        db.execute('INSERT INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (*route, observed_at, min_price, currency, len(fares)))
+        db.execute(
+            """INSERT INTO routes VALUES (?, ?, ?, ?, ?, ?, NULL, NULL, ?)
+               ON CONFLICT (origin, destination, departure_date, adults) DO UPDATE SET
+                   previous_checked_at = checked_at, previous_min_price = min_price,
+                   checked_at = excluded.checked_at, min_price = excluded.min_price, currency = excluded.currency""",
+            (*route, observed_at, min_price, currency))
+        # Append a price row only for new itineraries and changed fares
+        changes = db.total_changes
+        db.executemany(
+            """INSERT OR IGNORE INTO fare_changes SELECT ?, ?, ?, ?
+               WHERE NOT EXISTS (SELECT 1 FROM fares WHERE fingerprint = ? AND adults = ? AND last_price = ?)""",
+            [(fare[0], adults, observed_at, fare[1], fare[0], adults, fare[1]) for fare in fares])
+        changes = db.total_changes - changes
+        db.executemany(
+            """INSERT INTO fares VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (fingerprint, adults) DO UPDATE SET
+                   last_seen = excluded.last_seen, last_price = excluded.last_price, currency = excluded.currency,
+                   lowest_price = MIN(lowest_price, excluded.lowest_price)""",
+            [(fare[0], adults, *route[:3], *fare[3:], observed_at, observed_at, fare[1], fare[1], fare[2]) for fare in fares])
+        return changes
+
+    def submit(self, origin: str, destination: str, departure_date: str, adults: int, data):
+        """
+        Queue a response for the writer thread, so searches never wait on the database.
+        Responses are dropped (and counted) while INGEST_QUEUE of them are already waiting.
+        """
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name='price-history-writer', daemon=True)
+                self._writer.start()
+        try:
+            self._queue.put_nowait((origin, destination, departure_date, adults, data, time.time()))
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Everything queued meanwhile goes into the same transaction
+            while len(batch) < INGEST_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                prepared = []
+                for snapshot in batch:
+                    try:
+                        prepared.append(self._prepare(*snapshot))
+                    except (KeyError, IndexError, TypeError, ValueError) as e:
+                        # A malformed response is skipped without losing the rest of the batch
+                        self.stats['errors'] += 1
+                        print(f"Could not record price history: {e}")
+                if prepared:
+                    self._commit(prepared)
+            except sqlite3.Error as e:
+                self.stats['errors'] += 1
+                print(f"Could not record price history: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """
+        Wait until every queued response has been written.
+        """
+        self._queue.join()
+
+    def trend(self, origin: str, destination: str, departure_date: str, adults: int = 1, limit: int = 500) -> list:
+        """
+        Return the cheapest fare of every snapshot of a route and date, oldest first:
+        [{"observed_at", "min_price", "currency", "offers"}].
+        limit: Maximum number of most recent snapshots
+        """
+        rows = self._query(
+            """SELECT observed_at, min_price, currency, offers FROM snapshots
+               WHERE origin = ? AND destination = ? AND departure_date = ? AND adults = ?
+               ORDER BY observed_at DESC LIMIT ?""",
+            (*_route(origin, destination, departure_date, adults), limit))
+        return [{'observed_at': row[0], 'min_price': row[1], 'currency': row[2], 'offers': row[3]} for row in reversed(rows)]
+
+    def lowest_fares(self, origin: str, destination: str, departure_date: str = None, adults: int = 1, limit: int = 10) -> list:
+        """
+        Return the itineraries with the lowest fares ever observed on a route, on one date or on any date.
+        """
+        origin, destination = origin.strip().upper(), destination.strip().upper()
+        sql = """SELECT departure_date, flights, departure, arrival, stops, duration, carrier, lowest_price, last_price, currency, first_seen, last_seen, fingerprint
+                 FROM fares WHERE origin = ? AND destination = ?"""
+        params = [origin, destination]
+        if departure_date:
+            sql += " AND departure_date = ?"
+            params.append(departure_date.strip())
+        sql += " AND adults = ? ORDER BY lowest_price LIMIT ?"
+        params += [int(adults), limit]
+        columns = ('departure_date', 'flights', 'departure', 'arrival', 'stops', 'duration', 'carrier', 'lowest_price', 'last_price', 'currency', 'first_seen', 'last_seen', 'fingerprint')
+        return [dict(zip(columns, row)) for row in self._query(sql, params)]
+
+    def price_drop(self, origin: str, destination: str, departure_date: str, adults: int = 1):
+        """
+        Compare the cheapest fare of the last check of a route and date with the check before it.
+        Returns {"checked_at", "min_price", "previous_checked_at", "previous_min_price", "change", "currency"},
+        with change negative for a drop, or None when the route was never checked.
+        """
+        rows = self._query(
+            """SELECT checked_at, min_price, previous_checked_at, previous_min_price, currency FROM routes
+               WHERE origin = ? AND destination = ? AND departure_date = ? AND adults = ?""",
+            _route(origin, destination, departure_date, adults))
+        if not rows:
+            return None
+        checked_at, min_price, previous_checked_at, previous_min_price, currency = rows[0]
+        change = min_price - previous_min_price if min_price is not None and previous_min_price is not None else None
+        return {'checked_at': checked_at, 'min_price': min_price, 'previous_checked_at': previous_checked_at,
+                'previous_min_price': previous_min_price, 'change': change, 'currency': currency}
+
+    def price_drops(self, limit: int = 20) -> list:
+        """
+        Return the routes and dates whose cheapest fare fell at their last check, largest drop first.
+        """
+        rows = self._query(
+            """SELECT origin, destination, departure_date, adults, previous_min_price, min_price, currency, checked_at FROM routes
+               WHERE min_price < previous_min_price ORDER BY previous_min_price - min_price DESC LIMIT ?""",
+            (limit,))
+        columns = ('origin', 'destination', 'departure_date', 'adults', 'previous_min_price', 'min_price', 'currency', 'checked_at')
+        return [dict(zip(columns, row)) for row in rows]
+
+    def fare_history(self, fingerprint: str, adults: int = 1) -> list:
+        """
+        Return the [(observed_at, price)] changes of one itinerary's fare, oldest first.
+        """
+        return self._query('SELECT observed_at, price FROM fare_changes WHERE fingerprint = ? AND adults = ? ORDER BY observed_at', (fingerprint, int(adults)))
+
+    def info(self) -> dict:
+        return dict(self.stats, queued=self._queue.qsize())
+
+
+price_history = PriceHistory()
+# Write what searches queued before the interpreter exits, e.g. at the end of a batch run
+atexit.register(price_history.flush)
+
+
+def record_offers(query: dict, data):
+    """
+    Queue one fresh flight-offer response for the shared price history.
+    query: Amadeus query parameters of the response, as built by search.offer_query
+    """
+    price_history.submit(query['originLocationCode'], query['destinationLocationCode'], query['departureDate'], query['adults'], data)
+
+
+def trend_rows(origin: str, destination: str, departure_date: str, adults: int = 1) -> list:
+    """
+    Format the price trend of a route and date as table rows: check time, cheapest price, offers and change.
+    """
+    rows = []
+    previous = None
+    for point in price_history.trend(origin, destination, departure_date, adults):
+        price = point['min_price']
+        change = f"{price - previous:+.2f}" if price is not None and previous is not None else ""
+        rows.append([_timestamp(point['observed_at']), "" if price is None else f"{price:.2f} {point['currency']}", point['offers'], change])
+        if price is not None:
+            previous = price
+    return rows
+
+
+def fare_table_rows(origin: str, destination: str, departure_date: str = None, adults: int = 1) -> list:
+    """
+    Format the lowest observed fares of a route as table rows.
+    """
+    return [
+        [fare['departure_date'], fare['flights'], fare['departure'], fare['arrival'], fare['stops'],
+         f"{fare['lowest_price']:.2f} {fare['currency']}", f"{fare['last_price']:.2f} {fare['currency']}",
+         _timestamp(fare['first_seen']), _timestamp(fare['last_seen'])]
+        for fare in price_history.lowest_fares(origin, destination, departure_date, adults)
+    ]
+
+
+def drop_summary(origin: str, destination: str, departure_date: str, adults: int = 1) -> str:
+    """
+    Describe the change of the cheapest fare since the previous check of a route and date.
+    """
+    drop = price_history.price_drop(origin, destination, departure_date, adults)
+    if drop is None or drop['min_price'] is None:
+        return "This route and date have not been searched yet."
+    text = f"Cheapest fare at the last check ({_timestamp(drop['checked_at'])}): {drop['min_price']:.2f} {drop['currency']}."
+    if drop['change'] is None:
+        return text + " No earlier check to compare with."
+    if drop['change'] < 0:
+        return text + f" Down {-drop['change']:.2f} since {_timestamp(drop['previous_checked_at'])}."
+    if drop['change'] > 0:
+        return text + f" Up {drop['change']:.2f} since {_timestamp(drop['previous_checked_at'])}."
+    return text + f" Unchanged since {_timestamp(drop['previous_checked_at'])}."
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the local flight price history.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    trend_parser = subparsers.add_parser('trend', help="Cheapest fare per check of a route and date")
+    lowest_parser = subparsers.add_parser('lowest', help="Lowest fares ever observed on a route")
+    for command_parser in (trend_parser, lowest_parser):
+        command_parser.add_argument('origin')
+        command_parser.add_argument('destination')
+        command_parser.add_argument('date', nargs='?' if command_parser is lowest_parser else None)
+        command_parser.add_argument('--adults', type=int, default=1)
+    drops_parser = subparsers.add_parser('drops', help="Routes whose cheapest fare fell at their last check")
+    drops_parser.add_argument('-n', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == 'trend':
+        print(drop_summary(args.origin, args.destination, args.date, args.adults))
+        for checked_at, price, offers, change in trend_rows(args.origin, args.destination, args.date, args.adults):
+            print(f"{checked_at:<17} {price:>14} {offers:>5} {change:>9}")
+    elif args.command == 'lowest':
+        for row in fare_table_rows(args.origin, args.destination, args.date, args.adults):
+            print("  ".join(str(value) for value in row))
+    else:
+        for drop in price_history.price_drops(args.n):
+            print(f"{drop['origin']}-{drop['destination']} {drop['departure_date']} x{drop['adults']}: "
+                  f"{drop['previous_min_price']:.2f} -> {drop['min_price']:.2f} {drop['currency']} at {_timestamp(drop['checked_at'])}")
+    print(f"{(time.perf_counter() - start) * 1000:.2f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
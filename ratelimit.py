@@ -0,0 +1,92 @@
+import os
+import time
+import asyncio
+import threading
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+    rate: Tokens added per second
+    capacity: Maximum number of tokens (burst size), at least one token (defaults to rate)
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate:g}")
+        self.rate = rate
+        # A bucket holding less than one token could never grant a request
+        self.capacity = max(capacity if capacity is not None else rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """
+        Take tokens if available. Returns 0 on success, otherwise the seconds to wait before retrying.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1, timeout: float = None) -> bool:
+        """
+        Block until tokens are available. Returns False if timeout expires first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1, timeout: float = None) -> bool:
+        """
+        Wait without blocking the event loop until tokens are available. Returns False if timeout expires first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            await asyncio.sleep(wait)
+
+
+def rate_setting(name: str, default: float) -> float:
+    """
+    Read a requests-per-second limit from the environment, rejecting values that are not positive numbers.
+    """
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        rate = float(value)
+    except ValueError:
+        rate = 0
+    if not rate > 0:
+        raise ValueError(f"{name} must be a positive number of requests per second, got {value!r}")
+    return rate
+
+
+# Amadeus Self-Service allows 10 transactions per second per client in the test environment.
+AMADEUS_RATE = rate_setting('FLIGHT_SEARCHER_AMADEUS_RATE', 10)
+amadeus_limiter = TokenBucket(rate=AMADEUS_RATE, capacity=max(AMADEUS_RATE, 1))
+# FlightRadar24 publishes no quota; stay well below the request rate of its own web client.
+FR24_RATE = rate_setting('FLIGHT_SEARCHER_FR24_RATE', 5)
+fr24_limiter = TokenBucket(rate=FR24_RATE, capacity=max(2 * FR24_RATE, 1))
@@ -0,0 +1,220 @@
+"""
+Local record/replay stand-in for the Amadeus and FlightRadar24 HTTP APIs.
+
+Requests are routed by their first path segment: /<upstream host>/<path> is served as
+https://<upstream host>/<path>, and paths without a host segment go to the Amadeus host.
+Point the app at the server with these config.json keys:
+
+    {"host": "127.0.0.1", "port": 8765, "ssl": false, "fr24_base_url": "http://127.0.0.1:8765"}
+
+Usage:
+    python replay_server.py seed                      # build cassettes from the tests/ fixtures
+    python replay_server.py record                    # proxy to the real APIs and save cassettes
+    python replay_server.py replay --latency 0.3 --jitter 0.1 --error-rate 0.02 --rate-limit 10
+"""
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import urllib.request
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from ratelimit import TokenBucket
+
+CASSETTE_DIR = os.path.join('tests', 'cassettes')
+AMADEUS_HOST = 'test.api.amadeus.com'
+TOKEN_PATH = '/v1/security/oauth2/token'
+# Query parameters that change on every call and must not be part of the cassette key
+VOLATILE_PARAMS = {'_', 'timestamp', 'token'}
+
+
+def cassette_key(method: str, host: str, path: str, query: str) -> str:
+    params = sorted((k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k not in VOLATILE_PARAMS)
+    return f"{method.upper()} {host}{path}?{urlencode(params)}"
+
+
+def cassette_path(key: str, cassette_dir: str = CASSETTE_DIR) -> str:
+    return os.path.join(cassette_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+
+def save_cassette(method: str, host: str, path: str, params: dict, status: int, body: str, content_type: str = 'application/json', cassette_dir: str = CASSETTE_DIR):
+    """
+    Store one recorded response.
+    params: Query parameters of the request
+    body: Response body as text
+    """
+    key = cassette_key(method, host, path, urlencode(params or {}))
+    os.makedirs(cassette_dir, exist_ok=True)
+    with open(cassette_path(key, cassette_dir), 'w', encoding='utf-8') as f:
+        json.dump({'key': key, 'status': status, 'content_type': content_type, 'body': body}, f, ensure_ascii=False, indent=2)
+    return key
+
+
+def load_cassette(key: str, cassette_dir: str = CASSETTE_DIR):
+    try:
+        with open(cassette_path(key, cassette_dir), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def seed_from_fixtures(cassette_dir: str = CASSETTE_DIR):
+    """
+    Build replay cassettes for the queries captured in tests/SEA-JFK.txt and tests/SEA.txt.
+    """
+    with open('tests/SEA-JFK.txt', 'r', encoding='utf-8') as f:
+        offers = json.load(f)
+    with open('tests/SEA.txt', 'r', encoding='utf-8') as f:
+        routes = json.load(f)
+    keys = [
+        save_cassette('GET', AMADEUS_HOST, '/v2/shopping/flight-offers', {
+            'originLocationCode': 'SEA', 'destinationLocationCode': 'JFK',
+            'departureDate': offers[0]['itineraries'][0]['segments'][0]['departure']['at'][:10],
+            'adults': 1, 'currencyCode': 'USD',
+        }, 200, json.dumps({'meta': {'count': len(offers)}, 'data': offers}), cassette_dir=cassette_dir),
+        save_cassette('GET', AMADEUS_HOST, '/v1/airport/direct-destinations', {'departureAirportCode': 'SEA'},
+                      200, json.dumps({'meta': {'count': len(routes)}, 'data': routes}), cassette_dir=cassette_dir),
+    ]
+    for key in keys:
+        print(f"Seeded {key}")
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FlightSearcherReplay/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.options.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        data = body.encode('utf-8') if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self):
+        url = urlsplit(self.path)
+        first, _, rest = url.path.lstrip('/').partition('/')
+        if '.' in first:
+            return first, '/' + rest, url.query
+        return self.server.options.amadeus_host, url.path, url.query
+
+    def _handle(self, method):
+        options = self.server.options
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = self.rfile.read(length) if length else None
+        host, path, query = self._route()
+
+        if options.latency or options.jitter:
+            time.sleep(max(0.0, options.latency + random.uniform(-options.jitter, options.jitter)))
+        if self.server.limiter is not None and self.server.limiter.try_acquire() > 0:
+            return self._send(429, json.dumps({'errors': [{'status': 429, 'code': 38194, 'title': 'Too many requests'}]}), headers={'Retry-After': '1'})
+        if options.error_rate and random.random() < options.error_rate:
+            return self._send(random.choice([500, 502, 503]), json.dumps({'errors': [{'status': 500, 'title': 'Injected error'}]}))
+
+        if path == TOKEN_PATH and options.mode != 'record':
+            return self._send(200, json.dumps({'type': 'amadeusOAuth2Token', 'access_token': 'replay-token', 'expires_in': 1799, 'state': 'approved'}))
+
+        key = cassette_key(method, host, path, query)
+        if options.mode == 'record':
+            return self._record(method, host, path, query, payload, key)
+
+        cassette = load_cassette(key, options.cassette_dir)
+        if cassette is None:
+            return self._send(404, json.dumps({'errors': [{'status': 404, 'title': 'No cassette', 'detail': key}]}))
+        self._send(cassette['status'], cassette['body'], cassette.get('content_type', 'application/json'))
+
+    def _record(self, method, host, path, query, payload, key):
+        url = f"https://{host}{path}" + (f"?{query}" if query else '')
+        headers = {name: value for name, value in self.headers.items() if name.lower() not in ('host', 'content-length', 'connection', 'accept-encoding')}
+        request = urllib.request.Request(url, data=payload, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                status, body, content_type = response.status, response.read(), response.headers.get('Content-Type', 'application/json')
+        except HTTPError as e:
+            status, body, content_type = e.code, e.read(), e.headers.get('Content-Type', 'application/json')
+        except URLError as e:
+            return self._send(502, json.dumps({'errors': [{'status': 502, 'title': f"Upstream unreachable: {e.reason}"}]}))
+
+        # Never write OAuth tokens to disk
+        if path != TOKEN_PATH and status < 500:
+            os.makedirs(self.server.options.cassette_dir, exist_ok=True)
+            with open(cassette_path(key, self.server.options.cassette_dir), 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'status': status, 'content_type': content_type, 'body': body.decode('utf-8', 'replace')}, f, ensure_ascii=False, indent=2)
+            print(f"Recorded {key} ({status})")
+        self._send(status, body, content_type)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+def make_server(options):
+    """
+    Create (but do not start) a threaded replay server for the given options namespace.
+    """
+    server = ThreadingHTTPServer((options.bind, options.port), ReplayHandler)
+    server.daemon_threads = True
+    server.options = options
+    server.limiter = TokenBucket(options.rate_limit, options.rate_limit) if options.rate_limit else None
+    return server
+
+
+def start_in_background(**overrides):
+    """
+    Start a replay server on a daemon thread, e.g. for load tests. Returns the server.
+    """
+    options = parse_args(['replay'])
+    for name, value in overrides.items():
+        setattr(options, name, value)
+    server = make_server(options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Record/replay stand-in for the Amadeus and FlightRadar24 APIs.")
+    parser.add_argument('mode', choices=['replay', 'record', 'seed'])
+    parser.add_argument('--bind', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cassette-dir', default=CASSETTE_DIR)
+    parser.add_argument('--amadeus-host', default=AMADEUS_HOST, help="Upstream host for paths without a host segment")
+    parser.add_argument('--latency', type=float, default=0.0, help="Added latency per request in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Uniform +/- jitter on the latency in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with a 5xx")
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="Requests per second before answering 429 (0 disables)")
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    if options.mode == 'seed':
+        seed_from_fixtures(options.cassette_dir)
+        return 0
+    server = make_server(options)
+    print(f"{options.mode.title()} server listening on http://{options.bind}:{options.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
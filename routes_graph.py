@@ -0,0 +1,270 @@
+"""
+Route graph built from Amadeus direct-destination responses, for finding connecting routes offline.
+
+Every fetched direct-destinations response replaces the out-edges of its origin airport; edge weights
+are great-circle distances between the airports. Airports whose own network has not been fetched yet
+are assumed to serve the routes seen into them in the other direction, so the graph is useful after
+searching only a few hubs. The graph is persisted as JSON and reloaded at startup.
+
+Usage:
+    python routes_graph.py seed               # build from tests/SEA.txt and the on-disk route cache
+    python routes_graph.py find SEA JFK --max-stops 1 -k 5
+"""
+import os
+import sys
+import json
+import math
+import heapq
+import time
+import argparse
+import threading
+
+ROUTES_GRAPH_PATH = os.environ.get('FLIGHT_SEARCHER_ROUTES_GRAPH', 'routes_graph.json')
+EARTH_RADIUS_KM = 6371.0
+# Connections longer than this multiple of the direct distance are not plausible itineraries
+MAX_DETOUR = 1.6
+# Upper bound on expanded search states per query, so a pathological graph cannot stall a request
+MAX_EXPANSIONS = 200000
+
+
+def haversine_km(a, b) -> float:
+    """
+    Great-circle distance in kilometers between two (latitude, longitude) pairs.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+class RouteGraph:
+    """
+    Directed airport route graph with coordinates, persisted to a JSON file.
+    path: JSON file the graph is loaded from and saved to, or None to keep it in memory only
+    """
+    def __init__(self, path: str = ROUTES_GRAPH_PATH):
+        self.path = path
+        self.coords = {}
+        self.edges = {}
+        self.fetched_at = {}
+        self._reverse = {}
+        self._weights = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self.coords = {code: tuple(point) for code, point in data.get('coords', {}).items()}
+            self.edges = {origin: set(destinations) for origin, destinations in data.get('edges', {}).items()}
+            self.fetched_at = data.get('fetched_at', {})
+            self._reindex()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {
+                'coords': self.coords,
+                'edges': {origin: sorted(destinations) for origin, destinations in self.edges.items()},
+                'fetched_at': self.fetched_at,
+            }
+        tmp = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp, self.path)
+
+    def _reindex(self):
+        self._reverse = {}
+        for origin, destinations in self.edges.items():
+            for destination in destinations:
+                self._reverse.setdefault(destination, set()).add(origin)
+        self._weights = {}
+
+    def add_routes(self, origin: str, destinations, origin_coords=None) -> bool:
+        """
+        Replace the direct network of origin with a direct-destinations response. Returns True if the graph changed.
+        destinations: Parsed Amadeus direct-destination entries (iataCode and geoCode are used)
+        origin_coords: Optional (latitude, longitude) of origin, when it is not known from other responses
+        """
+        origin = origin.strip().upper()
+        codes = set()
+        with self._lock:
+            changed = False
+            if origin_coords is not None and self.coords.get(origin) != tuple(origin_coords):
+                self.coords[origin] = tuple(origin_coords)
+                changed = True
+            for place in destinations or []:
+                code, geo = place.get('iataCode'), place.get('geoCode') or {}
+                if not code or code == origin:
+                    continue
+                codes.add(code)
+                if geo.get('latitude') is not None and code not in self.coords:
+                    self.coords[code] = (geo['latitude'], geo['longitude'])
+                    changed = True
+            if self.edges.get(origin) != codes:
+                self.edges[origin] = codes
+                changed = True
+            self.fetched_at[origin] = time.time()
+            if changed:
+                self._reindex()
+        return changed
+
+    def neighbors(self, code: str):
+        """
+        Airports reachable nonstop from code: its fetched network, or the reverse of the routes seen into it.
+        """
+        if code in self.edges:
+            return self.edges[code]
+        return self._reverse.get(code, ())
+
+    def weight(self, a: str, b: str):
+        key = (a, b)
+        weight = self._weights.get(key)
+        if weight is None:
+            if a not in self.coords or b not in self.coords:
+                return None
+            weight = self._weights[key] = haversine_km(self.coords[a], self.coords[b])
+        return weight
+
+    def find_connections(self, origin: str, destination: str, k: int = 5, max_stops: int = 1, max_detour: float = MAX_DETOUR):
+        """
+        Return up to k shortest simple routes from origin to destination with at most max_stops stops,
+        shortest first, as (total distance in km, [airport codes]) tuples.
+        Routes longer than max_detour times the direct distance are skipped.
+        Best-first search with the remaining great-circle distance as an admissible heuristic, so the first
+        k routes that reach the destination are the k shortest; each airport is expanded at most k times per depth.
+        """
+        origin, destination = origin.strip().upper(), destination.strip().upper()
+        if origin == destination or origin not in self.coords or destination not in self.coords:
+            return []
+        target = self.coords[destination]
+        direct = haversine_km(self.coords[origin], target)
+        limit = direct * max_detour if direct else float('inf')
+        max_legs = max_stops + 1
+
+        routes = []
+        counter = 0
+        heap = [(direct, 0.0, counter, (origin,))]
+        expansions = 0
+        # A partial route through an airport at a given depth can only be part of the k shortest routes
+        # if fewer than k shorter partial routes reached that airport at that depth before it
+        settled = {}
+        remaining_km = {destination: 0.0}
+        while heap and len(routes) < k and expansions < MAX_EXPANSIONS:
+            _, distance, _, path = heapq.heappop(heap)
+            node = path[-1]
+            if node == destination:
+                routes.append((distance, list(path)))
+                continue
+            if len(path) > max_legs:
+                continue
+            depth = (node, len(path))
+            if settled.get(depth, 0) >= k:
+                continue
+            settled[depth] = settled.get(depth, 0) + 1
+            expansions += 1
+            last_leg = len(path) == max_legs
+            for neighbor in self.neighbors(node):
+                if neighbor in path or (last_leg and neighbor != destination):
+                    continue
+                leg = self.weight(node, neighbor)
+                if leg is None:
+                    continue
+                travelled = distance + leg
+                remaining = remaining_km.get(neighbor)
+                if remaining is None:
+                    remaining = remaining_km[neighbor] = haversine_km(self.coords[neighbor], target)
+                estimate = travelled + remaining
+                if estimate > limit:
+                    continue
+                counter += 1
+                heapq.heappush(heap, (estimate, travelled, counter, path + (neighbor,)))
+        return routes
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                'airports': len(self.coords),
+                'fetched_airports': len(self.edges),
+                'routes': sum(len(destinations) for destinations in self.edges.values()),
+            }
+
+
+route_graph = RouteGraph()
+
+
+def add_destinations(origin: str, destinations, origin_coords=None):
+    """
+    Add one direct-destinations response to the shared graph and persist it if it changed.
+    """
+    try:
+        if route_graph.add_routes(origin, destinations, origin_coords):
+            route_graph.save()
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Could not update route graph: {e}")
+
+
+def connection_rows(routes, direct_km: float = None) -> list:
+    """
+    Format find_connections results as table rows: route, stops, distance and detour over the direct distance.
+    """
+    rows = []
+    for distance, path in routes:
+        detour = f"{(distance / direct_km - 1) * 100:.0f}%" if direct_km else ""
+        rows.append([" - ".join(path), len(path) - 2, round(distance), detour])
+    return rows
+
+
+def legs_to_price(routes) -> list:
+    """
+    Return the distinct (origin, destination) legs of candidate routes, in route order: the flight-offer
+    searches worth making to price those connections.
+    """
+    return list(dict.fromkeys((a, b) for _, path in routes for a, b in zip(path, path[1:])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the offline route graph.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    seed_parser = subparsers.add_parser('seed', help="Build the graph from tests/SEA.txt and the on-disk route cache")
+    seed_parser.add_argument('--cache-dir', default=os.environ.get('FLIGHT_SEARCHER_CACHE_DIR'))
+    find_parser = subparsers.add_parser('find', help="Find connecting routes")
+    find_parser.add_argument('origin')
+    find_parser.add_argument('destination')
+    find_parser.add_argument('-k', type=int, default=5)
+    find_parser.add_argument('--max-stops', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.command == 'seed':
+        with open('tests/SEA.txt', 'r', encoding='utf-8') as f:
+            add_destinations('SEA', json.load(f), origin_coords=(47.44898, -122.30931))
+        cache_dir = os.path.join(args.cache_dir, 'direct_destinations') if args.cache_dir else None
+        if cache_dir and os.path.isdir(cache_dir):
+            for filename in os.listdir(cache_dir):
+                try:
+                    with open(os.path.join(cache_dir, filename), 'r', encoding='utf-8') as f:
+                        entry = json.load(f)
+                    add_destinations(json.loads(entry['key'])[0], entry['value'])
+                except (OSError, ValueError, KeyError, IndexError):
+                    continue
+        print(route_graph.info())
+        return 0
+
+    start = time.perf_counter()
+    routes = route_graph.find_connections(args.origin, args.destination, k=args.k, max_stops=args.max_stops)
+    elapsed = (time.perf_counter() - start) * 1000
+    direct = route_graph.weight(args.origin.upper(), args.destination.upper())
+    for route, stops, distance, detour in connection_rows(routes, direct):
+        print(f"{route:<24} stops {stops}  {distance:>6} km  +{detour}")
+    print(f"{len(routes)} routes in {elapsed:.2f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
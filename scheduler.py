@@ -0,0 +1,328 @@
+"""
+Quota-aware scheduler that every outbound Amadeus and FlightRadar24 call goes through.
+
+Each provider has a token bucket matched to its quota (see ratelimit.py), and callers wait for a token
+in priority order: INTERACTIVE calls (a user's search) are served before BACKGROUND ones (fan-outs,
+background refreshes, live-flight snapshots), and background calls are turned away while the
+provider's queue is full. Calls failing with a 429, a 5xx or a network error are retried with
+jittered exponential backoff; a 429 also pauses the whole provider for its Retry-After. After
+FAILURE_THRESHOLD calls in a row have failed, the provider's circuit opens and calls fail fast for
+COOLDOWN seconds, after which a single probe call decides whether it closes again.
+
+Calls the scheduler refuses raise UpstreamUnavailable, so callers can serve stale cached data or an
+error row instead of failing the whole request. Queue waits and retries are exported as metrics, queue
+depth and circuit state through stats().
+"""
+import sys
+import time
+import random
+import asyncio
+import threading
+
+import httpx
+
+import metrics
+from ratelimit import amadeus_limiter, fr24_limiter
+
+# Failures to connect or to get a response in time; other errors (e.g. an unparseable body) are not retried
+NETWORK_ERRORS = (ConnectionError, TimeoutError, httpx.TransportError)
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = ('interactive', 'background')
+
+MAX_RETRIES = 3
+# Bounds in seconds of the exponential backoff between retries
+BASE_DELAY = 0.5
+MAX_DELAY = 10.0
+FAILURE_THRESHOLD = 5
+COOLDOWN = 30.0
+# Seconds a call may wait for a token before it is given up, per priority
+MAX_WAIT = (30.0, 120.0)
+# Background calls are refused while this many calls wait for the same provider
+MAX_BACKGROUND_QUEUE = 256
+
+
+class UpstreamUnavailable(Exception):
+    """
+    The scheduler did not send a call because the provider is failing or overloaded.
+    """
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+class OverloadedError(UpstreamUnavailable):
+    pass
+
+
+def error_status(error):
+    """
+    Return the HTTP status of a failed upstream call (Amadeus SDK, async client, requests or httpx), or None.
+    """
+    status = getattr(error, 'status', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status if isinstance(status, int) else None
+
+
+def is_transient(error) -> bool:
+    """
+    Whether a failed call may succeed when retried: rate limited, server error or network failure.
+    """
+    status = error_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    if getattr(error, 'code', None) == 'NetworkError' or isinstance(error, NETWORK_ERRORS):
+        return True
+    # The FlightRadar24 SDK raises requests errors, which all derive from OSError; requests is only
+    # looked up here, since it is already imported whenever one of its errors was raised
+    requests = sys.modules.get('requests')
+    return requests is not None and isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def retry_after(error):
+    """
+    Return the Retry-After of a failed call in seconds, or None when it has none.
+    """
+    value = getattr(error, 'retry_after', None)
+    if value is None:
+        response = getattr(error, 'response', None)
+        # Amadeus SDK responses keep the urllib response they were parsed from
+        headers = getattr(response, 'headers', None) or getattr(getattr(response, 'http_response', None), 'headers', None)
+        try:
+            value = headers.get('Retry-After')
+        except AttributeError:
+            return None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class Provider:
+    """
+    Scheduling state of one upstream API: its token bucket, waiting callers per priority, backoff and circuit breaker.
+    name: Provider name used in metrics
+    bucket: TokenBucket matched to the provider's quota
+    title: Provider name shown in errors
+    max_wait: Seconds a call may wait for a token, per priority
+    """
+    def __init__(self, name: str, bucket, title: str = None, max_retries: int = MAX_RETRIES, failure_threshold: int = FAILURE_THRESHOLD,
+                 cooldown: float = COOLDOWN, max_wait=MAX_WAIT, max_background_queue: int = MAX_BACKGROUND_QUEUE):
+        self.name = name
+        self.bucket = bucket
+        self.title = title or name
+        self.max_retries = max_retries
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_wait = max_wait
+        self.max_background_queue = max_background_queue
+        self._lock = threading.Lock()
+        self._waiting = [0] * len(PRIORITY_NAMES)
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._paused_until = 0.0
+        self.stats = {'calls': 0, 'retries': 0, 'rate_limited': 0, 'failures': 0, 'rejected': 0, 'circuit_opens': 0}
+
+    def _admit(self, priority: int) -> bool:
+        """
+        Let a call in, or refuse it while the circuit is open or the background queue is full.
+        Returns True when the call is the probe of a half-open circuit.
+        """
+        with self._lock:
+            if priority != INTERACTIVE and sum(self._waiting) >= self.max_background_queue:
+                self.stats['rejected'] += 1
+                raise OverloadedError(f"Too many {self.title} requests are queued, try again shortly.")
+            probe = False
+            if self._opened_at is not None:
+                remaining = self._opened_at + self.cooldown - time.monotonic()
+                if remaining > 0 or self._probing:
+                    self.stats['rejected'] += 1
+                    raise CircuitOpenError(f"{self.title} is temporarily unavailable after repeated errors, try again in {max(remaining, 1):.0f} s.")
+                self._probing = probe = True
+            self.stats['calls'] += 1
+            return probe
+
+    def _try_take(self, priority: int) -> float:
+        """
+        Take a token if it is this caller's turn. Returns 0 on success, otherwise the seconds to wait before retrying.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if any(self._waiting[:priority]):
+                # Leave the next token to the higher-priority callers
+                return 1 / self.bucket.rate
+            return self.bucket.try_acquire()
+
+    def _enqueue(self, priority: int, count: int):
+        with self._lock:
+            self._waiting[priority] += count
+
+    def _give_up(self, priority: int):
+        with self._lock:
+            self.stats['rejected'] += 1
+        raise OverloadedError(f"{self.title} is busy, no request slot was free within {self.max_wait[priority]:g} s.")
+
+    def _take(self, priority: int):
+        """
+        Block until this caller may send a request.
+        """
+        start = time.monotonic()
+        deadline = start + self.max_wait[priority]
+        self._enqueue(priority, 1)
+        try:
+            while True:
+                wait = self._try_take(priority)
+                if wait == 0:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._give_up(priority)
+                time.sleep(min(wait, remaining))
+        finally:
+            self._enqueue(priority, -1)
+            metrics.scheduler_wait.observe(time.monotonic() - start, self.name, PRIORITY_NAMES[priority])
+
+    async def _take_async(self, priority: int):
+        """
+        Wait without blocking the event loop until this caller may send a request.
+        """
+        start = time.monotonic()
+        deadline = start + self.max_wait[priority]
+        self._enqueue(priority, 1)
+        try:
+            while True:
+                wait = self._try_take(priority)
+                if wait == 0:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._give_up(priority)
+                await asyncio.sleep(min(wait, remaining))
+        finally:
+            self._enqueue(priority, -1)
+            metrics.scheduler_wait.observe(time.monotonic() - start, self.name, PRIORITY_NAMES[priority])
+
+    def _backoff(self, error, attempt: int):
+        """
+        Return the seconds to wait before retrying a failed call, or None when it must not be retried.
+        A 429 pauses every call of the provider until its Retry-After has passed.
+        """
+        if attempt >= self.max_retries or not is_transient(error):
+            return None
+        status = error_status(error)
+        delay = retry_after(error) if status == 429 else None
+        if delay is None:
+            # Full jitter: concurrent callers that failed together retry spread out instead of in lockstep
+            delay = random.uniform(0, BASE_DELAY * 2 ** attempt)
+        delay = min(delay, MAX_DELAY)
+        with self._lock:
+            self.stats['retries'] += 1
+            if status == 429:
+                self.stats['rate_limited'] += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        metrics.scheduler_retries.inc(self.name, str(status) if status else 'network')
+        return delay
+
+    def _record(self, probe: bool, error=None):
+        """
+        Update the circuit breaker with the outcome of a call; only transient errors count as failures.
+        """
+        with self._lock:
+            if error is None or not is_transient(error):
+                self._failures = 0
+                self._opened_at = None
+            else:
+                self.stats['failures'] += 1
+                self._failures += 1
+                if probe or (self._opened_at is None and self._failures >= self.failure_threshold):
+                    self.stats['circuit_opens'] += 1
+                    self._opened_at = time.monotonic()
+                    print(f"{self.title} circuit opened after {self._failures} failed calls: {error}")
+            if probe:
+                self._probing = False
+
+    def _end_probe(self):
+        with self._lock:
+            self._probing = False
+
+    def call(self, stage: str, fn, priority: int = INTERACTIVE):
+        """
+        Send a request once a token is available, retrying transient failures with backoff.
+        stage: Metrics stage timing each attempt
+        fn: Function making one upstream request
+        priority: INTERACTIVE or BACKGROUND
+        """
+        probe = self._admit(priority)
+        try:
+            for attempt in range(self.max_retries + 1):
+                self._take(priority)
+                try:
+                    with metrics.span(stage):
+                        result = fn()
+                except Exception as error:
+                    delay = self._backoff(error, attempt)
+                    if delay is None:
+                        self._record(probe, error)
+                        raise
+                    time.sleep(delay)
+                    continue
+                self._record(probe)
+                return result
+        finally:
+            if probe:
+                self._end_probe()
+
+    async def call_async(self, stage: str, fn, priority: int = INTERACTIVE):
+        """
+        Async counterpart of call.
+        fn: Coroutine function making one upstream request
+        """
+        probe = self._admit(priority)
+        try:
+            for attempt in range(self.max_retries + 1):
+                await self._take_async(priority)
+                try:
+                    with metrics.span(stage):
+                        result = await fn()
+                except Exception as error:
+                    delay = self._backoff(error, attempt)
+                    if delay is None:
+                        self._record(probe, error)
+                        raise
+                    await asyncio.sleep(delay)
+                    continue
+                self._record(probe)
+                return result
+        finally:
+            if probe:
+                self._end_probe()
+
+    def info(self) -> dict:
+        """
+        Return the call counters with the current queue depth per priority and the circuit state.
+        """
+        with self._lock:
+            now = time.monotonic()
+            info = dict(self.stats, consecutive_failures=self._failures, circuit_open=self._opened_at is not None,
+                        paused_seconds=max(self._paused_until - now, 0.0))
+            for name, waiting in zip(PRIORITY_NAMES, self._waiting):
+                info[f'queued_{name}'] = waiting
+        return info
+
+
+amadeus = Provider('amadeus', amadeus_limiter, 'Amadeus')
+fr24 = Provider('fr24', fr24_limiter, 'FlightRadar24')
+PROVIDERS = (amadeus, fr24)
+
+
+def stats():
+    """
+    Return the scheduling counters, queue depth and circuit state of every provider.
+    """
+    return {provider.name: provider.info() for provider in PROVIDERS}
@@ -1,122 +1,686 @@
-from amadeus import Client, ResponseError
-import json
-from utils import convert_time_format, duration_to_string
-
-cached_results = ['', '']
-
-def search_cheapest_flights(origin_airport: str, destination_airport: str, departure_date: str, adults: int = 1, testing: bool = False):
-    try:
-        '''
-        Find the cheapest flights from origin_airport to destination_airport
-
-        origin_airport: IATA code of the origin airport
-        destination_airport: IATA code of the destination airport
-        departure_date: Date of departure in YYYY-MM-DD format
-        adults: Number of adults traveling (default is 1)
-        testing: If you want to test the function without making an API call, you can use a local file with sample data.
-        '''
-        # Load client_id and client_secret and authenticate
-        with open('config.json', 'r') as f:
-            config = json.load(f)
-            client_id = config['client_id']
-            client_secret = config['client_secret']
-
-        # Initialize Amadeus client
-        amadeus = Client(
-            client_id=client_id,
-            client_secret=client_secret
-        )
-        
-        if not testing:
-            # Make the API call to search for flight offers
-            response = amadeus.shopping.flight_offers_search.get(
-                originLocationCode=origin_airport,
-                destinationLocationCode=destination_airport,
-                departureDate=departure_date,
-                adults=adults,
-                currencyCode="USD"
-            )
-            cached_results[0] = json.dumps(response.data, indent=2)
-            return print_cheapest_flights(cached_results[0])
-
-        # For testing, read from a local file
-        elif testing:
-            response = open('tests/SEA-JFK.txt', 'r')
-            cached_results[0] = ''
-            return print_cheapest_flights(response.read())
-    except ResponseError as error:
-        raise error
-
-def print_cheapest_flights(flights_data: str):
-    response = json.loads(flights_data)
-    # In print_cheapest_flights, build a flat list of rows with an "Offer" column
-    rows = []
-    for flight_idx, flight in enumerate(response):
-        price_total = flight["price"]["total"]
-        price_currency = flight["price"]["currency"]
-        for itinerary in flight["itineraries"]:
-            for seg_idx, segment in enumerate(itinerary["segments"]):
-                rows.append([
-                    f"{flight_idx+1}-{seg_idx+1}",
-                    f"{segment['carrierCode']}{segment['number']}",
-                    f"{segment['departure']['iataCode']} - {segment['arrival']['iataCode']}",
-                    segment["aircraft"]["code"] if "aircraft" in segment else "",
-                    f"{segment['departure'].get('terminal', '?')} - {segment['arrival'].get('terminal', '?')}",
-                    convert_time_format(segment["departure"]["at"]),
-                    convert_time_format(segment["arrival"]["at"]),
-                    duration_to_string(segment["duration"]),
-                    f"{price_total} {price_currency}"
-                ])
-    return rows
-
-def search_airport_routes(airport_name: str, testing: bool = False):
-    """
-    Search for airport routes by airport name or IATA code
-    airport_name: Name or IATA code of the airport to search for routes
-    testing: If you want to test the function without making an API call, you can use a local file with sample data.
-    """
-    try:
-        # Load client_id and client_secret and authenticate
-        with open('config.json', 'r') as f:
-            config = json.load(f)
-            client_id = config['client_id']
-            client_secret = config['client_secret']
-
-        # Initialize Amadeus client
-        amadeus = Client(
-            client_id=client_id,
-            client_secret=client_secret
-        )
-        if not testing:
-            # Make the API call to search for direct destinations from the airport
-            response = amadeus.airport.direct_destinations.get(departureAirportCode=airport_name)
-            cached_results[1] = json.dumps(response.data, indent=2)
-            return print_airport_routes(cached_results[1])
-
-        # For testing, read from a local file
-        elif testing:
-            with open('tests/SEA.txt', 'r') as f:
-                cached_results[1] = ''
-                return print_airport_routes(f.read())
-    except ResponseError as error:
-        raise error
-
-def print_airport_routes(routes_data: str):
-    """
-    Print the airport routes in a flat list format
-    routes_data: JSON string containing the airport routes data
-    """
-    response = json.loads(routes_data)
-    # Build a flat list of rows with airport route details
-    rows = []
-    for city in response:
-        rows.append([
-            city["iataCode"],
-            city["name"].title(),
-            city["address"]["stateCode"] if "stateCode" in city["address"] else "",
-            city["address"]["countryCode"],
-            city["address"]["regionCode"],
-            city["geoCode"]["latitude"],
-            city["geoCode"]["longitude"],
-        ])
-    return rows
\ No newline at end of file
+from amadeus import ResponseError
+import json
+import os
+import asyncio
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from amadeus_client import get_client, get_async_client
+from cache import TTLCache, MISSING
+import scheduler
+from scheduler import INTERACTIVE, BACKGROUND, UpstreamUnavailable
+from offers import OfferTable, SORT_COLUMNS
+from session import get_session
+import metrics
+from utils import create_airport_map
+from airports import airports, add_destinations, resolve_code
+import routes_graph
+from routes_graph import RouteGraph, route_graph, connection_rows, legs_to_price
+from price_history import record_offers
+
+
+# Prices change often, the direct route network rarely.
+OFFERS_TTL = 10 * 60
+ROUTES_TTL = 24 * 60 * 60
+# Seconds past expiry that offers are still served while Amadeus is unavailable
+OFFERS_MAX_STALE = 60 * 60
+CACHE_DIR = os.environ.get('FLIGHT_SEARCHER_CACHE_DIR')
+MAX_FLEXIBLE_DAYS = 31
+MAX_EXPLORE_REQUESTS = 60
+# Concurrent upstream searches of one async fan-out; requests are also paced by the scheduler
+ASYNC_MAX_CONCURRENCY = 16
+ROUTE_HEADERS = ["IATA Code", "Name", "State", "Country", "Region", "Latitude", "Longitude"]
+CONNECTION_HEADERS = ["Route", "Stops", "Distance (km)", "Detour", "Cheapest Legs", "Note"]
+# Origin of the tests/SEA.txt fixture, used in testing mode
+TESTING_ORIGIN = {'iataCode': 'SEA', 'name': 'SEATTLE-TACOMA INTL', 'latitude': 47.44898, 'longitude': -122.30931}
+
+offers_cache = TTLCache('flight_offers', ttl=OFFERS_TTL, maxsize=256, disk_dir=CACHE_DIR)
+routes_cache = TTLCache('direct_destinations', ttl=ROUTES_TTL, maxsize=512, disk_dir=CACHE_DIR)
+locations_cache = TTLCache('airport_locations', ttl=ROUTES_TTL, maxsize=1024, disk_dir=CACHE_DIR)
+# Rendered route maps are folium objects, so they are kept in memory only
+route_maps_cache = TTLCache('route_maps', ttl=ROUTES_TTL, maxsize=64)
+# Failed or refused Amadeus calls; fan-outs report them per row instead of failing the whole search
+UPSTREAM_ERRORS = (ResponseError, UpstreamUnavailable)
+
+def fetch_flight_offers(origin_airport: str, destination_airport: str, departure_date: str, adults: int = 1, testing: bool = False, priority: int = INTERACTIVE):
+    """
+    Fetch the raw flight offers for one query, served from the cache when possible.
+    Returns the parsed list of flight-offer objects.
+    testing: Read the offers from tests/SEA-JFK.txt instead of calling the API.
+    priority: Scheduler priority of the request (BACKGROUND for fan-outs)
+    """
+    if testing:
+        with open('tests/SEA-JFK.txt', 'r') as f:
+            return json.load(f)
+
+    query = offer_query(origin_airport, destination_airport, departure_date, adults)
+    key = TTLCache.make_key(*query.values())
+    data = offers_cache.get(key, MISSING)
+    if data is MISSING:
+        # Reuse the shared Amadeus client (cached token, pooled connections)
+        amadeus = get_client()
+        # Make the API call to search for flight offers, paced and retried by the scheduler
+        try:
+            response = scheduler.amadeus.call('amadeus.flight_offers', lambda: amadeus.shopping.flight_offers_search.get(**query, currencyCode="USD"), priority)
+        except UPSTREAM_ERRORS as error:
+            return stale_or_raise(offers_cache, key, error, OFFERS_MAX_STALE)
+        data = response.data
+        store_offers(query, key, data)
+    return data
+
+def store_offers(query: dict, key, data):
+    """
+    Cache a fresh flight-offer response and record it in the price history.
+    """
+    offers_cache.set(key, data)
+    record_offers(query, data)
+
+def stale_or_raise(cache: TTLCache, key, error, max_stale: float = None):
+    """
+    Serve the expired cache entry for key when an upstream call failed for a transient reason, otherwise re-raise the error.
+    """
+    transient = isinstance(error, UpstreamUnavailable) or scheduler.is_transient(error)
+    data = cache.get_stale(key, MISSING, max_stale) if transient else MISSING
+    if data is MISSING:
+        raise error
+    print(f"Serving a stale {cache.name} entry: {error}")
+    return data
+
+def offer_query(origin_airport: str, destination_airport: str, departure_date: str, adults: int = 1) -> dict:
+    """
+    Normalize a flight-offer search into its Amadeus query parameters (also the offer cache key, in order).
+    """
+    return {
+        'originLocationCode': origin_airport.strip().upper(),
+        'destinationLocationCode': destination_airport.strip().upper(),
+        'departureDate': departure_date.strip(),
+        'adults': int(adults),
+    }
+
+def search_cheapest_flights(origin_airport: str, destination_airport: str, departure_date: str, adults: int = 1, testing: bool = False, session: dict = None):
+    try:
+        '''
+        Find the cheapest flights from origin_airport to destination_airport
+
+        origin_airport: IATA code of the origin airport
+        destination_airport: IATA code of the destination airport
+        departure_date: Date of departure in YYYY-MM-DD format
+        adults: Number of adults traveling (default is 1)
+        testing: If you want to test the function without making an API call, you can use a local file with sample data.
+        session: Per-user state dict that keeps the results for filtering and export (defaults to the shared session)
+        '''
+        data = fetch_flight_offers(origin_airport, destination_airport, departure_date, adults, testing)
+        return offer_results(data, testing, session)
+    except ResponseError as error:
+        raise error
+
+def offer_results(data, testing: bool = False, session: dict = None):
+    """
+    Keep the offers of a search in the session for filtering and export, and return their segment rows.
+    """
+    session = get_session() if session is None else session
+    # Keep the parsed offers; they are only serialized when exported
+    session['offers'] = None if testing else data
+    with metrics.span('offers.parse'):
+        session['offer_table'] = OfferTable(data)
+    with metrics.span('offers.format'):
+        return session['offer_table'].rows()
+
+def search_flexible_dates(origin_airport: str, destination_airport: str, start_date: str, end_date: str, adults: int = 1, testing: bool = False, max_workers: int = 4):
+    """
+    Search the cheapest flights for every departure date in a window, fanning the per-day searches out concurrently.
+    Yields (calendar_rows, offer_rows) each time a day completes, so partial results can be streamed to the UI.
+
+    origin_airport: IATA code of the origin airport
+    destination_airport: IATA code of the destination airport
+    start_date: First departure date in YYYY-MM-DD format
+    end_date: Last departure date in YYYY-MM-DD format (inclusive)
+    adults: Number of adults traveling (default is 1)
+    testing: Use the local sample data for every day instead of calling the API.
+    max_workers: Maximum number of concurrent searches; requests are also paced by the scheduler.
+    """
+    dates = flexible_dates(start_date, end_date)
+    calendar = {}
+    offers = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_flight_offers, origin_airport, destination_airport, date, adults, testing, BACKGROUND): date
+            for date in dates
+        }
+        for future in as_completed(futures):
+            try:
+                data, error = future.result(), None
+            except UPSTREAM_ERRORS as e:
+                data, error = None, e
+            yield add_flexible_day(calendar, offers, futures[future], data, error)
+
+def flexible_dates(start_date: str, end_date: str) -> list:
+    """
+    Return the departure dates of a flexible-dates window, validating its bounds.
+    """
+    first = datetime.date.fromisoformat(start_date.strip())
+    last = datetime.date.fromisoformat(end_date.strip())
+    if last < first:
+        raise ValueError("End date must not be before start date.")
+    if (last - first).days >= MAX_FLEXIBLE_DAYS:
+        raise ValueError(f"Date window is limited to {MAX_FLEXIBLE_DAYS} days.")
+    return [(first + datetime.timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+
+def add_flexible_day(calendar: dict, offers: dict, date: str, data, error=None):
+    """
+    Add one searched day to the calendar and offer rows, and return both as (calendar_rows, offer_rows).
+    """
+    if error is not None:
+        calendar[date] = [date, "", "", 0, f"Error: {error}"]
+        offers[date] = []
+    else:
+        calendar[date] = calendar_row(date, data)
+        offers[date] = [[date] + row for row in flight_rows(data)]
+    return (
+        [calendar[d] for d in sorted(calendar)],
+        [row for d in sorted(offers) for row in offers[d]],
+    )
+
+def calendar_row(date: str, data):
+    """
+    Summarize one day of flight offers as [Date, Cheapest Price, Flight #, Offers, Note].
+    """
+    if not data:
+        return [date, "", "", 0, "No offers"]
+    cheapest = cheapest_offer(data)
+    return [date, f"{cheapest['price']['total']} {cheapest['price']['currency']}", offer_flight_numbers(cheapest), len(data), ""]
+
+def cheapest_offer(data):
+    """
+    Return the cheapest flight offer of a parsed offers list, or None if it is empty.
+    """
+    if not data:
+        return None
+    return min(data, key=lambda offer: float(offer["price"]["total"]))
+
+def offer_flight_numbers(offer):
+    return ", ".join(
+        f"{segment['carrierCode']}{segment['number']}"
+        for itinerary in offer["itineraries"]
+        for segment in itinerary["segments"]
+    )
+
+def search_anywhere(origin_airport: str, departure_date: str, adults: int = 1, testing: bool = False, max_workers: int = 4, max_requests: int = MAX_EXPLORE_REQUESTS):
+    """
+    Price every direct destination of origin_airport on departure_date and rank them by cheapest fare.
+    Yields the ranked rows each time a destination is priced, so results can be streamed to the UI.
+    Destinations already in the offer cache are priced first without using quota; at most max_requests
+    uncached destinations are sent to Amadeus, as background requests of the scheduler.
+
+    origin_airport: IATA code of the origin airport
+    departure_date: Date of departure in YYYY-MM-DD format
+    adults: Number of adults traveling (default is 1)
+    testing: Use the local sample data instead of calling the API.
+    max_workers: Maximum number of concurrent searches
+    max_requests: Maximum number of uncached offer searches made for one explore
+    """
+    origin_airport = origin_airport.strip().upper()
+    departure_date = departure_date.strip()
+    destinations = {city["iataCode"]: city for city in fetch_direct_destinations(origin_airport, testing)}
+    results, pending = explore_plan(origin_airport, destinations, departure_date, adults, testing, max_requests)
+    # Cached and skipped rows first; with nothing to search, this is the only (possibly empty) result
+    if results or not pending:
+        yield ranked_explore(results)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_flight_offers, origin_airport, code, departure_date, adults, testing, BACKGROUND): code
+            for code in pending
+        }
+        for future in as_completed(futures):
+            code = futures[future]
+            try:
+                results[code] = explore_row(destinations[code], future.result())
+            except UPSTREAM_ERRORS as error:
+                results[code] = explore_row(destinations[code], None, f"Error: {error}")
+            yield ranked_explore(results)
+
+def explore_plan(origin_airport: str, destinations: dict, departure_date: str, adults: int, testing: bool, max_requests: int):
+    """
+    Price the destinations already in the offer cache and pick the ones to search.
+    Returns (results, pending): explore rows by destination code, and the codes still to search
+    (at most max_requests; the rest are marked as skipped).
+    """
+    # Serve destinations priced by an earlier search straight from the cache
+    results, pending = {}, []
+    for code, city in destinations.items():
+        data = MISSING if testing else offers_cache.get(TTLCache.make_key(origin_airport, code, departure_date, int(adults)), MISSING)
+        if data is MISSING:
+            pending.append(code)
+        else:
+            results[code] = explore_row(city, data)
+
+    budget = len(pending) if testing else max_requests
+    for code in pending[budget:]:
+        results[code] = explore_row(destinations[code], None, "Skipped (request budget)")
+    return results, pending[:budget]
+
+def ranked_explore(results: dict) -> list:
+    """
+    Order explore rows by price, unpriced destinations last.
+    """
+    return sorted(results.values(), key=lambda row: (row[5] == "", float(row[5].split()[0]) if row[5] else 0))
+
+def explore_row(city, data, note: str = ""):
+    """
+    Build one explore row: [IATA Code, Name, Country, Latitude, Longitude, Price, Flight #, Note].
+    """
+    cheapest = cheapest_offer(data)
+    if cheapest is None:
+        price, flights, note = "", "", note or "No offers"
+    else:
+        price, flights = f"{cheapest['price']['total']} {cheapest['price']['currency']}", offer_flight_numbers(cheapest)
+    return [
+        city["iataCode"],
+        city["name"].title(),
+        city["address"]["countryCode"],
+        city["geoCode"]["latitude"],
+        city["geoCode"]["longitude"],
+        price,
+        flights,
+        note,
+    ]
+
+def print_cheapest_flights(flights_data: str):
+    return flight_rows(json.loads(flights_data))
+
+def flight_rows(response):
+    """
+    Build a flat list of flight segment rows with an "Offer" column from parsed flight offers.
+    """
+    return OfferTable(response).rows()
+
+def filter_offers(max_stops=None, carrier: str = "", depart_from: str = "", depart_to: str = "", max_price=None, sort_by: str = "Price", descending: bool = False, session: dict = None):
+    """
+    Filter and sort the offers of the last search without re-querying or re-parsing them.
+    max_stops: Maximum number of stops (None for any)
+    carrier: Airline code operating at least one segment
+    depart_from / depart_to: Departure time-of-day window in HH:MM format
+    max_price: Maximum total price (None for any)
+    sort_by: One of "Price", "Stops", "Duration", "Departure", "Arrival"
+    session: Per-user state dict holding the last search (defaults to the shared session)
+    """
+    table = (get_session() if session is None else session).get('offer_table')
+    if table is None:
+        return []
+    with metrics.span('offers.filter'):
+        index = table.select(
+            max_stops=None if max_stops in (None, "") else int(max_stops),
+            carrier=carrier or None,
+            depart_from=depart_from or None,
+            depart_to=depart_to or None,
+            max_price=None if max_price in (None, "", 0) else float(max_price),
+        )
+        return table.rows(table.sort(index, SORT_COLUMNS[sort_by], descending))
+
+def search_airport_routes(airport_name: str, testing: bool = False, session: dict = None):
+    """
+    Search for airport routes by airport name or IATA code
+    airport_name: Name, city or IATA/ICAO code of the airport to search for routes (names are resolved with the airport store)
+    testing: If you want to test the function without making an API call, you can use a local file with sample data.
+    session: Per-user state dict that keeps the results for export (defaults to the shared session)
+    """
+    try:
+        data = fetch_direct_destinations(resolve_code(airport_name), testing)
+        (get_session() if session is None else session)['routes'] = None if testing else data
+        return route_rows(data)
+    except ResponseError as error:
+        raise error
+
+def fetch_direct_destinations(airport_name: str, testing: bool = False, priority: int = INTERACTIVE):
+    """
+    Fetch the raw direct destinations of an airport, served from the cache when possible.
+    testing: Read the destinations from tests/SEA.txt instead of calling the API.
+    priority: Scheduler priority of the request
+    """
+    if testing:
+        with open('tests/SEA.txt', 'r') as f:
+            return json.load(f)
+
+    airport_name = airport_name.strip().upper()
+    key = TTLCache.make_key(airport_name)
+    data = routes_cache.get(key, MISSING)
+    if data is MISSING:
+        # Reuse the shared Amadeus client (cached token, pooled connections)
+        amadeus = get_client()
+        # Make the API call to search for direct destinations from the airport
+        try:
+            response = scheduler.amadeus.call('amadeus.direct_destinations', lambda: amadeus.airport.direct_destinations.get(departureAirportCode=airport_name), priority)
+        except UPSTREAM_ERRORS as error:
+            return stale_or_raise(routes_cache, key, error)
+        data = response.data
+        store_destinations(airport_name, key, data)
+    return data
+
+def store_destinations(airport_name: str, key, data):
+    """
+    Cache a direct-destinations response and feed it to the airport store and the route graph.
+    """
+    routes_cache.set(key, data)
+    add_destinations(data)
+    origin = airports.get(airport_name)
+    routes_graph.add_destinations(airport_name, data, (origin['latitude'], origin['longitude']) if origin and origin['latitude'] is not None else None)
+
+def fetch_airport_location(airport_code: str, testing: bool = False):
+    """
+    Look up the name and coordinates of an airport, served from the airport store or the cache when possible.
+    Returns a dict with iataCode, name, latitude and longitude, or None when the airport is unknown.
+    testing: Return the origin of the tests/SEA.txt fixture instead of calling the API.
+    """
+    if testing:
+        return TESTING_ORIGIN
+
+    airport_code = airport_code.strip().upper()
+    location = stored_location(airport_code)
+    if location is not None:
+        return location
+
+    key = TTLCache.make_key(airport_code)
+    location = locations_cache.get(key, MISSING)
+    if location is MISSING:
+        amadeus = get_client()
+        try:
+            response = scheduler.amadeus.call('amadeus.airport_locations', lambda: amadeus.reference_data.locations.get(keyword=airport_code, subType='AIRPORT'))
+        except UPSTREAM_ERRORS as error:
+            print(f"Could not look up airport {airport_code}: {error}")
+            return None
+        location = store_location(airport_code, key, response.data)
+    return location
+
+def stored_location(airport_code: str):
+    """
+    Return the location of an airport from the airport store, or None when it has no coordinates there.
+    """
+    record = airports.get(airport_code)
+    if record is not None and record['latitude'] is not None:
+        return {'iataCode': record['iata'], 'name': record['name'] or record['city'], 'latitude': record['latitude'], 'longitude': record['longitude']}
+    return None
+
+def store_location(airport_code: str, key, places):
+    """
+    Pick the airport from an Amadeus locations response, cache it and add it to the airport store.
+    """
+    location = next((
+        {'iataCode': place['iataCode'], 'name': place['name'], 'latitude': place['geoCode']['latitude'], 'longitude': place['geoCode']['longitude']}
+        for place in places if place.get('iataCode') == airport_code
+    ), None)
+    locations_cache.set(key, location)
+    if location is not None:
+        airports.add([{'iata': location['iataCode'], 'name': location['name'].title(), 'latitude': location['latitude'], 'longitude': location['longitude']}], overwrite=False)
+    return location
+
+def airport_route_map(airport_name: str, testing: bool = False):
+    """
+    Render the direct destinations of an airport with great-circle route lines.
+    The map is built once per origin airport and route network and reused for every later search.
+    airport_name: Name, city or IATA/ICAO code of the origin airport
+    testing: Use the tests/SEA.txt fixture instead of calling the API.
+    """
+    code = TESTING_ORIGIN['iataCode'] if testing else resolve_code(airport_name)
+    data = fetch_direct_destinations(code, testing)
+    key = TTLCache.make_key(code, testing, tuple(city['iataCode'] for city in data))
+    route_map = route_maps_cache.get(key, MISSING)
+    if route_map is MISSING:
+        route_map = render_route_map(key, data, fetch_airport_location(code, testing))
+    return route_map
+
+def render_route_map(key, data, location):
+    """
+    Build the route map of a direct-destinations response from its origin location and cache it.
+    """
+    from pandas import DataFrame
+    origin = None if location is None else (location['latitude'], location['longitude'], f"{location['name'].title()} {location['iataCode']}")
+    route_map = create_airport_map(DataFrame(route_rows(data), columns=ROUTE_HEADERS), origin=origin)
+    route_maps_cache.set(key, route_map)
+    return route_map
+
+def testing_route_graph():
+    """
+    Build an in-memory route graph from the tests/SEA.txt fixture.
+    """
+    graph = RouteGraph(path=None)
+    graph.add_routes(TESTING_ORIGIN['iataCode'], fetch_direct_destinations(TESTING_ORIGIN['iataCode'], testing=True),
+                     (TESTING_ORIGIN['latitude'], TESTING_ORIGIN['longitude']))
+    return graph
+
+def find_connections(origin_airport: str, destination_airport: str, max_stops: int = 1, k: int = 5, departure_date: str = "", adults: int = 1, testing: bool = False, max_workers: int = 4):
+    """
+    Suggest connecting routes from the offline route graph (see routes_graph.py), shortest first.
+    With a departure date, only the distinct legs of the suggested routes are priced, concurrently and
+    through the offer cache, and each route shows the sum of the cheapest fare of every leg.
+    Returns rows of CONNECTION_HEADERS.
+
+    origin_airport / destination_airport: IATA code, name or city of the airports
+    max_stops: Maximum number of connections
+    k: Maximum number of routes suggested
+    departure_date: Optional date in YYYY-MM-DD format to price the legs on
+    testing: Use a graph built from the local sample data and the sample offers instead of calling the API.
+    """
+    origin, destination = resolve_code(origin_airport), resolve_code(destination_airport)
+    graph = testing_route_graph() if testing else route_graph
+    with metrics.span('routes.find_connections'):
+        routes = graph.find_connections(origin, destination, k=int(k), max_stops=int(max_stops))
+    rows = connection_rows(routes, graph.weight(origin, destination))
+    departure_date = (departure_date or "").strip()
+    if not departure_date:
+        return [row + ["", ""] for row in rows]
+
+    fares = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_flight_offers, a, b, departure_date, adults, testing, BACKGROUND): (a, b)
+            for a, b in legs_to_price(routes)
+        }
+        for future in as_completed(futures):
+            try:
+                cheapest = cheapest_offer(future.result())
+                fares[futures[future]] = None if cheapest is None else (float(cheapest['price']['total']), cheapest['price']['currency'])
+            except UPSTREAM_ERRORS as error:
+                print(f"Could not price {'-'.join(futures[future])}: {error}")
+                fares[futures[future]] = None
+
+    for row, (_, path) in zip(rows, routes):
+        legs = list(zip(path, path[1:]))
+        missing = [f"{a}-{b}" for a, b in legs if fares.get((a, b)) is None]
+        currencies = {fares[leg][1] for leg in legs if fares.get(leg) is not None}
+        if missing:
+            row += ["", f"No offers for {', '.join(missing)}"]
+        elif len(currencies) > 1:
+            row += ["", "Legs priced in different currencies"]
+        else:
+            total = sum(fares[leg][0] for leg in legs)
+            row += [f"{total:.2f} {currencies.pop()}", "Separate tickets" if len(legs) > 1 else ""]
+    return rows
+
+def print_airport_routes(routes_data: str):
+    """
+    Print the airport routes in a flat list format
+    routes_data: JSON string containing the airport routes data
+    """
+    return route_rows(json.loads(routes_data))
+
+@metrics.timed('routes.format')
+def route_rows(response):
+    """
+    Build a flat list of rows with airport route details from parsed direct destinations.
+    """
+    rows = []
+    for city in response:
+        rows.append([
+            city["iataCode"],
+            city["name"].title(),
+            city["address"]["stateCode"] if "stateCode" in city["address"] else "",
+            city["address"]["countryCode"],
+            city["address"]["regionCode"],
+            city["geoCode"]["latitude"],
+            city["geoCode"]["longitude"],
+        ])
+    return rows
+
+def cache_stats():
+    """
+    Return the hit/miss/eviction counters of the Amadeus response caches.
+    """
+    return {
+        'flight_offers': offers_cache.info(),
+        'direct_destinations': routes_cache.info(),
+        'airport_locations': locations_cache.info(),
+        'route_maps': route_maps_cache.info(),
+        'route_graph': route_graph.info(),
+    }
+
+# Async counterparts of the search functions, for coroutine handlers. They share the caches and the
+# scheduler with the blocking versions, but upstream calls go through the pooled async client
+# instead of holding a worker thread for the whole round-trip.
+
+async def as_completed_async(calls: dict, limit: int = ASYNC_MAX_CONCURRENCY):
+    """
+    Run coroutines concurrently, at most limit at a time, and yield (key, result, error) as each finishes.
+    Amadeus error responses and scheduler refusals are yielded as error instead of raised.
+    calls: Dict of key -> coroutine function taking no arguments
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(key, call):
+        async with semaphore:
+            try:
+                return key, await call(), None
+            except UPSTREAM_ERRORS as error:
+                return key, None, error
+
+    tasks = [asyncio.ensure_future(run(key, call)) for key, call in calls.items()]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # The consumer may stop early (e.g. the browser left); do not leave searches running
+        for task in tasks:
+            task.cancel()
+
+async def fetch_flight_offers_async(origin_airport: str, destination_airport: str, departure_date: str, adults: int = 1, testing: bool = False, priority: int = INTERACTIVE):
+    """
+    Async counterpart of fetch_flight_offers.
+    """
+    if testing:
+        return fetch_flight_offers(origin_airport, destination_airport, departure_date, adults, testing)
+
+    query = offer_query(origin_airport, destination_airport, departure_date, adults)
+    key = TTLCache.make_key(*query.values())
+    data = offers_cache.get(key, MISSING)
+    if data is MISSING:
+        try:
+            data = await scheduler.amadeus.call_async('amadeus.flight_offers', lambda: get_async_client().get('/v2/shopping/flight-offers', **query, currencyCode="USD"), priority)
+        except UPSTREAM_ERRORS as error:
+            return stale_or_raise(offers_cache, key, error, OFFERS_MAX_STALE)
+        # The disk cache write would stall every request on the event loop
+        await asyncio.to_thread(store_offers, query, key, data)
+    return data
+
+async def search_cheapest_flights_async(origin_airport: str, destination_airport: str, departure_date: str, adults: int = 1, testing: bool = False, session: dict = None):
+    """
+    Async counterpart of search_cheapest_flights.
+    """
+    data = await fetch_flight_offers_async(origin_airport, destination_airport, departure_date, adults, testing)
+    return offer_results(data, testing, session)
+
+async def search_flexible_dates_async(origin_airport: str, destination_airport: str, start_date: str, end_date: str, adults: int = 1, testing: bool = False, max_concurrency: int = ASYNC_MAX_CONCURRENCY):
+    """
+    Async counterpart of search_flexible_dates; yields (calendar_rows, offer_rows) each time a day completes.
+    max_concurrency: Maximum number of searches in flight at once
+    """
+    dates = flexible_dates(start_date, end_date)
+    calendar = {}
+    offers = {}
+    calls = {
+        date: (lambda date=date: fetch_flight_offers_async(origin_airport, destination_airport, date, adults, testing, BACKGROUND))
+        for date in dates
+    }
+    async for date, data, error in as_completed_async(calls, max_concurrency):
+        yield add_flexible_day(calendar, offers, date, data, error)
+
+async def search_anywhere_async(origin_airport: str, departure_date: str, adults: int = 1, testing: bool = False, max_concurrency: int = ASYNC_MAX_CONCURRENCY, max_requests: int = MAX_EXPLORE_REQUESTS):
+    """
+    Async counterpart of search_anywhere; yields the ranked rows each time a destination is priced.
+    max_concurrency: Maximum number of searches in flight at once
+    """
+    origin_airport = origin_airport.strip().upper()
+    departure_date = departure_date.strip()
+    destinations = {city["iataCode"]: city for city in await fetch_direct_destinations_async(origin_airport, testing)}
+    results, pending = explore_plan(origin_airport, destinations, departure_date, adults, testing, max_requests)
+    if results or not pending:
+        yield ranked_explore(results)
+
+    calls = {
+        code: (lambda code=code: fetch_flight_offers_async(origin_airport, code, departure_date, adults, testing, BACKGROUND))
+        for code in pending
+    }
+    async for code, data, error in as_completed_async(calls, max_concurrency):
+        results[code] = explore_row(destinations[code], data, "" if error is None else f"Error: {error}")
+        yield ranked_explore(results)
+
+async def fetch_direct_destinations_async(airport_name: str, testing: bool = False, priority: int = INTERACTIVE):
+    """
+    Async counterpart of fetch_direct_destinations.
+    """
+    if testing:
+        return fetch_direct_destinations(airport_name, testing, priority)
+
+    airport_name = airport_name.strip().upper()
+    key = TTLCache.make_key(airport_name)
+    data = routes_cache.get(key, MISSING)
+    if data is MISSING:
+        try:
+            data = await scheduler.amadeus.call_async('amadeus.direct_destinations', lambda: get_async_client().get('/v1/airport/direct-destinations', departureAirportCode=airport_name), priority)
+        except UPSTREAM_ERRORS as error:
+            return stale_or_raise(routes_cache, key, error)
+        # Cache, airport store and route graph writes go to disk
+        await asyncio.to_thread(store_destinations, airport_name, key, data)
+    return data
+
+async def search_airport_routes_async(airport_name: str, testing: bool = False, session: dict = None):
+    """
+    Async counterpart of search_airport_routes.
+    """
+    data = await fetch_direct_destinations_async(resolve_code(airport_name), testing)
+    (get_session() if session is None else session)['routes'] = None if testing else data
+    return route_rows(data)
+
+async def fetch_airport_location_async(airport_code: str, testing: bool = False):
+    """
+    Async counterpart of fetch_airport_location.
+    """
+    if testing:
+        return TESTING_ORIGIN
+
+    airport_code = airport_code.strip().upper()
+    location = stored_location(airport_code)
+    if location is not None:
+        return location
+
+    key = TTLCache.make_key(airport_code)
+    location = locations_cache.get(key, MISSING)
+    if location is MISSING:
+        try:
+            places = await scheduler.amadeus.call_async('amadeus.airport_locations', lambda: get_async_client().get('/v1/reference-data/locations', keyword=airport_code, subType='AIRPORT'))
+        except UPSTREAM_ERRORS as error:
+            print(f"Could not look up airport {airport_code}: {error}")
+            return None
+        location = await asyncio.to_thread(store_location, airport_code, key, places)
+    return location
+
+async def airport_route_map_async(airport_name: str, testing: bool = False):
+    """
+    Async counterpart of airport_route_map. Building a new map is CPU-bound and runs on a worker thread.
+    """
+    code = TESTING_ORIGIN['iataCode'] if testing else resolve_code(airport_name)
+    data = await fetch_direct_destinations_async(code, testing)
+    key = TTLCache.make_key(code, testing, tuple(city['iataCode'] for city in data))
+    route_map = route_maps_cache.get(key, MISSING)
+    if route_map is MISSING:
+        location = await fetch_airport_location_async(code, testing)
+        route_map = await asyncio.to_thread(render_route_map, key, data, location)
+    return route_map
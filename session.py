@@ -0,0 +1,64 @@
+import time
+import threading
+from collections import OrderedDict
+
+DEFAULT_SESSION = 'default'
+
+
+class SessionStore:
+    """
+    Per-session result state (last offers, routes, airport details, tracked flight) for concurrent users.
+    Holds at most max_sessions sessions, evicting the least recently used one first, and drops
+    sessions that have been idle for longer than idle_ttl seconds.
+    """
+    def __init__(self, max_sessions: int = 256, idle_ttl: float = 30 * 60):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, session_id: str = None) -> dict:
+        """
+        Return the state dict of a session, creating it if needed.
+        session_id: Gradio session hash, or None for the shared default session (scripts, tests, API calls without a session)
+        """
+        session_id = session_id or DEFAULT_SESSION
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = self._sessions[session_id] = [now, {}]
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            else:
+                entry[0] = now
+                self._sessions.move_to_end(session_id)
+            return entry[1]
+
+    def _evict_idle(self, now):
+        while self._sessions:
+            session_id, (last_used, _) = next(iter(self._sessions.items()))
+            if now - last_used <= self.idle_ttl:
+                break
+            del self._sessions[session_id]
+            self.evictions += 1
+
+    def drop(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+sessions = SessionStore()
+
+
+def get_session(session_id: str = None) -> dict:
+    """
+    Return the state dict of a session from the process-wide store.
+    """
+    return sessions.get(session_id)
@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import replay_server  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    """
+    Run every test from the repository root, where the app looks for the tests/ fixtures.
+    """
+    monkeypatch.chdir(ROOT)
+
+
+@pytest.fixture
+def offers_data():
+    """
+    Parsed flight offers of the SEA-JFK fixture.
+    """
+    with open(os.path.join(ROOT, 'tests', 'SEA-JFK.txt'), 'r') as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def destinations_data():
+    """
+    Parsed direct destinations of the SEA fixture.
+    """
+    with open(os.path.join(ROOT, 'tests', 'SEA.txt'), 'r') as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def cassettes(tmp_path):
+    """
+    Cassette directory seeded with the replay server's fixture queries.
+    """
+    replay_server.seed_from_fixtures(str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def serve(cassettes):
+    """
+    Start replay servers on free ports over the cassettes; returns their base URL.
+    """
+    servers = []
+
+    def serve(**overrides):
+        server = replay_server.start_in_background(port=0, cassette_dir=str(cassettes), **overrides)
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
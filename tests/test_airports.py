@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+import airports
+from airports import AirportStore, add_destinations
+
+
+HEATHROW = {'iata': 'LHR', 'icao': 'EGLL', 'name': 'London Heathrow Airport', 'city': 'London', 'country': 'United Kingdom'}
+CITY = {'iata': 'LCY', 'icao': 'EGLC', 'name': 'London City Airport', 'city': 'London', 'country': 'United Kingdom'}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AirportStore(str(tmp_path / 'airports.dat'), compact_after=100)
+
+
+def test_add_appends_to_log_without_rewriting(store):
+    assert store.add([HEATHROW, CITY]) == 2
+    assert not os.path.exists(store.path)
+    assert os.path.exists(store.log_path)
+    assert store.get('EGLL')['iata'] == 'LHR'
+    assert [record['iata'] for record in store.search('london', limit=5)] == ['LCY', 'LHR']
+    assert store.info()['pending'] == 2
+
+
+def test_log_is_replayed_on_open(store):
+    store.add([HEATHROW])
+    reopened = AirportStore(store.path)
+    assert reopened.get('LHR')['name'] == 'London Heathrow Airport'
+    assert len(reopened) == 1
+
+
+def test_compact_merges_pending_records(store):
+    store.add([HEATHROW])
+    assert store.compact() == 1
+    store.add([CITY, dict(HEATHROW, name='Heathrow')])
+    assert store.get('LHR')['name'] == 'Heathrow'
+    assert len(store) == 2
+    store.compact()
+    assert not os.path.exists(store.log_path)
+    reopened = AirportStore(store.path)
+    assert reopened.info() == dict(store.info(), pending=0)
+    assert reopened.get('LHR')['name'] == 'Heathrow'
+    assert reopened.resolve('heathrow') == 'LHR'
+
+
+def test_compacts_after_threshold(tmp_path):
+    store = AirportStore(str(tmp_path / 'airports.dat'), compact_after=2)
+    store.add([HEATHROW])
+    assert not os.path.exists(store.path)
+    store.add([CITY])
+    assert os.path.exists(store.path)
+    assert store.info()['pending'] == 0
+
+
+def test_unchanged_records_are_not_logged(store):
+    store.add([HEATHROW])
+    store.compact()
+    assert store.add([HEATHROW]) == 0
+    assert not os.path.exists(store.log_path)
+
+
+def test_resolve_never_guesses_a_different_code(store):
+    store.add([CITY])
+    store.compact()
+    # EGLL is close to EGLC, but a different airport
+    assert store.resolve('EGLL') is None
+    assert store.resolve('EGLC') == 'LCY'
+    assert store.resolve('londo') == 'LCY'
+    assert store.search('EGLL')[0]['iata'] == 'LCY'
+
+
+def test_resolve_code_keeps_unknown_icao(store, monkeypatch):
+    store.add([CITY])
+    monkeypatch.setattr(airports, 'airports', store)
+    assert airports.resolve_code('EGLL') == 'EGLL'
+    assert airports.resolve_code('egLc') == 'EGLC'
+    assert airports.resolve_code('London City') == 'LCY'
+
+
+def test_seed_from_destinations(store, monkeypatch, destinations_data):
+    monkeypatch.setattr(airports, 'airports', store)
+    assert add_destinations(destinations_data) == len({place['iataCode'] for place in destinations_data})
+    assert add_destinations(destinations_data) == 0
+    code = next(place['iataCode'] for place in destinations_data if place['iataCode'] != 'SEA')
+    assert store.get(code) is not None
+
+
+def test_resolve_leaves_ambiguous_names_to_suggest(store, monkeypatch):
+    store.add([HEATHROW, CITY])
+    for compacted in (False, True):
+        # London is the city of both airports, and a prefix of both names
+        assert store.resolve('London') is None
+        assert store.resolve('londo') is None
+        assert store.resolve('London City') == 'LCY'
+        assert store.resolve('heathrow') == 'LHR'
+        assert store.resolve('EGLL') == 'LHR'
+        store.compact()
+    monkeypatch.setattr(airports, 'airports', store)
+    assert airports.resolve_code('London') == 'LONDON'
+    assert airports.suggest('London') == ['LCY - London City Airport, London, United Kingdom', 'LHR - London Heathrow Airport, London, United Kingdom']
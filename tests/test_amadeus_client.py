@@ -0,0 +1,85 @@
+import json
+import asyncio
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+import pytest
+import amadeus.client.access_token
+
+import amadeus_client
+from amadeus_client import TOKEN_REFRESH_MARGIN, AsyncAmadeus, AsyncResponseError
+from async_http import close_http
+from replay_server import AMADEUS_HOST, save_cassette
+
+
+def replay_config(base_url):
+    url = urlsplit(base_url)
+    return {'client_id': 'id', 'client_secret': 'secret', 'host': url.hostname, 'port': url.port, 'ssl': False}
+
+
+def async_client(base_url):
+    return AsyncAmadeus(replay_config(base_url))
+
+
+@pytest.fixture
+def shared_client(serve, monkeypatch):
+    """
+    The shared SDK client of get_client(), configured for a replay server and on a fake clock.
+    """
+    clock = SimpleNamespace(now=1754000000.0)
+    monkeypatch.setattr(amadeus.client.access_token, 'time', SimpleNamespace(time=lambda: clock.now))
+    amadeus_client.reset_client()
+    monkeypatch.setattr(amadeus_client, '_config', replay_config(serve()))
+    yield amadeus_client.get_client(), clock
+    amadeus_client.reset_client()
+
+
+def run(make_awaitable):
+    # The pooled HTTP client belongs to the loop, so close it before asyncio.run() drops the loop
+    async def main():
+        try:
+            return await make_awaitable()
+        finally:
+            await close_http()
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_share_one_token(serve, destinations_data):
+    client = async_client(serve())
+    results = run(lambda: asyncio.gather(*[client.get('/v1/airport/direct-destinations', departureAirportCode='SEA') for _ in range(5)]))
+    assert all(result == destinations_data for result in results)
+    assert client.stats == {'requests': 5, 'token_requests': 1, 'errors': 0}
+
+
+def test_unauthorized_renews_the_token_once(serve, cassettes):
+    save_cassette('GET', AMADEUS_HOST, '/v1/airport/direct-destinations', {'departureAirportCode': 'LHR'}, 401,
+                  json.dumps({'errors': [{'status': 401, 'title': 'Invalid access token'}]}), cassette_dir=str(cassettes))
+    client = async_client(serve())
+    with pytest.raises(AsyncResponseError) as e:
+        run(lambda: client.get('/v1/airport/direct-destinations', departureAirportCode='LHR'))
+    assert e.value.status == 401
+    assert client.stats == {'requests': 2, 'token_requests': 2, 'errors': 1}
+
+
+def test_pool_reuses_one_connection_and_token(shared_client, destinations_data):
+    client, _ = shared_client
+    for _ in range(2):
+        assert client.airport.direct_destinations.get(departureAirportCode='SEA').data == destinations_data
+    assert amadeus_client.get_client() is client
+    stats = amadeus_client.client_stats()
+    assert stats['requests'] == 3
+    assert stats['token_requests'] == 1
+    assert (stats['connections_opened'], stats['connections_reused']) == (1, 2)
+
+
+def test_token_is_renewed_before_it_expires(shared_client):
+    client, clock = shared_client
+    client.airport.direct_destinations.get(departureAirportCode='SEA')
+    # The replay server grants 1799 s; the SDK renews TOKEN_BUFFER seconds before the shortened lifetime ends
+    renew_after = 1799 - TOKEN_REFRESH_MARGIN - amadeus.client.access_token.AccessToken.TOKEN_BUFFER
+    clock.now += renew_after - 1
+    client.airport.direct_destinations.get(departureAirportCode='SEA')
+    assert amadeus_client.client_stats()['token_requests'] == 1
+    clock.now += 1
+    client.airport.direct_destinations.get(departureAirportCode='SEA')
+    assert amadeus_client.client_stats()['token_requests'] == 2
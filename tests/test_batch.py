@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+import batch
+from batch import BatchWriter, load_checkpoint
+
+
+@pytest.fixture
+def fake_queries(monkeypatch):
+    calls = []
+
+    async def run_query(query, testing=False):
+        if isinstance(query, Exception):
+            raise query
+        calls.append(query['id'])
+        if query['type'] == 'flight':
+            raise LookupError(f"No live flight found for {query['flight']}")
+        return [{'airport': query['airport'], 'row': index} for index in range(2)]
+
+    monkeypatch.setattr(batch, 'run_query', run_query)
+    return calls
+
+
+def write_queries(path, *queries):
+    path.write_text(''.join(json.dumps(query) + '\n' for query in queries), encoding='utf-8')
+
+
+def test_resume_skips_queries_in_the_checkpoint(tmp_path, fake_queries, capsys):
+    queries, output = tmp_path / 'queries.jsonl', tmp_path / 'out'
+    write_queries(queries, {'id': 'q1', 'type': 'routes', 'airport': 'SEA'}, {'id': 'q2', 'type': 'flight', 'flight': 'XX1'})
+    assert batch.main([str(queries), '--output', str(output)]) == 0
+    assert load_checkpoint(str(output)) == {'q1': 'ok', 'q2': 'error'}
+
+    write_queries(queries, {'id': 'q1', 'type': 'routes', 'airport': 'SEA'}, {'id': 'q2', 'type': 'flight', 'flight': 'XX1'},
+                  {'id': 'q3', 'type': 'board', 'airport': 'JFK'})
+    batch.main([str(queries), '--output', str(output)])
+    assert fake_queries == ['q1', 'q2', 'q3']
+    batch.main([str(queries), '--output', str(output), '--retry-failed'])
+    assert fake_queries[3:] == ['q2']
+
+    with open(output / 'routes.ndjson', encoding='utf-8') as f:
+        assert [json.loads(line)['query_id'] for line in f] == ['q1', 'q1']
+    with open(output / 'errors.ndjson', encoding='utf-8') as f:
+        assert [json.loads(line)['query_id'] for line in f] == ['q2', 'q2']
+
+
+def test_summary_counts(tmp_path, fake_queries, capsys):
+    queries = tmp_path / 'queries.jsonl'
+    write_queries(queries, {'id': 'q1', 'type': 'routes', 'airport': 'SEA'}, {'id': 'q2', 'type': 'board', 'airport': 'JFK'},
+                  {'id': 'q3', 'type': 'flight', 'flight': 'XX1'})
+    with open(queries, 'a', encoding='utf-8') as f:
+        f.write('not json\n')
+    batch.main([str(queries), '--output', str(tmp_path / 'out')])
+    report = capsys.readouterr().out
+    assert '4 queries' in report
+    assert '(2 ok, 2 failed, 0 skipped from the checkpoint)' in report
+    assert 'rows        2' in report
+    assert '1 x LookupError: No live flight found for XX1' in report
+
+    batch.main([str(queries), '--output', str(tmp_path / 'out')])
+    assert '(0 ok, 0 failed, 4 skipped from the checkpoint)' in capsys.readouterr().out
+
+
+def test_parquet_parts_share_one_schema(tmp_path):
+    ds = pytest.importorskip('pyarrow.dataset')
+    writer = BatchWriter(str(tmp_path), 'parquet', part_rows=2)
+    # The first part has no gate at all and no delay values; later parts add them
+    writer.add('q1', 'board', [{'flight': 'AS1', 'delay': None}, {'flight': 'AS2', 'delay': None}])
+    writer.add('q2', 'board', [{'flight': 'AS3', 'delay': 5, 'gate': 'A1'}, {'flight': 'AS4', 'delay': 2.5}])
+    writer.close()
+    # A resumed run writes its parts with the same schema
+    writer = BatchWriter(str(tmp_path), 'parquet', part_rows=2)
+    writer.add('q3', 'board', [{'flight': 7, 'delay': 1}])
+    writer.close()
+
+    table = ds.dataset(str(tmp_path / 'board'), format='parquet').to_table()
+    assert table.num_rows == 5
+    assert table.column_names == ['query_id', 'flight', 'delay']
+    assert sorted(table.column('flight').to_pylist()) == ['7', 'AS1', 'AS2', 'AS3', 'AS4']
+    assert sorted(table.column('delay').to_pylist(), key=str) == ['1', '2.5', '5', None, None]
+    assert load_checkpoint(str(tmp_path)) == {'q1': 'ok', 'q2': 'ok', 'q3': 'ok'}
+
+
+def test_parquet_output_needs_pyarrow(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(batch.export, 'parquet_available', lambda: False)
+    with pytest.raises(SystemExit):
+        batch.main([str(tmp_path / 'queries.jsonl'), '--format', 'parquet'])
+    assert 'needs pyarrow' in capsys.readouterr().err
@@ -0,0 +1,96 @@
+import time
+import threading
+
+from cache import TTLCache, SingleFlight
+
+
+def test_get_returns_value_until_ttl_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    cache = TTLCache('test', ttl=60)
+    cache.set('k', {'v': 1})
+    assert cache.get('k') == {'v': 1}
+    now[0] += 61
+    assert cache.get('k', 'missing') == 'missing'
+    assert cache.info()['expirations'] == 1
+
+
+def test_lru_evicts_least_recently_used():
+    cache = TTLCache('test', ttl=60, maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.info()['evictions'] == 1
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    TTLCache('test', ttl=60, disk_dir=str(tmp_path)).set('k', [1, 2])
+    cache = TTLCache('test', ttl=60, disk_dir=str(tmp_path))
+    assert cache.get('k') == [1, 2]
+    assert cache.info()['disk_hits'] == 1
+
+
+def test_get_stale_serves_expired_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    cache = TTLCache('test', ttl=60)
+    cache.set('k', 'old')
+    now[0] += 120
+    assert cache.get('k') is None
+    assert cache.get_stale('k') == 'old'
+    assert cache.get_stale('k', max_stale=30) is None
+    assert cache.info()['stale_hits'] == 1
+
+
+def test_make_key_is_stable():
+    assert TTLCache.make_key('SEA', 'JFK', 1) == TTLCache.make_key('SEA', 'JFK', 1)
+    assert TTLCache.make_key('SEA', 'JFK', 1) != TTLCache.make_key('SEA', 'JFK', 2)
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'result'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do('k', fetch))) for _ in range(5)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ['result'] * 5
+    assert len(calls) == 1
+
+
+def test_get_stale_serves_evicted_entries():
+    cache = TTLCache('test', ttl=60, maxsize=1)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') is None
+    assert cache.get_stale('a') == 1
+
+
+def test_get_stale_falls_back_to_expired_disk_record(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    TTLCache('test', ttl=60, disk_dir=str(tmp_path)).set('k', 'old')
+    now[0] += 120
+    # A fresh process: nothing in memory, and the disk record has expired
+    cache = TTLCache('test', ttl=60, disk_dir=str(tmp_path))
+    assert cache.get('k') is None
+    assert TTLCache('test', ttl=60, disk_dir=str(tmp_path)).get_stale('k') == 'old'
+    assert cache.get_stale('k', max_stale=30) is None
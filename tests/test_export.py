@@ -0,0 +1,88 @@
+import csv
+import gzip
+import sys
+import json
+import subprocess
+
+import pytest
+
+import export
+from offers import segment_records
+
+
+@pytest.fixture(autouse=True)
+def export_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, 'EXPORT_DIR', str(tmp_path))
+    return tmp_path
+
+
+def test_flatten():
+    assert export.flatten({'price': {'total': 1, 'fees': [1, 2]}, 'id': 'a'}) == {'price.total': 1, 'price.fees': '[1, 2]', 'id': 'a'}
+
+
+def test_json_round_trip(offers_data):
+    path = export.export(offers_data, 'json')
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f) == offers_data
+
+
+def test_json_document_and_empty_list():
+    document = {'origin': 'SEA', 'name': 'Zürich', 'rows': [[1, 2.5, None]]}
+    with open(export.export(document, 'json'), encoding='utf-8') as f:
+        assert json.load(f) == document
+    with open(export.export([], 'json'), encoding='utf-8') as f:
+        assert json.load(f) == []
+
+
+def test_ndjson_compressed(offers_data):
+    path = export.export(offers_data, 'ndjson', compress=True)
+    assert path.endswith('.ndjson.gz')
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == offers_data
+
+
+def test_csv_has_union_of_columns(offers_data):
+    records = lambda: segment_records(offers_data)
+    path = export.export(offers_data, 'csv', records=records)
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == len(list(records()))
+    assert rows[0]['flight'] == 'F94066'
+    assert 'arrival_terminal' in rows[0]
+
+
+def test_table_schema_widens_types():
+    records = lambda: iter([{'a': 1, 'b': 1, 'c': None}, {'a': 2.5, 'b': 'x', 'c': None}])
+    assert export.table_schema(records) == {'a': float, 'b': str, 'c': str}
+
+
+def test_session_replaces_previous_export(offers_data, export_dir):
+    session = {}
+    first = export.export(offers_data, 'json', session=session)
+    second = export.export(offers_data, 'json', session=session)
+    assert session['exports']['export'] == second
+    assert not (export_dir / first.split('/')[-1]).exists()
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        export.export([], 'xml')
+
+
+def test_parquet(offers_data):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    path = export.export(offers_data, 'parquet', records=lambda: segment_records(offers_data))
+    assert pq.read_table(path).num_rows == len(list(segment_records(offers_data)))
+
+
+def test_parquet_without_pyarrow(monkeypatch):
+    # A None entry in sys.modules makes the import fail as if pyarrow were not installed
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    with pytest.raises(RuntimeError, match='pip install pyarrow'):
+        export.write_parquet('unused.parquet', lambda: iter([{'a': 1}]))
+
+
+def test_pyarrow_is_imported_on_first_parquet_export():
+    code = "import sys, export; export.parquet_available(); assert 'pyarrow' not in sys.modules"
+    subprocess.run([sys.executable, '-c', code], check=True)
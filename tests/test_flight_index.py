@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+from flight_index import FlightIndex, index_keys
+
+
+def flight(registration, callsign, number, icao_24bit):
+    return SimpleNamespace(registration=registration, callsign=callsign, number=number, icao_24bit=icao_24bit)
+
+
+FLIGHTS = [
+    flight('G-EUUA', 'BAW123', 'BA123', '400A0B'),
+    flight('N12345', 'UAL900', 'UA900', 'A061D9'),
+    flight('N54321', 'UAL901', 'UA901', 'N/A'),
+]
+
+
+def make_index():
+    # refresh_interval=0 keeps lookups from starting background snapshots
+    index = FlightIndex(lambda: FLIGHTS, refresh_interval=0)
+    index.refresh()
+    return index
+
+
+def test_index_keys():
+    assert index_keys(FLIGHTS[0]) == {'G-EUUA', 'GEUUA', 'BAW123', 'BA123', '400A0B'}
+    assert 'N/A' not in index_keys(FLIGHTS[2])
+
+
+def test_lookup_returns_a_copy():
+    index = make_index()
+    found = index.lookup(' geuua ')
+    assert found.callsign == 'BAW123'
+    found.trail = ['details of one session']
+    assert not hasattr(index.lookup('BAW123'), 'trail')
+    assert index.lookup('XXX') is None
+    assert index.info()['hits'] == 2
+
+
+def test_resolve_prefix_needs_a_single_flight():
+    index = make_index()
+    assert index.resolve_prefix('BAW').registration == 'G-EUUA'
+    assert index.resolve_prefix('BAW') is not index.resolve_prefix('BAW')
+    assert index.resolve_prefix('UAL') is None
+    assert index.resolve_prefix('ZZZ') is None
+
+
+def test_fuzzy_match_only_for_suggestions():
+    index = make_index()
+    assert index.suggest('UAL9') == ['UAL900', 'UAL901']
+    # A mistyped character is suggested, but never resolved
+    assert index.suggest('BAW124') == ['BAW123']
+    assert index.resolve_prefix('BAW124') is None
+    # Keys starting with another character are not compared
+    assert index.suggest('XAW123') == []
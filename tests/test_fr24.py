@@ -0,0 +1,204 @@
+import json
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import cache
+import fr24
+from async_http import close_http
+from replay_server import save_cassette
+
+
+def board_entry(flight_id, number, destination, scheduled, status='Scheduled', gate='A1'):
+    return {'flight': {
+        'identification': {'id': flight_id, 'number': {'default': number}},
+        'airline': {'name': 'Alaska Airlines (AS)'},
+        'airport': {'destination': {'code': {'iata': destination}, 'position': {'region': {'city': destination.title()}}},
+                    'origin': {'info': {'terminal': 'N', 'gate': gate}}},
+        'time': {'scheduled': {'departure': scheduled}},
+        'status': {'text': status},
+    }}
+
+
+def airport_payload(*entries):
+    return {'airport': {'pluginData': {
+        'details': {'timezone': {'name': 'UTC'}},
+        'schedule': {'departures': {'data': list(entries)}, 'arrivals': {'data': []}},
+    }}}
+
+
+def test_live_board_diffs_added_updated_removed():
+    first = airport_payload(board_entry('a', 'AS1', 'JFK', 1754000000), board_entry('b', 'AS2', 'LAX', 1754003600))
+    board, rows, changes = fr24.live_board(first, 'departures')
+    assert [change[0] for change in changes] == ['Added', 'Added']
+    assert rows[0] == ['JFK', 'Jfk', 'Alaska Airlines', 'AS1', '07-31-2025 10:13PM', 'Scheduled', 'N', 'A1']
+
+    second = airport_payload(board_entry('a', 'AS1', 'JFK', 1754000000, gate='B2'), board_entry('c', 'AS3', 'SFO', 1754007200))
+    board, rows, changes = fr24.live_board(second, 'departures', board)
+    assert [(change[0], change[4]) for change in changes] == [('Updated', 'AS1'), ('Added', 'AS3'), ('Removed', 'AS2')]
+    assert [row[3] for row in rows] == ['AS1', 'AS3']
+    assert rows[0][-1] == 'B2'
+
+
+def test_live_board_reuses_unchanged_rows(monkeypatch):
+    payload = airport_payload(board_entry('a', 'AS1', 'JFK', 1754000000), board_entry('b', 'AS2', 'LAX', 1754003600))
+    board, rows, _ = fr24.live_board(payload, 'departures')
+
+    schema = fr24.BOARD_SCHEMAS['departures']
+    extracted = []
+    extract = schema.extract
+    monkeypatch.setattr(schema, 'extract', lambda entries, tz: extracted.append(len(entries)) or extract(entries, tz))
+    _, again, changes = fr24.live_board(payload, 'departures', board)
+    assert changes == []
+    assert extracted == []
+    assert all(new is old for new, old in zip(again, rows))
+
+
+def test_live_board_without_details_removes_previous_rows():
+    board, _, _ = fr24.live_board(airport_payload(board_entry('a', 'AS1', 'JFK', 1754000000)), 'departures')
+    # Callers skip the refresh instead (see refresh_boards); this is what they would otherwise show
+    assert [change[0] for change in fr24.live_board(None, 'departures', board)[2]] == ['Removed']
+
+
+def fetch_airport(code):
+    async def main():
+        try:
+            return await fr24.fr_async.get_airport_details(code)
+        finally:
+            await close_http()
+    return asyncio.run(main())
+
+
+def test_async_airport_details_request(serve, cassettes, monkeypatch):
+    from FlightRadar24.errors import AirportNotFoundError
+    params = {'format': 'json', 'code': 'SEA', 'limit': 100, 'page': 1}
+    payload = airport_payload(board_entry('a', 'AS1', 'JFK', 1754000000))
+    save_cassette('GET', 'api.flightradar24.com', '/common/v1/airport.json', params, 200,
+                  json.dumps({'result': {'response': payload}}), cassette_dir=str(cassettes))
+    save_cassette('GET', 'api.flightradar24.com', '/common/v1/airport.json', dict(params, code='XXX'), 400,
+                  json.dumps({'errors': {'errors': {'parameters': {'code': {'notFound': 'XXX'}}}}}), cassette_dir=str(cassettes))
+    core = fr24.fr_core()
+    # Like use_base_url, for this endpoint only and undone after the test
+    monkeypatch.setattr(core, 'api_airport_data_url', f"{serve()}/{core.api_airport_data_url[len('https://'):]}")
+
+    assert fetch_airport('SEA') == payload
+    with pytest.raises(AirportNotFoundError):
+        fetch_airport('XXX')
+    with pytest.raises(ValueError):
+        fetch_airport('XX')
+
+
+def test_unwrap_longitudes_across_the_antimeridian():
+    # Tokyo to Anchorage, crossing 180 degrees eastbound
+    lng = np.array([140.0, 160.0, 179.5, -179.5, -160.0, -150.0])
+    offset = fr24.antimeridian_offset(140.0, -150.0)
+    assert offset == 360
+    unwrapped = fr24.unwrap_longitudes(lng, offset)
+    assert unwrapped.tolist() == [140.0, 160.0, 179.5, 180.5, 200.0, 210.0]
+    assert np.all(np.abs(np.diff(unwrapped)) < 180)
+    # Westbound, and a route that does not cross it
+    assert fr24.antimeridian_offset(-140.0, 150.0) == -360
+    assert fr24.unwrap_longitudes(-lng, -360).tolist() == [-140.0, -160.0, -179.5, -180.5, -200.0, -210.0]
+    assert fr24.unwrap_longitudes(lng, 0) is lng
+
+
+def test_simplify_trail_keeps_endpoints_and_drops_collinear_points():
+    lat = np.array([0.0, 1.0, 2.0, 3.0, 4.0])
+    lng = np.array([0.0, 1.0, 2.0, 3.0, 4.0])
+    assert fr24.simplify_trail(lat, lng, 0.01).tolist() == [0, 4]
+    # A corner is kept
+    lat = np.array([0.0, 0.0, 0.0, 1.0, 2.0])
+    lng = np.array([0.0, 1.0, 2.0, 2.0, 2.0])
+    assert fr24.simplify_trail(lat, lng, 0.01).tolist() == [0, 2, 4]
+
+
+def test_smaller_tolerance_keeps_more_points():
+    x = np.linspace(0.0, 10.0, 200)
+    lat, lng = np.sin(x), x
+    counts = [len(fr24.simplify_trail(lat, lng, tolerance)) for tolerance in (0.5, 0.1, 0.01, 0.001)]
+    assert counts == sorted(counts)
+    assert counts[0] < counts[-1] <= len(x)
+    assert len(fr24.simplify_trail(lat, lng, 0)) == len(x)
+    kept = fr24.simplify_trail(lat, lng, 0.01)
+    assert (kept[0], kept[-1]) == (0, len(x) - 1)
+    # Every dropped point is near the simplified line (vertically; slopes here are at most 1)
+    assert np.max(np.abs(np.interp(lng, lng[kept], lat[kept]) - lat)) <= 0.01 * np.sqrt(2)
+
+
+@pytest.fixture
+def airport_cache(monkeypatch):
+    """
+    An empty airport cache and coalescer for fr24, with both modules on a fake clock.
+    """
+    clock = SimpleNamespace(now=1754000000.0)
+    fake_time = SimpleNamespace(time=lambda: clock.now)
+    monkeypatch.setattr(fr24, 'time', fake_time)
+    monkeypatch.setattr(cache, 'time', fake_time)
+    monkeypatch.setattr(fr24, 'airport_cache', cache.TTLCache('airport_details', ttl=fr24.airport_cache.ttl))
+    monkeypatch.setattr(fr24, 'airport_flight', cache.SingleFlight())
+    return clock
+
+
+def test_airport_components_stay_fresh_for_their_ttl(airport_cache):
+    clock = airport_cache
+    payload = airport_payload()
+    stored_at = clock.now
+    fr24.airport_cache.set('SEA', (stored_at, payload))
+    states = []
+    for age in (30, 31, 90, 91, 300, 301, 359, 361):
+        clock.now = stored_at + age
+        states.append((fr24._cached_airport('SEA', ('schedule',))[0], fr24._cached_airport('SEA', ('details', 'weather'))[0]))
+    # Schedules are fresh for 30 s and details and weather for 300 s, then served stale for 60 s more
+    assert states == [
+        ('fresh', 'fresh'), ('stale', 'fresh'), ('stale', 'fresh'), ('miss', 'fresh'),
+        ('miss', 'fresh'), ('miss', 'stale'), ('miss', 'stale'), ('miss', 'miss'),
+    ]
+    assert fr24._cached_airport('SEA', fr24.AIRPORT_COMPONENTS)[0] == 'miss'
+
+
+def test_stale_airport_is_served_while_it_is_refreshed(airport_cache, monkeypatch):
+    clock = airport_cache
+    old, new = airport_payload(), airport_payload(board_entry('a', 'AS1', 'JFK', 1754000000))
+    fr24.airport_cache.set('SEA', (clock.now, old))
+    refreshed = threading.Event()
+
+    def fetch(code, priority):
+        fr24.airport_cache.set(code, (clock.now, new))
+        refreshed.set()
+        return new
+
+    monkeypatch.setattr(fr24, '_fetch_airport_details', fetch)
+    clock.now += 45
+    assert fr24.get_airport_details('SEA', session={}) is old
+    assert refreshed.wait(5)
+    assert fr24.get_airport_details('SEA', session={}) is new
+
+
+def test_concurrent_airport_misses_share_one_fetch(airport_cache, monkeypatch):
+    fetches = []
+    release = threading.Event()
+
+    def fetch(code, priority):
+        fetches.append(code)
+        release.wait(5)
+        return airport_payload()
+
+    monkeypatch.setattr(fr24, '_fetch_airport_details', fetch)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(fr24.get_airport_details('SEA', session={}))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    # Let the fetch finish once the other four lookups are waiting for it
+    for _ in range(500):
+        if fr24.airport_flight.stats['coalesced'] == 4:
+            break
+        release.wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert fetches == ['SEA']
+    assert fr24.airport_flight.stats == {'calls': 1, 'coalesced': 4}
+    assert len(results) == 5 and all(result is results[0] for result in results)
@@ -0,0 +1,117 @@
+import re
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+
+SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text):
+    """
+    Parse the Prometheus text format into {(metric, ((label, value), ...)): number}.
+    """
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        name, labels, value = match.groups()
+        labels = tuple((key, re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1), raw))
+                       for key, raw in LABEL.findall(labels or ''))
+        samples[name, labels] = float(value)
+    return samples
+
+
+def buckets(samples, metric, **labels):
+    """
+    Return the [(le, count)] buckets of one histogram series, in bucket order.
+    """
+    series = []
+    for (name, label_pairs), value in samples.items():
+        pairs = dict(label_pairs)
+        le = pairs.pop('le', None)
+        if name == f"{metric}_bucket" and pairs == labels:
+            series.append((float(le), value))
+    return sorted(series)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(metrics, 'time', SimpleNamespace(perf_counter=lambda: clock.now))
+    monkeypatch.setattr(metrics, '_collectors', {})
+    return clock
+
+
+def test_span_histogram_is_cumulative(clock):
+    for seconds in (0.003, 0.2):
+        with metrics.span('test.parse'):
+            clock.now += seconds
+    with pytest.raises(KeyError):
+        with metrics.span('test.parse'):
+            clock.now += 40
+            raise KeyError('x')
+
+    samples = parse(metrics.render())
+    metric = 'flight_searcher_stage_seconds'
+    series = buckets(samples, metric, stage='test.parse')
+    assert [le for le, _ in series] == list(metrics.LATENCY_BUCKETS) + [float('inf')]
+    counts = dict(series)
+    assert (counts[0.0025], counts[0.005], counts[0.1], counts[0.25], counts[30.0], counts[float('inf')]) == (0, 1, 1, 2, 2, 3)
+    assert all(a[1] <= b[1] for a, b in zip(series, series[1:]))
+    assert samples[f"{metric}_count", (('stage', 'test.parse'),)] == 3
+    assert samples[f"{metric}_sum", (('stage', 'test.parse'),)] == pytest.approx(40.203)
+    assert samples['flight_searcher_stage_errors_total', (('stage', 'test.parse'), ('error', 'KeyError'))] == 1
+
+
+def test_labels_are_escaped(clock):
+    stage = 'say "hi"\\back\nslash'
+    with metrics.span(stage):
+        clock.now += 0.01
+    text = metrics.render()
+    assert 'stage="say \\"hi\\"\\\\back\\nslash"' in text
+    assert parse(text)['flight_searcher_stage_seconds_count', (('stage', stage),)] == 1
+
+
+def test_async_generator_handler_is_timed_until_it_finishes(clock):
+    @metrics.request('test_stream')
+    async def stream(steps):
+        for step in range(steps):
+            clock.now += 0.5
+            yield step
+        if steps > 2:
+            raise ValueError('too many')
+
+    async def consume(steps):
+        return [value async for value in stream(steps)]
+
+    assert asyncio.run(consume(2)) == [0, 1]
+    with pytest.raises(ValueError):
+        asyncio.run(consume(3))
+
+    samples = parse(metrics.render())
+    handler = (('handler', 'test_stream'),)
+    assert samples['flight_searcher_request_seconds_count', handler] == 2
+    assert samples['flight_searcher_request_seconds_sum', handler] == pytest.approx(2.5)
+    assert dict(buckets(samples, 'flight_searcher_request_seconds', handler='test_stream'))[1.0] == 1
+    assert samples['flight_searcher_request_errors_total', (('handler', 'test_stream'), ('error', 'ValueError'))] == 1
+
+
+def test_collectors_export_flat_and_nested_stats(clock):
+    metrics.register_collector('test_cache', lambda: {'hits': 3, 'enabled': True, 'name': 'airports'})
+    metrics.register_collector('test_pool', lambda: {'a.example': {'open': 2, 'reused': 5}, 'total': 7}, label='host')
+    metrics.register_collector('test_broken', lambda: 1 / 0)
+    samples = parse(metrics.render())
+    gauges = {key: value for key, value in samples.items() if key[0].startswith('flight_searcher_test_')}
+    assert gauges == {
+        ('flight_searcher_test_cache', (('stat', 'hits'),)): 3,
+        ('flight_searcher_test_cache', (('stat', 'enabled'),)): 1,
+        ('flight_searcher_test_pool', (('host', 'a.example'), ('stat', 'open'))): 2,
+        ('flight_searcher_test_pool', (('host', 'a.example'), ('stat', 'reused'))): 5,
+        ('flight_searcher_test_pool', (('stat', 'total'),)): 7,
+    }
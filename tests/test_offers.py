@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from offers import OfferTable, segment_records
+from utils import convert_time_formats, durations_to_strings, iso_durations_to_seconds, parse_iso_duration
+
+
+def test_table_columns_match_fixture(offers_data):
+    table = OfferTable(offers_data)
+    first = offers_data[0]
+    assert len(table) == len(offers_data)
+    assert table.price[0] == float(first['price']['total'])
+    assert table.carrier[0] == 'F9'
+    assert table.stops[0] == 1
+    assert table.duration[0] == parse_iso_duration('PT14H15M')
+    assert table.seg_count.sum() == sum(len(i['segments']) for offer in offers_data for i in offer['itineraries'])
+
+
+def test_rows_render_segments(offers_data):
+    table = OfferTable(offers_data)
+    rows = table.rows(np.array([0]))
+    assert rows == [
+        ['1-1', 'F94066', 'SEA - DFW', '321', '? - E', '08-01-2025 06:44PM', '08-02-2025 12:39AM', '03:55:00', '178.55 USD'],
+        ['1-2', rows[1][1], 'DFW - JFK', rows[1][3], 'E - ?', '08-02-2025 07:16AM', '08-02-2025 11:59AM', '03:43:00', '178.55 USD'],
+    ]
+
+
+def test_select_and_sort(offers_data):
+    table = OfferTable(offers_data)
+    nonstop = table.select(max_stops=0)
+    assert all(table.stops[i] == 0 for i in nonstop)
+    cheap = table.sort(table.select(max_price=400), by='price')
+    assert list(table.price[cheap]) == sorted(table.price[cheap])
+    assert all(table.price[i] <= 400 for i in cheap)
+    morning = table.select(depart_from='06:00', depart_to='11:59')
+    for i in morning:
+        assert 6 * 60 <= int(str(table.departure[i])[11:13]) * 60 + int(str(table.departure[i])[14:16]) <= 11 * 60 + 59
+
+
+@pytest.mark.parametrize('bound', ['6', '0600', '6:00pm', '24:00', '06:60'])
+def test_select_rejects_malformed_times(offers_data, bound):
+    table = OfferTable(offers_data)
+    with pytest.raises(ValueError, match='HH:MM'):
+        table.select(depart_from=bound)
+
+
+def test_select_accepts_single_digit_hours(offers_data):
+    table = OfferTable(offers_data)
+    assert list(table.select(depart_from=' 6:00 ')) == list(table.select(depart_from='06:00'))
+
+
+def test_select_by_carrier(offers_data):
+    table = OfferTable(offers_data)
+    carrier = offers_data[0]['itineraries'][0]['segments'][0]['carrierCode']
+    for i in table.select(carrier=carrier.lower()):
+        codes = [s['carrierCode'] for it in offers_data[i]['itineraries'] for s in it['segments']]
+        assert carrier in codes
+
+
+def test_empty_table():
+    table = OfferTable([])
+    assert len(table) == 0
+    assert table.rows() == []
+
+
+def test_segment_records(offers_data):
+    records = list(segment_records(offers_data[:1]))
+    assert [r['flight'] for r in records][0] == 'F94066'
+    assert records[0]['total_price'] == 178.55
+    assert records[1]['origin'] == 'DFW'
+
+
+def test_batch_formatting_matches_scalar():
+    times = ['2025-08-01T18:44:00', '2025-08-02T00:39:00', '2025-08-01T18:44:00']
+    assert convert_time_formats(times) == ['08-01-2025 06:44PM', '08-02-2025 12:39AM', '08-01-2025 06:44PM']
+    assert durations_to_strings(['PT3H55M', 'PT45M', 'P1DT2H']) == ['03:55:00', '00:45:00', '1 days 02:00:00']
+
+
+def test_parse_iso_duration():
+    assert parse_iso_duration('PT3H55M') == 3 * 3600 + 55 * 60
+    assert parse_iso_duration('P1DT2H') == 26 * 3600
+    assert parse_iso_duration('PT30S') == 30
+
+
+def test_column_parsers_fall_back_per_value():
+    # Values the column-wise passes do not cover go through the scalar functions
+    assert convert_time_formats(['2025-08-01T18:44:00', '2025-08-01 18:44:00'])[1].startswith('Error converting time')
+    assert durations_to_strings(['PT1.5S', 'PT2H']) == ['00:00:01.500000', '02:00:00']
+    assert list(iso_durations_to_seconds(['PT1H', 'PT0.5S', 'PT1H'])) == [3600, 0.5, 3600]
+
+
+def test_column_durations_match_scalar(offers_data):
+    durations = [i['duration'] for offer in offers_data for i in offer['itineraries']]
+    assert list(iso_durations_to_seconds(durations)) == [parse_iso_duration(d) for d in durations]
@@ -0,0 +1,71 @@
+import copy
+
+import pytest
+
+from price_history import PriceHistory, fingerprint
+
+
+@pytest.fixture
+def history():
+    return PriceHistory(None)
+
+
+def departure_date(data):
+    return data[0]['itineraries'][0]['segments'][0]['departure']['at'][:10]
+
+
+def cheapest(data):
+    return min(data, key=lambda offer: float(offer['price']['total']))
+
+
+def test_ingest_stores_each_itinerary_once(history, offers_data):
+    date = departure_date(offers_data)
+    itineraries = len({fingerprint(offer) for offer in offers_data})
+    assert history.ingest('sea', 'jfk', date, 1, offers_data, observed_at=1000) == itineraries
+    assert len(history.lowest_fares('SEA', 'JFK', date, limit=100)) == itineraries
+    assert history.stats['price_changes'] == itineraries
+
+    # The same response again adds a snapshot, but no price rows
+    history.ingest('SEA', 'JFK', date, 1, offers_data, observed_at=2000)
+    assert history.stats['price_changes'] == itineraries
+    assert [observed_at for observed_at, _ in history.fare_history(fingerprint(offers_data[0]))] == [1000]
+    assert [point['observed_at'] for point in history.trend('SEA', 'JFK', date)] == [1000, 2000]
+    assert history.price_drop('SEA', 'JFK', date)['change'] == 0
+
+
+def test_price_change_is_recorded(history, offers_data):
+    date = departure_date(offers_data)
+    history.ingest('SEA', 'JFK', date, 1, offers_data, observed_at=1000)
+    lowest = float(cheapest(offers_data)['price']['total'])
+
+    cheaper = copy.deepcopy(offers_data)
+    offer = cheapest(cheaper)
+    offer['price']['total'] = f"{lowest - 25:.2f}"
+    history.ingest('SEA', 'JFK', date, 1, cheaper, observed_at=2000)
+
+    key = fingerprint(offer)
+    assert history.fare_history(key) == [(1000, lowest), (2000, lowest - 25)]
+    best = history.lowest_fares('SEA', 'JFK')[0]
+    assert (best['fingerprint'], best['lowest_price'], best['first_seen'], best['last_seen']) == (key, lowest - 25, 1000, 2000)
+    assert [point['min_price'] for point in history.trend('SEA', 'JFK', date)] == [lowest, lowest - 25]
+
+    drops = history.price_drops()
+    assert len(drops) == 1
+    assert (drops[0]['origin'], drops[0]['previous_min_price'], drops[0]['min_price']) == ('SEA', lowest, lowest - 25)
+
+    # Back up to the old fare: a new price row, the lowest fare stays
+    history.ingest('SEA', 'JFK', date, 1, offers_data, observed_at=3000)
+    assert len(history.fare_history(key)) == 3
+    assert history.lowest_fares('SEA', 'JFK', date)[0]['lowest_price'] == lowest - 25
+    assert history.price_drops() == []
+
+
+def test_malformed_response_does_not_lose_the_batch(history, offers_data, capsys):
+    date = departure_date(offers_data)
+    history.submit('SEA', 'JFK', date, 1, [{'price': {'total': 'n/a'}}])
+    history.submit('SEA', 'JFK', date, 1, offers_data)
+    history.flush()
+    assert history.stats['errors'] == 1
+    assert history.stats['snapshots'] == 1
+    assert len(history.trend('SEA', 'JFK', date)) == 1
+    assert 'Could not record price history' in capsys.readouterr().out
@@ -0,0 +1,57 @@
+import time
+import asyncio
+
+import pytest
+
+from ratelimit import TokenBucket, rate_setting
+
+
+def test_burst_up_to_capacity_then_wait():
+    bucket = TokenBucket(rate=10, capacity=3)
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    wait = bucket.try_acquire()
+    assert 0 < wait <= 0.1
+
+
+def test_tokens_refill_at_rate():
+    bucket = TokenBucket(rate=50, capacity=1)
+    assert bucket.try_acquire() == 0
+    time.sleep(0.03)
+    assert bucket.try_acquire() == 0
+
+
+def test_acquire_times_out():
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.acquire()
+    start = time.monotonic()
+    assert bucket.acquire(timeout=0.05) is False
+    assert time.monotonic() - start < 0.5
+
+
+def test_acquire_async_paces_calls():
+    bucket = TokenBucket(rate=100, capacity=1)
+
+    async def take(count):
+        for _ in range(count):
+            assert await bucket.acquire_async(timeout=1)
+
+    start = time.monotonic()
+    asyncio.run(take(5))
+    assert time.monotonic() - start >= 0.03
+
+
+def test_slow_rate_still_grants_one_token():
+    bucket = TokenBucket(rate=0.5, capacity=0.5)
+    assert bucket.capacity == 1
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == pytest.approx(2, abs=0.01)
+
+
+def test_rejects_non_positive_rates(monkeypatch):
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+    monkeypatch.setenv('FLIGHT_SEARCHER_AMADEUS_RATE', '-1')
+    with pytest.raises(ValueError):
+        rate_setting('FLIGHT_SEARCHER_AMADEUS_RATE', 10)
+    monkeypatch.setenv('FLIGHT_SEARCHER_AMADEUS_RATE', '0.5')
+    assert rate_setting('FLIGHT_SEARCHER_AMADEUS_RATE', 10) == 0.5
@@ -0,0 +1,59 @@
+import json
+import urllib.request
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+
+from replay_server import cassette_key, save_cassette
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_cassette_key_ignores_order_and_volatile_params():
+    assert cassette_key('get', 'h', '/p', 'b=2&a=1&_=123') == cassette_key('GET', 'h', '/p', 'a=1&b=2')
+
+
+def test_replays_seeded_offers(serve, offers_data):
+    base = serve()
+    date = offers_data[0]['itineraries'][0]['segments'][0]['departure']['at'][:10]
+    # Parameters in another order than they were seeded in
+    query = urlencode({'adults': 1, 'currencyCode': 'USD', 'departureDate': date, 'destinationLocationCode': 'JFK', 'originLocationCode': 'SEA'})
+    status, body = get(f"{base}/v2/shopping/flight-offers?{query}")
+    assert status == 200
+    assert body['data'] == offers_data
+
+
+def test_replays_direct_destinations(serve, destinations_data):
+    status, body = get(f"{serve()}/v1/airport/direct-destinations?departureAirportCode=SEA")
+    assert status == 200
+    assert body['meta']['count'] == len(destinations_data)
+
+
+def test_token_and_missing_cassette(serve):
+    base = serve()
+    request = urllib.request.Request(f"{base}/v1/security/oauth2/token", data=b'grant_type=client_credentials', method='POST')
+    with urllib.request.urlopen(request, timeout=5) as response:
+        assert json.loads(response.read())['access_token'] == 'replay-token'
+    status, body = get(f"{base}/v1/airport/direct-destinations?departureAirportCode=XXX")
+    assert status == 404
+    assert 'XXX' in body['errors'][0]['detail']
+
+
+def test_routes_by_host_segment(serve, cassettes):
+    save_cassette('GET', 'data-cloud.flightradar24.com', '/zones/fcgi/feed.js', {'bounds': '1,2,3,4'}, 200,
+                  json.dumps({'full_count': 0}), cassette_dir=str(cassettes))
+    status, body = get(f"{serve()}/data-cloud.flightradar24.com/zones/fcgi/feed.js?bounds=1,2,3,4")
+    assert status == 200
+    assert body == {'full_count': 0}
+
+
+def test_rate_limit_answers_429(serve):
+    base = serve(rate_limit=1)
+    statuses = [get(f"{base}/v1/airport/direct-destinations?departureAirportCode=SEA")[0] for _ in range(3)]
+    assert statuses[0] == 200
+    assert 429 in statuses[1:]
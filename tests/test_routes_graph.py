@@ -0,0 +1,54 @@
+import pytest
+
+from routes_graph import RouteGraph, haversine_km, connection_rows, legs_to_price
+
+SEA = (47.4502, -122.3088)
+
+
+@pytest.fixture
+def graph(destinations_data):
+    graph = RouteGraph(path=None)
+    graph.add_routes('SEA', destinations_data, SEA)
+    return graph
+
+
+def test_haversine():
+    assert haversine_km((0, 0), (0, 0)) == 0
+    assert round(haversine_km((0, 0), (0, 1))) == 111
+
+
+def test_add_routes_from_fixture(graph, destinations_data):
+    codes = {place['iataCode'] for place in destinations_data} - {'SEA'}
+    assert graph.neighbors('SEA') == codes
+    # Unfetched airports are assumed to fly back to the airports seen flying into them
+    assert 'SEA' in graph.neighbors('ABQ')
+    assert graph.add_routes('SEA', destinations_data, SEA) is False
+
+
+def test_find_connections_via_seattle(graph):
+    routes = graph.find_connections('ABQ', 'ANC', k=3, max_stops=1, max_detour=3)
+    assert routes
+    assert routes[0][1] == ['ABQ', 'SEA', 'ANC']
+    assert [distance for distance, _ in routes] == sorted(distance for distance, _ in routes)
+
+
+def test_find_connections_honours_max_stops(graph):
+    assert graph.find_connections('ABQ', 'ANC', max_stops=0) == []
+    assert graph.find_connections('SEA', 'SEA') == []
+    assert graph.find_connections('SEA', 'XXX') == []
+
+
+def test_save_and_load(tmp_path, destinations_data):
+    path = str(tmp_path / 'graph.json')
+    graph = RouteGraph(path=path)
+    graph.add_routes('SEA', destinations_data, SEA)
+    graph.save()
+    loaded = RouteGraph(path=path)
+    assert loaded.edges == graph.edges
+    assert loaded.coords['SEA'] == SEA
+
+
+def test_rows_and_legs():
+    routes = [(1000.0, ['ABQ', 'SEA', 'ANC']), (1200.0, ['ABQ', 'DEN', 'ANC'])]
+    assert connection_rows(routes, direct_km=800.0)[0] == ['ABQ - SEA - ANC', 1, 1000, '25%']
+    assert legs_to_price(routes) == [('ABQ', 'SEA'), ('SEA', 'ANC'), ('ABQ', 'DEN'), ('DEN', 'ANC')]
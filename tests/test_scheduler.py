@@ -0,0 +1,191 @@
+import asyncio
+
+import pytest
+
+import scheduler
+from ratelimit import TokenBucket
+from scheduler import Provider, INTERACTIVE, BACKGROUND, CircuitOpenError, OverloadedError
+
+
+class FakeClock:
+    """
+    Stands in for the time module in scheduler: sleeping advances the clock instantly.
+    """
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeBucket:
+    rate = 10.0
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        return 0.0
+
+
+class UpstreamError(Exception):
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Failing:
+    """
+    Callable raising the given errors in turn, then returning "ok".
+    """
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler, 'time', clock)
+    return clock
+
+
+def test_429_pauses_provider_for_retry_after(clock):
+    provider = Provider('test', FakeBucket())
+    fn = Failing(UpstreamError(429, retry_after=2))
+    assert provider.call('test', fn) == 'ok'
+    assert fn.calls == 2
+    assert clock.sleeps == [2.0]
+    assert provider.stats['retries'] == 1
+    assert provider.stats['rate_limited'] == 1
+    assert provider.info()['paused_seconds'] == 0
+
+
+def test_429_pause_holds_other_callers(clock):
+    provider = Provider('test', FakeBucket())
+    # Another caller got the 429 and is backing off
+    assert provider._backoff(UpstreamError(429, retry_after=3), 0) == 3
+    start = clock.now
+    assert provider.call('test', Failing()) == 'ok'
+    assert clock.now - start == pytest.approx(3)
+
+
+def test_client_errors_are_not_retried(clock):
+    provider = Provider('test', FakeBucket(), failure_threshold=1)
+    fn = Failing(UpstreamError(400))
+    with pytest.raises(UpstreamError):
+        provider.call('test', fn)
+    assert fn.calls == 1
+    assert provider.info()['circuit_open'] is False
+
+
+def test_circuit_opens_after_threshold(clock):
+    provider = Provider('test', FakeBucket(), max_retries=0, failure_threshold=3, cooldown=30)
+    for _ in range(3):
+        with pytest.raises(UpstreamError):
+            provider.call('test', Failing(UpstreamError(503)))
+    fn = Failing()
+    with pytest.raises(CircuitOpenError):
+        provider.call('test', fn)
+    assert fn.calls == 0
+    assert provider.stats['circuit_opens'] == 1
+
+
+def test_half_open_circuit_lets_one_probe_through(clock):
+    provider = Provider('test', FakeBucket(), max_retries=0, failure_threshold=1, cooldown=30)
+    with pytest.raises(UpstreamError):
+        provider.call('test', Failing(UpstreamError(503)))
+    clock.now += 31
+
+    def probe():
+        # A second caller while the probe is in flight is still refused
+        with pytest.raises(CircuitOpenError):
+            provider.call('test', Failing())
+        return 'ok'
+
+    assert provider.call('test', probe) == 'ok'
+    assert provider.info()['circuit_open'] is False
+    assert provider.call('test', Failing()) == 'ok'
+
+
+def test_failed_probe_reopens_circuit(clock):
+    provider = Provider('test', FakeBucket(), max_retries=0, failure_threshold=1, cooldown=30)
+    with pytest.raises(UpstreamError):
+        provider.call('test', Failing(UpstreamError(503)))
+    clock.now += 31
+    with pytest.raises(UpstreamError):
+        provider.call('test', Failing(UpstreamError(503)))
+    with pytest.raises(CircuitOpenError):
+        provider.call('test', Failing())
+    assert provider.stats['circuit_opens'] == 2
+
+
+def test_background_refused_when_queue_is_full(clock):
+    provider = Provider('test', FakeBucket(), max_background_queue=2)
+    provider._enqueue(BACKGROUND, 2)
+    fn = Failing()
+    with pytest.raises(OverloadedError):
+        provider.call('test', fn, BACKGROUND)
+    assert fn.calls == 0
+    assert provider.call('test', fn, INTERACTIVE) == 'ok'
+    assert provider.stats['rejected'] == 1
+
+
+def test_background_yields_to_interactive():
+    provider = Provider('test', TokenBucket(rate=50, capacity=1))
+    order = []
+
+    async def run(name, priority):
+        async def fn():
+            order.append(name)
+        await provider.call_async('test', fn, priority)
+
+    async def main():
+        tasks = [asyncio.create_task(run(f'background-{i}', BACKGROUND)) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(run(f'interactive-{i}', INTERACTIVE)) for i in range(3)]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    # The first background call takes the only token; every interactive call is served before the rest
+    assert order[0] == 'background-0'
+    assert sorted(order[1:4]) == ['interactive-0', 'interactive-1', 'interactive-2']
+
+
+def test_is_transient():
+    assert scheduler.is_transient(UpstreamError(429))
+    assert scheduler.is_transient(UpstreamError(502))
+    assert not scheduler.is_transient(UpstreamError(404))
+    assert scheduler.is_transient(ConnectionResetError())
+    assert scheduler.retry_after(UpstreamError(429, retry_after='5')) == 5.0
+
+
+def test_only_network_failures_are_transient():
+    requests = pytest.importorskip('requests')
+    assert scheduler.is_transient(TimeoutError())
+    assert scheduler.is_transient(requests.ConnectionError())
+    assert scheduler.is_transient(requests.Timeout())
+    # An HTML error page instead of JSON, or a local file error, will not go away on a retry
+    assert not scheduler.is_transient(requests.JSONDecodeError('Expecting value', '<html>', 0))
+    assert not scheduler.is_transient(FileNotFoundError())
+
+
+def test_decode_errors_do_not_open_the_circuit(clock):
+    provider = Provider('test', FakeBucket(), failure_threshold=1)
+    fn = Failing(ValueError('not JSON'))
+    with pytest.raises(ValueError):
+        provider.call('test', fn)
+    assert fn.calls == 1
+    assert provider.info()['circuit_open'] is False
@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+
+import fr24
+import search
+import session
+from session import SessionStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(session, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_least_recently_used_session_is_evicted(clock):
+    store = SessionStore()
+    for index in range(256):
+        store.get(f"s{index}")['index'] = index
+        clock.now += 1
+    # Using s0 again makes s1 the least recently used session
+    assert store.get('s0') == {'index': 0}
+    store.get('s256')
+    assert len(store) == 256
+    assert store.evictions == 1
+    assert store.get('s1') == {}
+    assert store.get('s2') == {}
+    assert store.get('s0') == {'index': 0}
+
+
+def test_idle_sessions_expire_after_30_minutes(clock):
+    store = SessionStore()
+    store.get('idle')['offers'] = ['offer']
+    store.get('active')
+    clock.now += 20 * 60
+    store.get('active')
+    clock.now += 10 * 60
+    # Exactly 30 minutes idle is still kept
+    assert store.get('idle') == {'offers': ['offer']}
+    clock.now += 30 * 60 + 1
+    assert store.get('active') == {}
+    assert store.get('idle') == {}
+    assert store.evictions == 2
+
+
+def test_sessions_keep_their_own_results(clock, offers_data, monkeypatch):
+    store = SessionStore()
+    first, second = store.get('first'), store.get('second')
+    search.offer_results(offers_data, testing=True, session=first)
+    search.offer_results(offers_data[:1], testing=True, session=second)
+    assert first['offer_table'] is not second['offer_table']
+    assert len(first['offer_table'].rows()) > len(second['offer_table'].rows())
+
+    monkeypatch.setattr(fr24, 'airport_cache', fr24.TTLCache('airport_details', ttl=360))
+    monkeypatch.setattr(fr24, '_fetch_airport_details', lambda code, priority: {'code': code})
+    fr24.get_airport_details('SEA', session=first)
+    fr24.get_airport_details('JFK', session=second)
+    assert (first['airport_details'], second['airport_details']) == ({'code': 'SEA'}, {'code': 'JFK'})
+    assert store.get('first') is first
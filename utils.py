@@ -1,73 +1,249 @@
-import gradio as gr
-from folium import Map, Marker
-from datetime import datetime
-from pandas import Timedelta
-
-def render_title(title: str = "Flight Searcher"):
-        return gr.HTML(f"""
-        <link href="https://fonts.googleapis.com/css2?family=Ubuntu&display=swap" rel="stylesheet">
-        <h1 style = "text-align:center;
-            font-family: 'Ubuntu',
-            sans-serif;
-            font-weight: 500;
-            font-style: italic;
-            font-size: 3em;">
-            {title}
-        </h1>
-        """)
-
-def select(df, data: gr.SelectData):
-    row = df.iloc[data.index[0], :]
-    m = Map(location=[float(row['Latitude']), float(row['Longitude'])], zoom_start=6, tiles="CartoDB positron")
-    Marker([float(row['Latitude']), float(row['Longitude'])], popup=row.get('Name', str(row['Latitude']) + ',' + str(row['Longitude']))).add_to(m)
-    return m
-
-def create_airport_map(rows):
-    m = Map(location=[0, 0], zoom_start=1, tiles="CartoDB positron")
-    for _, row in rows.iterrows():
-        try:
-            lat = float(row['Latitude'])
-            lon = float(row['Longitude'])
-            name = row['Name'] + ' ' + row['IATA Code']
-            Marker([lat, lon], popup=name).add_to(m)
-        except (ValueError, TypeError, KeyError):
-            continue
-    return m
-
-def save_to_csv(df, filename: str):
-    """
-    Save DataFrame to CSV file.
-    df: DataFrame to save
-    filename: Name of the file to save as
-    """
-
-    df.to_csv(filename, index=False)
-    return f"Data saved to {filename}"
-
-def save_to_json(data, filename: str):
-    """
-    Save a Python object (list, dict, etc.) to a JSON file.
-    data: The object to save (list, dict, etc.)
-    filename: Name of the file to save as
-    """
-    import json
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    return f"Data saved to {filename}"
-
-def convert_time_format(time_str: str, from_format: str = "%Y-%m-%dT%H:%M:%S", to_format: str = "%m-%d-%Y %I:%M%p"):
-    """
-    Convert time string from one format to another.
-    time_str: Time string to convert
-    from_format: Current format of the time string
-    to_format: Desired format of the time string
-    """
-    try:
-        dt = datetime.strptime(time_str, from_format)
-        return dt.strftime(to_format)
-    except ValueError as e:
-        return f"Error converting time: {e}"
-    
-def duration_to_string(duration: str) -> str:
-    dt = Timedelta(duration)
-    return str(dt).replace("0 days ", "")
\ No newline at end of file
+import re
+import html
+import numpy as np
+from datetime import datetime
+from functools import lru_cache
+import metrics
+
+# folium and pandas are imported by the functions that need them: parsing and formatting run in scripts
+# and workers that never render a map, and they should not pay for importing either
+
+# Runs in the browser: flies the already rendered airport map to the selected row and highlights it
+PAN_TO_SELECTION_JS = """
+(point) => {
+    const frame = document.querySelector('#airport_map iframe');
+    const win = frame && frame.contentWindow;
+    if (!point || !win || !win.L) return [];
+    const map = Object.keys(win).filter((key) => key.startsWith('map_')).map((key) => win[key]).find((value) => value instanceof win.L.Map);
+    if (!map) return [];
+    if (win.selectedRoute) map.removeLayer(win.selectedRoute);
+    let lon = point.lon;
+    const center = map.getCenter().lng;
+    while (lon - center > 180) lon -= 360;
+    while (lon - center < -180) lon += 360;
+    win.selectedRoute = win.L.circleMarker([point.lat, lon], {radius: 14, color: '#1f6feb', weight: 3, fill: false}).addTo(map).bindPopup(point.name).openPopup();
+    map.flyTo([point.lat, lon], Math.max(map.getZoom(), 6));
+    return [];
+}
+"""
+
+# Builds one marker per [lat, lon, popup, color] row; a null color keeps the default marker
+MARKER_CALLBACK = """
+var callback = function (row) {
+    var options = row[3] ? {icon: L.AwesomeMarkers.icon({icon: 'plane', markerColor: row[3], prefix: 'glyphicon'})} : {};
+    return L.marker(new L.LatLng(row[0], row[1]), options).bindPopup(row[2]);
+};
+"""
+
+def route_line_style(feature):
+    return {'color': '#3366cc', 'weight': 1, 'opacity': 0.5}
+
+@metrics.timed('map.great_circles')
+def great_circle_paths(origin_lat: float, origin_lon: float, lats, lons, points: int = 16):
+    """
+    Interpolate great-circle arcs from one origin to many destinations at once.
+    Returns an array of shape (destinations, points, 2) of [lat, lon] pairs; longitudes are unwrapped
+    along each arc so lines crossing the antimeridian stay continuous.
+    """
+    phi1, lam1 = np.radians(origin_lat), np.radians(origin_lon)
+    phi2, lam2 = np.radians(np.asarray(lats, dtype=np.float64)), np.radians(np.asarray(lons, dtype=np.float64))
+    a = np.array([np.cos(phi1) * np.cos(lam1), np.cos(phi1) * np.sin(lam1), np.sin(phi1)])
+    b = np.stack([np.cos(phi2) * np.cos(lam2), np.cos(phi2) * np.sin(lam2), np.sin(phi2)], axis=-1)
+    omega = np.arccos(np.clip(b @ a, -1.0, 1.0))[:, None]
+    t = np.linspace(0.0, 1.0, points)[None, :]
+    sin_omega = np.sin(omega)
+    degenerate = sin_omega < 1e-12
+    safe = np.where(degenerate, 1.0, sin_omega)
+    w1 = np.where(degenerate, 1 - t, np.sin((1 - t) * omega) / safe)
+    w2 = np.where(degenerate, t, np.sin(t * omega) / safe)
+    xyz = w1[..., None] * a + w2[..., None] * b[:, None, :]
+    lat = np.degrees(np.arctan2(xyz[..., 2], np.hypot(xyz[..., 0], xyz[..., 1])))
+    lon = np.degrees(np.unwrap(np.arctan2(xyz[..., 1], xyz[..., 0]), axis=1))
+    return np.stack([lat, lon], axis=-1)
+
+@metrics.timed('map.airport_routes')
+def create_airport_map(rows, origin=None):
+    """
+    Create a map with one clustered marker per airport row.
+    If rows has a "Price" column (e.g. "123.45 USD"), markers are colored by price:
+    green for the cheapest third, orange for the middle, red for the most expensive and gray when unpriced.
+    origin: Optional (latitude, longitude, label) of the departure airport; adds a marker for it and
+    great-circle lines to every destination
+    """
+    from folium import Map, Marker, GeoJson
+    from folium.plugins import FastMarkerCluster
+    from pandas import to_numeric
+    lats = to_numeric(rows['Latitude'], errors='coerce')
+    lons = to_numeric(rows['Longitude'], errors='coerce')
+    valid = (lats.notna() & lons.notna() & rows['Name'].map(lambda value: isinstance(value, str)) & rows['IATA Code'].map(lambda value: isinstance(value, str))).to_numpy()
+    lats, lons = lats.to_numpy(dtype=np.float64)[valid], lons.to_numpy(dtype=np.float64)[valid]
+    names = (rows['Name'][valid] + ' ' + rows['IATA Code'][valid]).to_numpy(dtype=object)
+    colors = np.full(len(names), None, dtype=object)
+
+    if 'Price' in rows.columns:
+        prices = price_values(rows['Price'])
+        priced = prices.notna().to_numpy()[valid]
+        colors[:] = 'gray'
+        if priced.any():
+            low, high = prices.quantile(1 / 3), prices.quantile(2 / 3)
+            values = prices.to_numpy(dtype=np.float64)[valid]
+            colors[priced] = np.where(values[priced] <= low, 'green', np.where(values[priced] <= high, 'orange', 'red'))
+            names[priced] = names[priced] + ' ' + rows['Price'][valid].to_numpy(dtype=object)[priced]
+
+    if origin is None:
+        m = Map(location=[0, 0], zoom_start=1, tiles="CartoDB positron")
+    else:
+        origin_lat, origin_lon, label = origin
+        m = Map(location=[origin_lat, origin_lon], zoom_start=2, tiles="CartoDB positron")
+        Marker([origin_lat, origin_lon], popup=html.escape(label)).add_to(m)
+        if len(lats):
+            paths = great_circle_paths(origin_lat, origin_lon, lats, lons)
+            # Place the markers at the (unwrapped) end of their route line
+            lons = paths[:, -1, 1]
+            # All route lines go into one GeoJSON feature ([lon, lat] order), rounded to about 1 km
+            lines = {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'MultiLineString', 'coordinates': np.round(paths[..., ::-1], 2).tolist()}}
+            GeoJson(lines, style_function=route_line_style, control=False).add_to(m)
+
+    data = [[lat, lon, html.escape(name), color] for lat, lon, name, color in zip(np.round(lats, 5).tolist(), np.round(lons, 5).tolist(), names, colors)]
+    FastMarkerCluster(data, callback=MARKER_CALLBACK, disableClusteringAtZoom=5).add_to(m)
+    return m
+
+def price_values(prices):
+    """
+    Parse a column of price strings such as "123.45 USD" into floats (NaN where missing).
+    """
+    from pandas import to_numeric
+    return to_numeric(prices.astype(str).str.split(' ').str[0], errors='coerce')
+
+def save_to_csv(df, filename: str):
+    """
+    Save DataFrame to CSV file.
+    df: DataFrame to save
+    filename: Name of the file to save as
+    """
+
+    df.to_csv(filename, index=False)
+    return f"Data saved to {filename}"
+
+def save_to_json(data, filename: str):
+    """
+    Save a Python object (list, dict, etc.) to a JSON file.
+    data: The object to save (list, dict, etc.)
+    filename: Name of the file to save as
+    """
+    import json
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return f"Data saved to {filename}"
+
+def convert_time_format(time_str: str, from_format: str = "%Y-%m-%dT%H:%M:%S", to_format: str = "%m-%d-%Y %I:%M%p"):
+    """
+    Convert time string from one format to another.
+    time_str: Time string to convert
+    from_format: Current format of the time string
+    to_format: Desired format of the time string
+    """
+    try:
+        dt = datetime.strptime(time_str, from_format)
+        return dt.strftime(to_format)
+    except ValueError as e:
+        return f"Error converting time: {e}"
+    
+def duration_to_string(duration: str) -> str:
+    from pandas import Timedelta
+    dt = Timedelta(duration)
+    return str(dt).replace("0 days ", "")
+
+ISO_DURATION = re.compile(r'^P(?:(\d+)D)?(?:T(?:(\d{1,2})H)?(?:(\d{1,2})M)?(?:(\d{1,2}(?:\.\d+)?)S)?)?$')
+# The same, one whole-second duration (or ISO time) per line, for parsing a joined column in one pass
+ISO_DURATION_LINE = re.compile(r'^P(?:(\d+)D)?(?:T(?:(\d{1,2})H)?(?:(\d{1,2})M)?(?:(\d{1,2})S)?)?$', re.M)
+ISO_TIME_LINE = re.compile(r'^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d$', re.M)
+ISO_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+DURATION_UNITS = np.array([86400, 3600, 60, 1], dtype=np.int64)
+
+def parse_iso_duration(duration: str) -> float:
+    """
+    Convert an ISO-8601 duration such as "PT3H55M" or "P1DT2H" to seconds.
+    """
+    match = ISO_DURATION.match(duration)
+    if not match:
+        from pandas import Timedelta
+        return Timedelta(duration).total_seconds()
+    days, hours, minutes, seconds = match.groups()
+    return int(days or 0) * 86400 + int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds or 0)
+
+@lru_cache(maxsize=4096)
+def _cached_time_format(time_str: str, from_format: str, to_format: str) -> str:
+    return convert_time_format(time_str, from_format, to_format)
+
+@lru_cache(maxsize=4096)
+def _cached_duration_string(duration: str) -> str:
+    match = ISO_DURATION.match(duration)
+    if not match or (match.group(4) and '.' in match.group(4)):
+        return duration_to_string(duration)
+    days, remainder = divmod(int(parse_iso_duration(duration)), 86400)
+    hours, remainder = divmod(remainder, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    # Same text as str(Timedelta), including the "0 days " replacement
+    return f"{days} days {hours:02d}:{minutes:02d}:{seconds:02d}".replace("0 days ", "")
+
+def _iso_times(values):
+    # numpy parses the column in C, but also accepts forms strptime rejects (dates alone, a space
+    # instead of "T"), so the whole column is checked against the exact format first
+    if len(ISO_TIME_LINE.findall('\n'.join(values))) != len(values):
+        return None
+    try:
+        return values.astype('datetime64[s]')
+    except ValueError:
+        return None
+
+def _whole_seconds(values):
+    # One regex pass over the joined column; None when a value is not a whole-second ISO-8601 duration
+    parts = ISO_DURATION_LINE.findall('\n'.join(values))
+    if len(parts) != len(values):
+        return None
+    fields = np.array(parts, dtype=str).reshape(len(values), 4)
+    return np.where(fields == '', '0', fields).astype(np.int64) @ DURATION_UNITS
+
+def convert_time_formats(time_strs, from_format: str = ISO_TIME_FORMAT, to_format: str = "%m-%d-%Y %I:%M%p") -> list:
+    """
+    Batch version of convert_time_format for a whole column of time strings.
+    Distinct values are converted once, since times repeat heavily across offers; ISO times are parsed
+    as one numpy column instead of one strptime call each.
+    """
+    unique, inverse = np.unique(np.asarray(time_strs, dtype=str), return_inverse=True)
+    parsed = _iso_times(unique) if from_format == ISO_TIME_FORMAT else None
+    if parsed is None:
+        converted = [_cached_time_format(value, from_format, to_format) for value in unique.tolist()]
+    else:
+        converted = [value.strftime(to_format) for value in parsed.astype(object)]
+    return np.array(converted, dtype=object)[inverse.ravel()].tolist()
+
+def iso_durations_to_seconds(durations) -> np.ndarray:
+    """
+    Column version of parse_iso_duration: the seconds of each ISO-8601 duration, as an array.
+    """
+    unique, inverse = np.unique(np.asarray(durations, dtype=str), return_inverse=True)
+    seconds = _whole_seconds(unique)
+    if seconds is None:
+        seconds = np.array([parse_iso_duration(value) for value in unique.tolist()], dtype=np.float64)
+    return seconds[inverse.ravel()]
+
+def durations_to_strings(durations) -> list:
+    """
+    Batch version of duration_to_string for a whole column of ISO-8601 durations.
+    Distinct values are parsed in one regex pass over the column and formatted once, without building
+    pandas Timedeltas.
+    """
+    unique, inverse = np.unique(np.asarray(durations, dtype=str), return_inverse=True)
+    seconds = _whole_seconds(unique)
+    if seconds is None:
+        converted = [_cached_duration_string(value) for value in unique.tolist()]
+    else:
+        days, remainder = np.divmod(seconds, 86400)
+        hours, remainder = np.divmod(remainder, 3600)
+        minutes, seconds = np.divmod(remainder, 60)
+        # Same text as str(Timedelta), including the "0 days " replacement
+        converted = [f"{d} days {h:02d}:{m:02d}:{s:02d}".replace("0 days ", "")
+                     for d, h, m, s in zip(days.tolist(), hours.tolist(), minutes.tolist(), seconds.tolist())]
+    return np.array(converted, dtype=object)[inverse.ravel()].tolist()
\ No newline at end of file